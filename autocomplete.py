@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+QUERY AUTOCOMPLETE
+
+In-memory prefix trie of normalized queries from search_history, weighted
+by how often they were searched. Every node keeps its AUTOCOMPLETE_TOP_K
+heaviest completions, so a lookup is a walk down the prefix and nothing
+more. Searches are added as they are logged; the trie is built from
+Supabase once at startup and never queried from it afterwards.
+
+Also answers "did you mean": the most searched known query within a small
+edit distance of an unknown one. Queries searched AUTOCOMPLETE_MIN_WEIGHT
+times are put into two deletion indexes (every way to drop up to two
+letters from their first and from their last few characters); a query
+within two edits shares a variant with both, so a lookup checks the
+handful of queries found in both instead of walking the trie.
+
+The trie is filled from an executor thread at startup while handlers read
+it, so reads and writes share one lock (each holds it for microseconds).
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from query_normalizer import normalize_query
+from functions import get_search_history, split_logged_query
+from config import AUTOCOMPLETE_TOP_K, AUTOCOMPLETE_HISTORY_DAYS, AUTOCOMPLETE_MIN_WEIGHT
+
+# "Did you mean" finds queries up to this many edits away ...
+_MAX_EDITS = 2
+# ... indexed by deletions from this many leading and trailing characters
+_INDEX_CHARS = 7
+
+def _deletions(text: str, edits: int) -> set:
+    """text with every choice of up to edits characters removed"""
+    found = {text}
+    frontier = found
+    for _ in range(edits):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance of a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # A shared start and end don't change the distance - usually only the
+    # few characters around a typo are left
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+
+    # Only cells within limit of the diagonal can stay within limit
+    over = limit + 1
+    prev = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        row = [over] * (len(b) + 1)
+        row[0] = i if i <= limit else over
+        ca = a[i - 1]
+        for j in range(low, high + 1):
+            row[j] = min(row[j - 1] + 1, prev[j] + 1, prev[j - 1] + (ca != b[j - 1]), over)
+        if min(row[low - 1:high + 1]) > limit:
+            return over
+        prev = row
+    return prev[-1]
+
+class _Node:
+    __slots__ = ("children", "weight", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.weight = 0      # > 0 if a query ends here
+        self.top = []        # [(weight, query)], heaviest first
+
+class QueryTrie:
+    """Frequency-weighted prefix trie over normalized queries"""
+
+    def __init__(self, top_k: int = AUTOCOMPLETE_TOP_K):
+        self.top_k = top_k
+        self.root = _Node()
+        self.size = 0  # distinct queries
+        # normalized query -> {spelling: count}; suggestions show the most
+        # common spelling ("ps5", not the normalized "ps 5")
+        self._spellings = {}
+        # deletion variant of the first / last _INDEX_CHARS characters ->
+        # queries searched at least AUTOCOMPLETE_MIN_WEIGHT times
+        self._heads = {}
+        self._tails = {}
+        self._lock = threading.Lock()
+
+    def add(self, query: str, weight: int = 1):
+        """Count a search (weights only grow, which keeps every node's top list exact)"""
+        spelling = " ".join(query.lower().split())
+        query = normalize_query(query)
+        if not query:
+            return
+        with self._lock:
+            spellings = self._spellings.setdefault(query, {})
+            spellings[spelling] = spellings.get(spelling, 0) + weight
+            path = [self.root]
+            node = self.root
+            for ch in query:
+                child = node.children.get(ch)
+                if child is None:
+                    child = node.children[ch] = _Node()
+                node = child
+                path.append(node)
+            if not node.weight:
+                self.size += 1
+            node.weight += weight
+            for n in path:
+                self._promote(n, query, node.weight)
+            if node.weight >= AUTOCOMPLETE_MIN_WEIGHT > node.weight - weight:
+                for variant in _deletions(query[:_INDEX_CHARS], _MAX_EDITS):
+                    self._heads.setdefault(variant, set()).add(query)
+                for variant in _deletions(query[-_INDEX_CHARS:], _MAX_EDITS):
+                    self._tails.setdefault(variant, set()).add(query)
+
+    def _promote(self, node, query: str, weight: int):
+        top = node.top
+        for i, (_, q) in enumerate(top):
+            if q == query:
+                del top[i]
+                break
+        else:
+            if len(top) >= self.top_k and weight <= top[-1][0]:
+                return
+        i = 0
+        while i < len(top) and top[i][0] >= weight:
+            i += 1
+        top.insert(i, (weight, query))
+        del top[self.top_k:]
+
+    def display(self, query: str) -> str:
+        """Most common spelling of a normalized query"""
+        spellings = self._spellings.get(query)
+        return max(spellings, key=spellings.get) if spellings else query
+
+    def weight(self, query: str) -> int:
+        text = normalize_query(query)
+        with self._lock:
+            node = self._find(text)
+            return node.weight if node else 0
+
+    def _find(self, text: str):
+        node = self.root
+        for ch in text:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def complete(self, prefix: str, limit: int = None) -> list:
+        """Most searched queries starting with prefix (normalized like queries)"""
+        text = normalize_query(prefix)
+        if text and prefix[-1:].isspace():
+            # "iphone " should complete to "iphone 15", not "iphones"
+            text += " "
+        with self._lock:
+            node = self._find(text)
+            if node is None:
+                return []
+            return [self.display(q) for _, q in node.top[:limit or self.top_k]]
+
+    def did_you_mean(self, query: str, max_distance: int = None):
+        """
+        Most searched known query within max_distance edits of an unknown
+        or rarely searched one, or None
+        """
+        text = normalize_query(query)
+        if not text:
+            return None
+        if max_distance is None:
+            max_distance = 1 if len(text) <= 5 else 2
+        max_distance = min(max_distance, _MAX_EDITS)
+
+        with self._lock:
+            node = self._find(text)
+            own = node.weight if node else 0
+            if own >= AUTOCOMPLETE_MIN_WEIGHT:
+                return None
+
+            # Queries within max_distance edits share a deletion variant of
+            # their first and of their last characters; those are then checked in full
+            heads = set()
+            for variant in _deletions(text[:_INDEX_CHARS], max_distance):
+                heads |= self._heads.get(variant, set())
+            candidates = set()
+            if heads:
+                for variant in _deletions(text[-_INDEX_CHARS:], max_distance):
+                    candidates |= heads.intersection(self._tails.get(variant, ()))
+
+            best = None  # (distance, -weight, query)
+            for candidate in candidates:
+                weight = self._find(candidate).weight
+                if candidate == text or weight <= own:
+                    continue
+                distance = _edit_distance(text, candidate, max_distance)
+                if distance <= max_distance and (best is None or (distance, -weight, candidate) < best):
+                    best = (distance, -weight, candidate)
+
+            return self.display(best[2]) if best else None
+
+# ============================================================================
+# SHARED TRIE
+# ============================================================================
+
+_trie = QueryTrie()
+
+def add_query(query: str):
+    """Count a logged search"""
+    _trie.add(query)
+
+def complete(prefix: str, limit: int = None) -> list:
+    return _trie.complete(prefix, limit)
+
+def did_you_mean(query: str):
+    return _trie.did_you_mean(query)
+
+def popular(limit: int = 5) -> list:
+    """Most searched queries overall"""
+    return _trie.complete("", limit)
+
+def load_history(days: int = AUTOCOMPLETE_HISTORY_DAYS) -> int:
+    """Fill the trie from search_history (run once at startup). Returns rows read."""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    rows = 0
+    after_id = 0
+    while True:
+        page = get_search_history(since, after_id)
+        if not page:
+            break
+        for row in page:
+            _trie.add(split_logged_query(row["query"])[0])
+        rows += len(page)
+        after_id = page[-1]["id"]
+    logging.info(f"[Autocomplete] Loaded {rows} searches ({_trie.size} distinct queries)")
+    return rows
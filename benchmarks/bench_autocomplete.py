@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AUTOCOMPLETE BENCHMARK
+
+Builds the autocomplete trie from search_history and times completions
+for every prefix of every distinct query, plus "did you mean" lookups.
+
+    python benchmarks/bench_autocomplete.py              # from Supabase
+    python benchmarks/bench_autocomplete.py --csv export.csv
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autocomplete import QueryTrie  # noqa: E402
+from functions import split_logged_query  # noqa: E402
+from bench_query_normalization import load_from_csv, load_from_supabase  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Autocomplete trie build and lookup times")
+    parser.add_argument("--csv", help="search_history export with a query column")
+    args = parser.parse_args()
+
+    rows = load_from_csv(args.csv) if args.csv else load_from_supabase()
+    queries = [split_logged_query(r["query"])[0] for r in rows]
+
+    trie = QueryTrie()
+    start = time.perf_counter()
+    for q in queries:
+        trie.add(q)
+    build = time.perf_counter() - start
+    print(f"{len(queries)} searches -> {trie.size} distinct queries, built in {build * 1000:.0f} ms\n")
+
+    distinct = sorted(set(" ".join(q.lower().split()) for q in queries))
+    prefixes = [q[:i] for q in distinct for i in range(1, len(q) + 1)]
+    if not prefixes:
+        sys.exit(0)
+
+    start = time.perf_counter()
+    for p in prefixes:
+        trie.complete(p)
+    elapsed = time.perf_counter() - start
+    print(f"complete     {elapsed / len(prefixes) * 1e6:>8.1f} us/lookup ({len(prefixes)} prefixes)")
+
+    start = time.perf_counter()
+    for q in distinct:
+        trie.did_you_mean(q)
+    elapsed = time.perf_counter() - start
+    print(f"did_you_mean {elapsed / len(distinct) * 1e6:>8.1f} us/lookup ({len(distinct)} queries)")
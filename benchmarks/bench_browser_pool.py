@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BROWSER POOL CHECK
+
+Checks the storefront parsers against fixtures/storefronts (the product
+grid each page builds with JavaScript, compared with expected.json).
+
+With --browser the fixture pages are served from a local HTTP server and
+searched through a real headless browser pool (needs Chrome), which
+checks that the pool waits for the JavaScript grid, reuses warm browsers,
+replaces them after --max-pages pages and keeps the per-page deadline on
+a page that never shows products.
+
+    python benchmarks/bench_browser_pool.py
+    python benchmarks/bench_browser_pool.py --browser [--rounds 5] [--size 2] [--max-pages 4]
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup  # noqa: E402
+import browser_pool  # noqa: E402
+import storefronts  # noqa: E402
+
+PAGES = os.path.join(ROOT, "fixtures", "storefronts")
+
+def load_expected() -> dict:
+    with open(os.path.join(PAGES, "expected.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def summary(results) -> list:
+    return [[r["title"], r["link"], r["price"]] for r in results]
+
+def check(name: str, got, expected) -> bool:
+    if got == expected:
+        return True
+    print(f"FAIL {name}:\n  got      {got}\n  expected {expected}")
+    return False
+
+def offline() -> bool:
+    ok = True
+    for key, expected in load_expected().items():
+        with open(os.path.join(PAGES, f"{key}.html"), encoding="utf-8") as f:
+            page = BeautifulSoup(f.read(), "lxml")
+        # What the page's script puts into the DOM
+        rendered = page.find("template").decode_contents()
+        start = time.perf_counter()
+        results = storefronts.parse_results(key, rendered)
+        elapsed = (time.perf_counter() - start) * 1e3
+        good = check(key, summary(results), expected)
+        ok &= good
+        print(f"{key:<12}{len(results):>3} products  parse {elapsed:>6.2f} ms  {'ok' if good else 'FAIL'}")
+    return ok
+
+class _Handler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def with_browser(rounds: int, size: int, max_pages: int) -> bool:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Handler, directory=PAGES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    expected = load_expected()
+
+    launches = []
+    def counted_launch():
+        launches.append(time.perf_counter())
+        return browser_pool._launch()
+
+    browser_pool.pool = browser_pool.BrowserPool(size=size, max_pages=max_pages, deadline=10, launch=counted_launch)
+    ok = True
+    try:
+        def one(key):
+            start = time.perf_counter()
+            results = storefronts.search(key, "test query", search_url=f"{base}/{key}.html?q={{query}}")
+            return key, time.perf_counter() - start, results
+
+        times = []
+        with ThreadPoolExecutor(max_workers=size * 2) as executor:
+            for r in range(rounds):
+                for key, elapsed, results in executor.map(one, list(expected)):
+                    ok &= check(f"{key} round {r + 1}", summary(results), expected[key])
+                    times.append(elapsed)
+                print(f"round {r + 1}: {', '.join(f'{t:.2f}s' for t in times[-len(expected):])}"
+                      f"  (browsers launched so far: {len(launches)})")
+
+        pages = rounds * len(expected)
+        print(f"\n{pages} pages, {len(launches)} launches "
+              f"(expected about {max(size, -(-pages // max_pages))} with {size} browsers x {max_pages} pages)")
+
+        # A page whose grid never appears must still come back at the deadline
+        start = time.perf_counter()
+        storefronts.search("target", "test query", search_url=f"{base}/expected.json?q={{query}}")
+        elapsed = time.perf_counter() - start
+        print(f"page without products: {elapsed:.1f}s (deadline {browser_pool.pool.deadline}s)")
+        ok &= elapsed < browser_pool.pool.deadline + 2
+    finally:
+        browser_pool.pool.close()
+        server.shutdown()
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storefront parsers and headless browser pool")
+    parser.add_argument("--browser", action="store_true", help="also search the pages through real browsers")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--size", type=int, default=2)
+    parser.add_argument("--max-pages", type=int, default=4)
+    args = parser.parse_args()
+
+    ok = offline()
+    if args.browser:
+        print()
+        ok &= with_browser(args.rounds, args.size, args.max_pages)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CSE PAYLOAD BENCHMARK
+
+Compares the full Custom Search response with the field-projected one
+(CSE_FIELDS) on a recorded payload: bytes on the wire with and without
+gzip, and decode + parse time.
+
+    python benchmarks/bench_cse_payload.py [--runs 2000] [--payload fixtures/cse_response_full.json]
+    python benchmarks/bench_cse_payload.py --live "iphone 15" [--record]
+
+--live spends 2 CSE requests (full and lean) and reports the real wire
+sizes; --record also saves the full response as the new fixture.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from search_script import CSE_URL, _parse_search_items  # noqa: E402
+from config import CSE_FIELDS, CSE_USER_AGENT, GOOGLE_API_KEYS  # noqa: E402
+
+DEFAULT_PAYLOAD = os.path.join(ROOT, "fixtures", "cse_response_full.json")
+FIELDS = ("title", "link", "snippet")
+
+def project(payload: bytes) -> bytes:
+    """What CSE returns for fields=items(title,link,snippet) (Google pretty-prints with 2 spaces)"""
+    doc = json.loads(payload)
+    lean = {"items": [{k: item[k] for k in FIELDS if k in item} for item in doc.get("items", [])]}
+    return json.dumps(lean, indent=2, ensure_ascii=False).encode()
+
+def time_decode(loads, payload: bytes, runs: int) -> float:
+    """Microseconds per decode + _parse_search_items"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        _parse_search_items(loads(payload).get("items", []))
+    return (time.perf_counter() - start) / runs * 1e6
+
+def offline(payload_path: str, runs: int):
+    with open(payload_path, "rb") as f:
+        full = f.read()
+    lean = project(full)
+
+    print(f"payload: {os.path.relpath(payload_path, ROOT)}\n")
+    print(f"{'':<8}{'raw':>10}{'gzip':>10}")
+    for name, body in (("full", full), ("lean", lean)):
+        print(f"{name:<8}{len(body):>9}B{len(gzip.compress(body)):>9}B")
+    print(f"\nwire bytes: {len(full)}B -> {len(gzip.compress(lean))}B "
+          f"({len(gzip.compress(lean)) / len(full) * 100:.1f}% of today's request)\n")
+
+    print(f"decode + parse, {runs} runs")
+    for name, body in (("full", full), ("lean", lean)):
+        print(f"  {name:<6}{time_decode(json.loads, body, runs):>9.1f} us")
+
+def live(query: str, record: bool):
+    import requests
+
+    api = GOOGLE_API_KEYS[0]
+    params = {"key": api["api_key"], "cx": api["search_engine_id"],
+              "q": f"{query} (site:amazon.com OR site:ebay.com)", "num": 10}
+
+    def fetch(extra_params, headers):
+        response = requests.get(CSE_URL, params={**params, **extra_params}, headers=headers,
+                                timeout=15, stream=True)
+        wire = response.raw.read(decode_content=False)
+        body = gzip.decompress(wire) if response.headers.get("Content-Encoding") == "gzip" else wire
+        return response.status_code, len(wire), body
+
+    status, full_wire, full_body = fetch({}, {})
+    print(f"full: HTTP {status}, {full_wire}B on the wire")
+    status, lean_wire, _ = fetch({"fields": CSE_FIELDS},
+                                 {"Accept-Encoding": "gzip", "User-Agent": CSE_USER_AGENT})
+    print(f"lean: HTTP {status}, {lean_wire}B on the wire ({lean_wire / full_wire * 100:.1f}%)")
+
+    if record:
+        with open(DEFAULT_PAYLOAD, "wb") as f:
+            f.write(full_body)
+        print(f"recorded {DEFAULT_PAYLOAD}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full vs field-projected CSE payloads")
+    parser.add_argument("--payload", default=DEFAULT_PAYLOAD)
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--live", metavar="QUERY", help="Measure real responses (spends 2 CSE requests)")
+    parser.add_argument("--record", action="store_true", help="With --live: save the full response as the fixture")
+    args = parser.parse_args()
+
+    if args.live:
+        live(args.live, args.record)
+    else:
+        offline(args.payload, args.runs)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRICE ENRICHMENT CHECK
+
+Runs price_enrichment.extract_price over the product page fixtures and
+compares with fixtures/product_pages/expected.json, timing the parse.
+With --serve the fixtures are also served from a local HTTP server and
+enrich() is run over them end to end (fetch pool, per-domain limit,
+deadline and cache) - with the pages under several product ids to
+exercise the limits, and repeated links to check they are fetched once.
+
+    python benchmarks/bench_price_enrichment.py [--runs 200]
+    python benchmarks/bench_price_enrichment.py --serve [--copies 5]
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import price_enrichment  # noqa: E402
+import price_history  # noqa: E402
+
+PAGES = os.path.join(ROOT, "fixtures", "product_pages")
+
+def load_expected() -> dict:
+    with open(os.path.join(PAGES, "expected.json"), encoding="utf-8") as f:
+        return {name: tuple(value) if value else None for name, value in json.load(f).items()}
+
+def same_price(got, expected) -> bool:
+    if got is None or expected is None:
+        return got == expected
+    return got[0] == expected[0] and abs(got[1] - expected[1]) < 0.005
+
+def offline(runs: int) -> bool:
+    ok = True
+    for name, expected in load_expected().items():
+        with open(os.path.join(PAGES, name), "rb") as f:
+            html = f.read()
+        start = time.perf_counter()
+        for _ in range(runs):
+            got = price_enrichment.extract_price(html)
+        elapsed = (time.perf_counter() - start) / runs * 1e3
+        good = same_price(got, expected)
+        status = "ok" if good else f"FAIL (expected {expected})"
+        ok &= good
+        print(f"{name:<30}{str(got and (got[0], round(got[1], 2))):<24}{elapsed:>7.2f} ms  {status}")
+    return ok
+
+class _SlowHandler(SimpleHTTPRequestHandler):
+    delay = 0.2
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+async def served(copies: int) -> bool:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_SlowHandler, directory=PAGES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    expected = load_expected()
+    # id= makes each copy its own product; the repeated link is the same product
+    products = [
+        {"link": f"{base}/{name}?id={i}", "price": "Check site", "price_value": 999999}
+        for name in expected for i in range(copies) for _ in range(2)
+    ]
+    price_enrichment.fetcher.per_domain = 2
+    # Keep test prices out of the real history
+    history_dir = tempfile.TemporaryDirectory()
+    price_history._history = price_history.PriceHistory(os.path.join(history_dir.name, "prices.bin"))
+    try:
+        start = time.perf_counter()
+        found = await price_enrichment.enrich(products, deadline=30)
+        elapsed = time.perf_counter() - start
+        print(f"\n{len(products)} products ({len(expected)} pages x {copies} ids x 2) -> {found} prices "
+              f"in {elapsed:.2f}s (pages take {_SlowHandler.delay}s, 2 at a time)")
+
+        start = time.perf_counter()
+        again = [dict(p, price="Check site", price_value=999999) for p in products]
+        await price_enrichment.enrich(again)
+        print(f"cached repeat: {(time.perf_counter() - start) * 1e3:.1f} ms")
+    finally:
+        await price_enrichment.fetcher.aclose()
+        server.shutdown()
+        history_dir.cleanup()
+
+    ok = True
+    for product in products:
+        name = product["link"].rsplit("/", 1)[1].split("?")[0]
+        want = expected[name] or ("Check site", 999999)
+        if not same_price((product["price"], product["price_value"]), tuple(want)):
+            print(f"FAIL {name}: {product['price']} (expected {want[0]})")
+            ok = False
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Product page price extraction")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--serve", action="store_true", help="also run enrich() against a local server")
+    parser.add_argument("--copies", type=int, default=5)
+    args = parser.parse_args()
+
+    ok = offline(args.runs)
+    if args.serve:
+        ok &= asyncio.run(served(args.copies))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+QUERY NORMALIZATION HIT-RATE BENCHMARK
+
+Replays search_history in order and counts how many searches could have
+been answered by an earlier search of the same key within the cache
+window - once keyed by the raw text (what .strip() gives us today) and
+once by query_normalizer.query_key(). Known normalizations (model names,
+stop words, transliteration) are checked first.
+
+    python benchmarks/bench_query_normalization.py              # from Supabase
+    python benchmarks/bench_query_normalization.py --csv export.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_normalizer import query_key, normalize_query, tokenize  # noqa: E402
+from functions import split_logged_query  # noqa: E402
+from config import PRODUCT_INDEX_MAX_AGE  # noqa: E402
+
+# query -> normalize_query(query)
+CASES = {
+    "IPHONE15 Pro Max!": "iphone 15 pro max",
+    "айфон 15": "iphone 15",
+    "Samsung Galaxy Tab A8": "samsung galaxy tab a8",
+    "Galaxy A54 5G": "galaxy a54 5 g",
+    "Galaxy Tab S8": "galaxy tab s8",
+    "Samsung SM-A546B": "samsung sm a546b",
+    "MacBook Air M2 256GB": "macbook air m2 256 gb",
+    "a Galaxy A8 for sale": "galaxy a8",
+    "Best Buy gift card": "best buy gift card",
+    "buy ps5 cheap": "buy ps 5",
+    "s23ultra": "s23 ultra",
+    "S23 Ultra": "s23 ultra",
+    "iPhone15ProMax": "iphone 15 pro max",
+    "Galaxy A 8": "galaxy a 8",
+}
+
+# Spellings of one product that must share a query key, and different
+# products that must not
+SAME_KEY = [
+    ("s23ultra", "S23 Ultra"),
+    ("iPhone15ProMax", "iphone 15 pro max"),
+]
+DIFFERENT_KEY = [
+    ("Galaxy Tab A8", "Galaxy Tab S8"),
+    ("Galaxy A 8", "Galaxy 8"),
+]
+
+def check_cases() -> bool:
+    ok = True
+    for query, expected in CASES.items():
+        got = normalize_query(query)
+        if got != expected:
+            print(f"FAIL {query!r}: {got!r} (expected {expected!r})")
+            ok = False
+    for a, b in SAME_KEY:
+        if query_key(a) != query_key(b):
+            print(f"FAIL {a!r} and {b!r} have different keys: {query_key(a)!r}, {query_key(b)!r}")
+            ok = False
+    # Different models must never share a key
+    for a, b in DIFFERENT_KEY:
+        if query_key(a) == query_key(b):
+            print(f"FAIL {a!r} and {b!r} share the query key {query_key(a)!r}")
+            ok = False
+    return ok
+
+def _timestamp(value) -> float:
+    if not value:
+        return 0.0
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def load_from_supabase(page_size: int = 1000) -> list:
+    from supabase_client import supabase
+
+    rows, after_id = [], 0
+    while True:
+        page = supabase.table("search_history").select("id", "query", "created_at") \
+            .gt("id", after_id).order("id").limit(page_size).execute().data
+        if not page:
+            break
+        rows.extend(page)
+        after_id = page[-1]["id"]
+    return rows
+
+def load_from_csv(path: str) -> list:
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def hit_rate(rows, key_fn, window: float) -> float:
+    last_seen = {}
+    hits = 0
+    for row in rows:
+        query, site = split_logged_query(row["query"])
+        key = (site, key_fn(query))
+        ts = _timestamp(row.get("created_at"))
+        previous = last_seen.get(key)
+        if previous is not None and ts - previous <= window:
+            hits += 1
+        else:
+            # A miss goes upstream and refreshes the cache entry
+            last_seen[key] = ts
+    return hits / len(rows) if rows else 0.0
+
+STRATEGIES = {
+    "raw (.strip())": lambda q: q.strip(),
+    "lower + spaces": lambda q: " ".join(q.lower().split()),
+    "normalize_query": normalize_query,
+    "query_key": query_key,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache hit rate of query keys on search_history")
+    parser.add_argument("--csv", help="search_history export with query and created_at columns")
+    parser.add_argument("--window", type=float, default=PRODUCT_INDEX_MAX_AGE,
+                        help="Seconds a cached answer stays usable (default: index max age)")
+    args = parser.parse_args()
+
+    if not check_cases():
+        sys.exit(1)
+    rows = load_from_csv(args.csv) if args.csv else load_from_supabase()
+    rows.sort(key=lambda r: _timestamp(r.get("created_at")))
+    print(f"{len(rows)} searches, window {args.window / 3600:.1f}h\n")
+
+    for name, fn in STRATEGIES.items():
+        print(f"{name:<18}{hit_rate(rows, fn, args.window) * 100:>7.1f}% hits")
+
+    queries = [split_logged_query(r["query"])[0] for r in rows]
+    tokenize.cache_clear()
+    start = time.perf_counter()
+    for q in queries:
+        query_key(q)
+    elapsed = time.perf_counter() - start
+    if queries:
+        print(f"\nquery_key: {elapsed / len(queries) * 1e6:.1f} us/query (cold cache)")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RANKING BENCHMARK
+
+Times ranking.rank over generated result sets of the sizes paging and
+bulk search produce (phones, their accessories and unpriced offers across
+stores), and checks that the "cheapest" filter puts the cheapest actual
+phone first instead of a case.
+
+    python benchmarks/bench_ranking.py [--sizes 10 100 300 1000] [--runs 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ranking  # noqa: E402
+from search_script import filter_results  # noqa: E402
+
+QUERY = "iphone 15 pro 256gb"
+STORES = ["Amazon", "Ebay", "Walmart", "Bestbuy", "Newegg", "Aliexpress", "Umico", "Shop"]
+PRODUCTS = [
+    ("Apple iPhone 15 Pro 256GB Natural Titanium", 900, 1200),
+    ("iPhone 15 Pro 256 GB Blue Titanium Unlocked Renewed", 700, 950),
+    ("Apple iPhone 15 Pro Max 256GB", 1000, 1300),
+]
+ACCESSORIES = [
+    ("Silicone Case for iPhone 15 Pro with MagSafe", 9, 40),
+    ("iPhone 15 Pro Screen Protector 3 Pack", 6, 15),
+    ("USB-C Charger Cable for iPhone 15 Pro", 8, 25),
+]
+
+def generate(n: int, rng: random.Random) -> list:
+    results = []
+    for i in range(n):
+        title, low, high = rng.choice(PRODUCTS if rng.random() < 0.6 else ACCESSORIES)
+        price = round(rng.uniform(low, high), 2)
+        priced = rng.random() > 0.1
+        results.append({
+            "site": rng.choice(STORES),
+            "title": f"{title} #{i % 40}",
+            "link": f"https://example.com/p/{i}",
+            "price": f"${price:.2f}" if priced else "Check site",
+            "price_value": price if priced else 999999
+        })
+    return results
+
+def check() -> bool:
+    rng = random.Random(1)
+    ok = True
+    for _ in range(50):
+        results = generate(60, rng)
+        first = filter_results(results, "cheapest", QUERY)[0]
+        if any(t == first["title"].rsplit(" #", 1)[0] for t, _, _ in ACCESSORIES):
+            print(f"FAIL cheapest is an accessory: {first['title']} {first['price']}")
+            ok = False
+            break
+    old_first = filter_results(results, "cheapest")[0]
+    print(f"price only: {old_first['title']} {old_first['price']}")
+    print(f"ranked:     {first['title']} {first['price']}\n")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Result ranking speed")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 300, 1000])
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    ok = check()
+    rng = random.Random(0)
+    for n in args.sizes:
+        results = generate(n, rng)
+        start = time.perf_counter()
+        ranking.rank(results, QUERY)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            ranking.rank(results, QUERY)
+        warm = (time.perf_counter() - start) / args.runs
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            sorted(results, key=lambda r: r["price_value"])
+        plain = (time.perf_counter() - start) / args.runs
+        print(f"{n:>5} results  rank {warm * 1e6:>7.1f} us  (first call {cold * 1e6:>7.1f} us)"
+              f"  price sort {plain * 1e6:>6.1f} us")
+    sys.exit(0 if ok else 1)
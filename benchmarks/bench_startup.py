@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+STARTUP BENCHMARK
+
+Measures how long it takes to import each bot module in a fresh
+interpreter (what a systemd restart pays before polling starts).
+
+    python benchmarks/bench_startup.py [--runs 7] [module ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["config", "search_script", "functions", "payment_worker", "bot_final", "main"]
+
+SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+def time_import(module: str, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(module=module)],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        if out.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{out.stderr}")
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time benchmark for bot modules")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<16}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for module in args.modules:
+        t = time_import(module, args.runs)
+        print(f"{module:<16}{statistics.median(t):>12.1f}{min(t):>10.1f}{max(t):>10.1f}")
@@ -4,13 +4,38 @@
 PRODUCTION BOT - Always Running, Beautiful UI
 """
 
+import hashlib
 import logging
 import asyncio
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Bot
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
+from telegram.error import TelegramError
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, ContextTypes, filters
 from functions import is_user_registered, register_user, get_user_info, increment_search_count, store_feedback, log_search_query, create_paypal_payment, get_available_searches
-from search_script import fetch_amazon, filter_results
-from config import BOT_TOKEN, CREDIT_PACKAGES, ADMIN_TELEGRAM_ID, ADMIN_BOT_TOKEN
+from search_script import fetch_amazon, filter_results, served_from_index, SERVED_REFRESHING
+from query_planner import ALL_SITES
+import product_index
+from rendering import ResultTemplate, escape_markdown
+from functions import apply_paypal_event, get_admin_bot, add_price_watch, get_user_watches, cancel_price_watch
+from payment_worker import run_payment_reconciler, notify_payment_credited
+from paypal_webhook import WebhookProcessor, start_webhook_server
+from outbound import FloodControl
+import broadcast
+from prewarm import run_prewarmer
+from price_watch import run_price_watcher
+import ranking
+import price_history
+import price_enrichment
+import browser_pool
+import snapshot
+import quota_budget
+import autocomplete
+import bulk_search
+from config import (
+    BOT_TOKEN, CREDIT_PACKAGES, ADMIN_TELEGRAM_ID, PAYPAL_WEBHOOK_ENABLED, PREWARM_ENABLED,
+    PRODUCT_INDEX_MAX_AGE, PRODUCT_INDEX_RETENTION, INLINE_DEBOUNCE, INLINE_CACHE_TIME, INLINE_MAX_RESULTS,
+    PRICE_WATCH_ENABLED, PRICE_WATCH_PER_USER, PRICE_HISTORY_LOW_DAYS, ENRICH_ENABLED,
+    BROWSER_ENABLED, BULK_MAX_QUERIES, BULK_MAX_FILE_BYTES
+)
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -22,52 +47,150 @@ logging.basicConfig(
 # BEAUTIFUL MENUS
 # ============================================================================
 
-def main_menu():
-    """Beautiful main menu"""
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔍 Search Products", callback_data="search")],
-        [InlineKeyboardButton("💳 Buy Credits", callback_data="buy_credits")],
-        [InlineKeyboardButton("💬 Send Feedback", callback_data="feedback")],
-        [InlineKeyboardButton("ℹ️ Help", callback_data="help")]
-    ])
+# Keyboards are immutable, so they are built once and shared by every message
 
-def site_selection_menu():
-    """Site selection buttons"""
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("🌐 All Sites", callback_data="site_all")
-        ],
-        [
-            InlineKeyboardButton("📦 Amazon", callback_data="site_amazon"),
-            InlineKeyboardButton("🛍️ eBay", callback_data="site_ebay")
-        ],
-        [
-            InlineKeyboardButton("🏪 Walmart", callback_data="site_walmart"),
-            InlineKeyboardButton("🔵 BestBuy", callback_data="site_bestbuy")
-        ],
-        [
-            InlineKeyboardButton("🎨 Etsy", callback_data="site_etsy"),
-            InlineKeyboardButton("💻 Newegg", callback_data="site_newegg")
-        ],
-        [
-            InlineKeyboardButton("🇦🇿 Umico", callback_data="site_umico")
-        ],
-        [
-            InlineKeyboardButton("✏️ Custom Site", callback_data="site_custom")
-        ],
-        [InlineKeyboardButton("🔙 Back", callback_data="menu")]
-    ])
+MAIN_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔍 Search Products", callback_data="search")],
+    [InlineKeyboardButton("💳 Buy Credits", callback_data="buy_credits")],
+    [InlineKeyboardButton("💬 Send Feedback", callback_data="feedback")],
+    [InlineKeyboardButton("ℹ️ Help", callback_data="help")]
+])
 
-def filter_menu():
-    """Filter buttons"""
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("🏆 Top 3 Deals", callback_data="filter_top3"),
-            InlineKeyboardButton("⭐ Top 5 Deals", callback_data="filter_top5")
-        ],
-        [InlineKeyboardButton("📊 Show All", callback_data="filter_all")],
-        [InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]
-    ])
+SITE_SELECTION_MENU = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🌐 All Sites", callback_data="site_all")
+    ],
+    [
+        InlineKeyboardButton("📦 Amazon", callback_data="site_amazon"),
+        InlineKeyboardButton("🛍️ eBay", callback_data="site_ebay")
+    ],
+    [
+        InlineKeyboardButton("🏪 Walmart", callback_data="site_walmart"),
+        InlineKeyboardButton("🔵 BestBuy", callback_data="site_bestbuy")
+    ],
+    [
+        InlineKeyboardButton("🎨 Etsy", callback_data="site_etsy"),
+        InlineKeyboardButton("💻 Newegg", callback_data="site_newegg")
+    ],
+    [
+        InlineKeyboardButton("🇦🇿 Umico", callback_data="site_umico")
+    ],
+    [
+        InlineKeyboardButton("✏️ Custom Site", callback_data="site_custom")
+    ],
+    [InlineKeyboardButton("🔙 Back", callback_data="menu")]
+])
+
+FILTER_MENU = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🏆 Top 3 Deals", callback_data="filter_top3"),
+        InlineKeyboardButton("⭐ Top 5 Deals", callback_data="filter_top5")
+    ],
+    [InlineKeyboardButton("📊 Show All", callback_data="filter_all")],
+    [InlineKeyboardButton("🔔 Watch Price", callback_data="watch")],
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]
+])
+
+BUY_CREDITS_MENU = InlineKeyboardMarkup([[InlineKeyboardButton("💳 Buy Credits", callback_data="buy_credits")]])
+
+CREDIT_PACKAGES_MENU = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(f"💳 {pkg['name']} - ${pkg['price']:.2f}", callback_data=f"package_{key}")]
+     for key, pkg in CREDIT_PACKAGES.items()]
+    + [[InlineKeyboardButton("🔙 Back", callback_data="menu")]]
+)
+
+SITE_NAMES = {
+    "all": "🌐 All Sites",
+    "amazon": "📦 Amazon",
+    "ebay": "🛍️ eBay",
+    "walmart": "🏪 Walmart",
+    "bestbuy": "🔵 BestBuy",
+    "etsy": "🎨 Etsy",
+    "newegg": "💻 Newegg",
+    "umico": "🇦🇿 Umico"
+}
+
+FILTER_NAMES = {
+    "all": "All Results",
+    "cheapest": "Cheapest First",
+    "expensive": "Most Expensive",
+    "top3_cheap": "Top 3 Deals",
+    "top5_cheap": "Top 5 Deals"
+}
+
+# ============================================================================
+# RESULT TEMPLATES
+# ============================================================================
+
+SEARCH_RESULTS = ResultTemplate(
+    item="{i}. 🌐 *{site}*\n   📦 {title}...\n   💰 *Price:* {price}{trend}{age}\n   [🔗 View]({link})\n\n",
+    more="_...and {count} more products_\n\n",
+    footer="👇 _Choose filter:_",
+    stale_after=PRODUCT_INDEX_MAX_AGE
+)
+
+INLINE_RESULTS = ResultTemplate(
+    item="{i}. 🌐 *{site}*\n   📦 {title}...\n   💰 *Price:* {price}{trend}{age}\n   [🔗 View]({link})\n\n",
+    more="_...and {count} more products_\n\n",
+    footer="",
+    stale_after=PRODUCT_INDEX_MAX_AGE
+)
+
+INLINE_PRODUCT = ResultTemplate(
+    item="🌐 *{site}*\n📦 {title}\n💰 *Price:* {price}{trend}{age}\n[🔗 View Product]({link})",
+    more="",
+    footer="",
+    title_width=150,
+    stale_after=PRODUCT_INDEX_MAX_AGE
+)
+
+FILTERED_RESULTS = ResultTemplate(
+    item="{i}. 🌐 *{site}*\n   📦 {title}...\n   💰 *Price:* {price}{trend}{age}\n   [🔗 View Product]({link})\n\n",
+    more="_...and {count} more products_\n\n",
+    footer="👇 _Choose filter:_",
+    stale_after=PRODUCT_INDEX_MAX_AGE
+)
+
+def search_prompt(selected: str) -> str:
+    """Ask for the product name, with the most searched queries as hints"""
+    text = (
+        f"✅ *Selected:* {escape_markdown(selected)}\n\n"
+        f"🔍 *Now enter product name:*\n\n"
+        f"_Type the product you want to search..._"
+    )
+    popular = autocomplete.popular(5)
+    if popular:
+        text += "\n\n🔥 *Popular:* " + " · ".join(escape_markdown(q) for q in popular)
+    return text
+
+def new_view(context) -> int:
+    """Count a change of what the user's results message shows"""
+    context.user_data['view'] = context.user_data.get('view', 0) + 1
+    return context.user_data['view']
+
+async def enrich_shown(context, message, shown: list, render):
+    """
+    Fill in "Check site" prices of the products on screen after the page
+    was sent, then edit it with render() - unless the user has moved on
+    (another filter, a new search) in the meantime.
+    """
+    view = context.user_data.get('view')
+    if not ENRICH_ENABLED or all(r['price_value'] < 999999 for r in shown):
+        return
+    try:
+        if not await price_enrichment.enrich(shown):
+            return
+        if context.user_data.get('view') != view:
+            return
+        await message.edit_text(render(), parse_mode="Markdown", reply_markup=FILTER_MENU, disable_web_page_preview=True)
+    except TelegramError as e:
+        logging.info(f"[Enrich] Page not updated: {e}")
+    except Exception as e:
+        logging.error(f"[Enrich] Failed: {e}")
+
+def did_you_mean_line(query: str) -> str:
+    suggestion = autocomplete.did_you_mean(query)
+    return f"💡 Did you mean *{escape_markdown(suggestion)}*?\n\n" if suggestion else ""
 
 # ============================================================================
 # START COMMAND
@@ -113,9 +236,178 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         welcome,
         parse_mode="Markdown",
-        reply_markup=main_menu()
+        reply_markup=MAIN_MENU
+    )
+
+# ============================================================================
+# ADMIN COMMANDS
+# ============================================================================
+
+async def quota(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/quota - today's CSE spend per hour and per user (admin only)"""
+    if update.effective_user.id != ADMIN_TELEGRAM_ID:
+        return
+    
+    stats = quota_budget.summary()
+    hours = "\n".join(
+        f"{hour:02d}:00  {count}" for hour, count in enumerate(stats["hourly"]) if count
+    ) or "-"
+    users = "\n".join(f"{user_id}: {count}" for user_id, count in stats["top_users"]) or "-"
+    
+    await update.message.reply_text(
+        f"📊 *Quota {stats['day']}* (Pacific)\n\n"
+        f"💰 Spent: {stats['spent']}/{stats['budget']}\n"
+        f"⏱️ Pace allows: {stats['allowance']}\n"
+        f"🚦 Level: {escape_markdown(stats['level'])}\n\n"
+        f"*Per hour:*\n{hours}\n\n"
+        f"*Top users:*\n{users}",
+        parse_mode="Markdown"
     )
 
+# ============================================================================
+# PRICE WATCH
+# ============================================================================
+
+def watch_targets(current: float, history_low: float = None) -> InlineKeyboardMarkup:
+    """Target choices below the product's current price (callback data in cents)"""
+    targets = [(label, current * factor) for label, factor in (("📉 Any drop", 0.99), ("🔻 -10%", 0.9), ("⬇️ -20%", 0.8))]
+    if history_low is not None and history_low < current * 0.99:
+        # The product has been this cheap recently - a realistic target
+        targets.insert(1, (f"📊 {PRICE_HISTORY_LOW_DAYS}-day low", history_low))
+    rows = [
+        [InlineKeyboardButton(f"{label} (${price:.2f})", callback_data=f"watch_{round(price * 100)}")]
+        for label, price in targets
+    ]
+    return InlineKeyboardMarkup(rows + [[InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]])
+
+async def watches(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/watches - list active price watches with cancel buttons"""
+    rows = get_user_watches(update.effective_user.id)
+    if not rows:
+        await update.message.reply_text(
+            "🔔 *No price watches.*\n\n_Tap 'Watch Price' under search results to add one._",
+            parse_mode="Markdown"
+        )
+        return
+    
+    lines = [
+        f"{i}. {escape_markdown(w['query'])} - 🎯 ${float(w['target_price']):.2f}"
+        + (f" (now ${float(w['last_price']):.2f})" if w.get('last_price') is not None else "")
+        for i, w in enumerate(rows, 1)
+    ]
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"❌ Stop #{i}", callback_data=f"unwatch_{w['id']}")]
+        for i, w in enumerate(rows, 1)
+    ])
+    await update.message.reply_text(
+        "🔔 *Your price watches:*\n\n" + "\n".join(lines),
+        parse_mode="Markdown",
+        reply_markup=keyboard
+    )
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <text> - send text to every user; /broadcast alone shows progress (admin only)"""
+    if update.effective_user.id != ADMIN_TELEGRAM_ID:
+        return
+    
+    parts = update.message.text.split(None, 1)
+    if len(parts) < 2:
+        if not broadcast.active:
+            await update.message.reply_text("📣 No broadcast running.\n\nUsage: /broadcast <message>")
+            return
+        lines = [
+            f"#{broadcast_id}: ✅ {p['delivered']} · 🚫 {p['blocked']} · ❌ {p['failed']} (user id {p['last_user_id']})"
+            for broadcast_id, p in broadcast.active.items()
+        ]
+        await update.message.reply_text("📣 Running broadcasts\n\n" + "\n".join(lines))
+        return
+    
+    if broadcast.active:
+        await update.message.reply_text("⏳ A broadcast is already running - check /broadcast")
+        return
+    
+    broadcast_id, task = await broadcast.start_broadcast(context.bot, parts[1])
+    track_task(task)
+    await update.message.reply_text(f"📣 Broadcast #{broadcast_id} started. You'll get a report when it's done.")
+
+# ============================================================================
+# BULK SEARCH
+# ============================================================================
+
+BULK_HELP = (
+    "📄 *Bulk search*\n\n"
+    f"Send a .txt or .csv file with one product per line (up to {BULK_MAX_QUERIES}).\n"
+    "You get back one CSV with the cheapest offers for each product.\n\n"
+    "💰 1 credit per product - products with no results are refunded.\n"
+    "📍 Uses the store you last selected."
+)
+
+async def bulk(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bulk - how to send a product list"""
+    await update.message.reply_text(BULK_HELP, parse_mode="Markdown")
+
+async def run_bulk_job(bot, telegram_id: int, queries: list, site: str, status):
+    if not await bulk_search.start_bulk(bot, telegram_id, queries, site, status):
+        await status.edit_text(
+            f"❌ *Not enough credits!*\n\n"
+            f"📄 This list needs {len(queries)} credits, you have {get_available_searches(telegram_id)}.",
+            parse_mode="Markdown",
+            reply_markup=BUY_CREDITS_MENU
+        )
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """An uploaded product list starts a bulk search"""
+    telegram_id = update.message.from_user.id
+    doc = update.message.document
+    filename = doc.file_name or ""
+    
+    if not filename.lower().endswith((".txt", ".csv")):
+        await update.message.reply_text(BULK_HELP, parse_mode="Markdown")
+        return
+    if doc.file_size and doc.file_size > BULK_MAX_FILE_BYTES:
+        await update.message.reply_text(f"❌ File too large (max {BULK_MAX_FILE_BYTES // 1000} KB).")
+        return
+    if telegram_id in bulk_search.running:
+        await update.message.reply_text("⏳ Your previous list is still being searched.")
+        return
+    
+    # Claimed before the first await, so two lists sent together can't both start
+    bulk_search.running.add(telegram_id)
+    started = False
+    try:
+        data = await (await doc.get_file()).download_as_bytearray()
+        queries = bulk_search.parse_queries(bytes(data), filename)
+        if not queries:
+            await update.message.reply_text("😔 No products found in the file.\n\nPut one product per line.")
+            return
+        
+        note = ""
+        if len(queries) > BULK_MAX_QUERIES:
+            note = f"\n✂️ Only the first {BULK_MAX_QUERIES} of {len(queries)} products are searched."
+            queries = queries[:BULK_MAX_QUERIES]
+        
+        credits = get_available_searches(telegram_id)
+        if credits < len(queries):
+            await update.message.reply_text(
+                f"❌ *Not enough credits!*\n\n"
+                f"📄 This list needs {len(queries)} credits, you have {credits}.",
+                parse_mode="Markdown",
+                reply_markup=BUY_CREDITS_MENU
+            )
+            return
+        
+        selected_site = context.user_data.get('selected_site', 'all')
+        site = selected_site.replace("custom:", "")
+        status = await update.message.reply_text(
+            f"📄 Bulk search: {len(queries)} products on {site}...{note}"
+        )
+        # Runs in the background so the user can keep using the bot meanwhile
+        track_task(asyncio.create_task(run_bulk_job(context.bot, telegram_id, queries, site, status)))
+        started = True
+    finally:
+        if not started:
+            bulk_search.running.discard(telegram_id)
+
 # ============================================================================
 # BUTTON HANDLER
 # ============================================================================
@@ -127,6 +419,8 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     data = query.data
     telegram_id = query.from_user.id
+    # Every button changes the message a price update may still be pending for
+    new_view(context)
     
     # SEARCH
     if data == "search":
@@ -136,7 +430,7 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "❌ *No credits available!*\n\n"
                 "💡 Buy credits to start searching:",
                 parse_mode="Markdown",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("💳 Buy Credits", callback_data="buy_credits")]])
+                reply_markup=BUY_CREDITS_MENU
             )
         else:
             await query.edit_message_text(
@@ -144,7 +438,7 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"💰 Credits: {credits}\n\n"
                 f"_Select the site you want to search:_",
                 parse_mode="Markdown",
-                reply_markup=site_selection_menu()
+                reply_markup=SITE_SELECTION_MENU
             )
     
     # SITE SELECTION
@@ -165,39 +459,17 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data['selected_site'] = site_choice
             context.user_data['waiting_for'] = 'search'
             
-            site_names = {
-                "all": "🌐 All Sites",
-                "amazon": "📦 Amazon",
-                "ebay": "🛍️ eBay",
-                "walmart": "🏪 Walmart",
-                "bestbuy": "🔵 BestBuy",
-                "etsy": "🎨 Etsy",
-                "newegg": "💻 Newegg",
-                "umico": "🇦🇿 Umico"
-            }
-            
-            selected_name = site_names.get(site_choice, "All Sites")
+            selected_name = SITE_NAMES.get(site_choice, "All Sites")
             
-            await query.edit_message_text(
-                f"✅ *Selected:* {selected_name}\n\n"
-                f"🔍 *Now enter product name:*\n\n"
-                f"_Type the product you want to search..._",
-                parse_mode="Markdown"
-            )
+            await query.edit_message_text(search_prompt(selected_name), parse_mode="Markdown")
     
     # BUY CREDITS
     elif data == "buy_credits":
-        buttons = []
-        for key, pkg in CREDIT_PACKAGES.items():
-            btn_text = f"💳 {pkg['name']} - ${pkg['price']:.2f}"
-            buttons.append([InlineKeyboardButton(btn_text, callback_data=f"package_{key}")])
-        buttons.append([InlineKeyboardButton("🔙 Back", callback_data="menu")])
-        
         await query.edit_message_text(
             "💰 *Choose a Credit Package:*\n\n"
             "Select the package that suits you:",
             parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(buttons)
+            reply_markup=CREDIT_PACKAGES_MENU
         )
     
     # BUY PACKAGE
@@ -228,7 +500,7 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     "❌ *Payment error!*\n\n"
                     "Please try again or contact support.",
                     parse_mode="Markdown",
-                    reply_markup=main_menu()
+                    reply_markup=MAIN_MENU
                 )
     
     # FEEDBACK
@@ -258,9 +530,10 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "💡 *Features:*\n"
             "• Filter by price\n"
             "• Direct product links\n"
-            "• Real-time results"
+            "• Real-time results\n"
+            f"• Bulk search: send a .txt/.csv list (up to {BULK_MAX_QUERIES} products) - /bulk"
         )
-        await query.edit_message_text(help_text, parse_mode="Markdown", reply_markup=main_menu())
+        await query.edit_message_text(help_text, parse_mode="Markdown", reply_markup=MAIN_MENU)
     
     # BACK TO MENU
     elif data == "menu":
@@ -268,9 +541,60 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(
             f"📱 *Main Menu*\n\n💰 Credits: {credits}",
             parse_mode="Markdown",
-            reply_markup=main_menu()
+            reply_markup=MAIN_MENU
+        )
+    
+    # PRICE WATCH
+    elif data == "watch":
+        product = ranking.reference_offer(
+            context.user_data.get('search_results', []), context.user_data.get('search_query', '')
+        )
+        if product is None:
+            await query.edit_message_text("❌ No prices to watch in these results.", reply_markup=MAIN_MENU)
+            return
+        
+        await query.edit_message_text(
+            f"🔔 *Watch:* {escape_markdown(context.user_data.get('search_query', ''))}\n\n"
+            f"💰 Now: ${product['price_value']:.2f} at {escape_markdown(product['site'])}\n\n"
+            f"_Tell me when the price drops to:_",
+            parse_mode="Markdown",
+            reply_markup=watch_targets(product['price_value'], price_history.lowest(product['link']))
+        )
+    
+    elif data.startswith("watch_"):
+        search_query = context.user_data.get('search_query')
+        product = ranking.reference_offer(context.user_data.get('search_results', []), search_query or '')
+        if not search_query or product is None:
+            await query.edit_message_text("❌ Search again to watch a price.", reply_markup=MAIN_MENU)
+            return
+        
+        if len(get_user_watches(telegram_id)) >= PRICE_WATCH_PER_USER:
+            await query.edit_message_text(
+                f"⚠️ You can watch up to {PRICE_WATCH_PER_USER} prices.\n\n"
+                f"Use /watches to stop one first.",
+                reply_markup=MAIN_MENU
+            )
+            return
+        
+        target = int(data.replace("watch_", "")) / 100
+        add_price_watch(
+            telegram_id, search_query, context.user_data.get('search_site', 'all'),
+            target, round(product['price_value'], 2)
+        )
+        await query.edit_message_text(
+            f"✅ *Watching:* {escape_markdown(search_query)}\n\n"
+            f"🎯 I'll message you when it's ${target:.2f} or less.\n\n"
+            f"_Manage your watches with /watches_",
+            parse_mode="Markdown",
+            reply_markup=MAIN_MENU
         )
     
+    elif data.startswith("unwatch_"):
+        if cancel_price_watch(telegram_id, int(data.replace("unwatch_", ""))):
+            await query.edit_message_text("🔕 Price watch stopped.")
+        else:
+            await query.edit_message_text("❌ Watch not found.")
+    
     # FILTERS
     elif data.startswith("filter_"):
         filter_type = data.replace("filter_", "")
@@ -286,45 +610,30 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         search_query = context.user_data.get('search_query', '')
         
         if not results:
-            await query.edit_message_text("❌ No results to filter.", reply_markup=main_menu())
+            await query.edit_message_text("❌ No results to filter.", reply_markup=MAIN_MENU)
             return
         
-        filtered = filter_results(results, filter_type)
-        
-        # Filter display names
-        filter_names = {
-            "all": "All Results",
-            "cheapest": "Cheapest First",
-            "expensive": "Most Expensive",
-            "top3_cheap": "Top 3 Deals",
-            "top5_cheap": "Top 5 Deals"
-        }
-        
-        message = (
-            f"🔍 *Search:* {search_query}\n"
-            f"📊 *Filter:* {filter_names.get(filter_type, 'All')}\n"
-            f"🎯 *Showing:* {len(filtered)} products\n\n"
-        )
-        
-        for i, product in enumerate(filtered[:10], 1):
-            message += (
-                f"{i}. 🌐 *{product['site']}*\n"
-                f"   📦 {product['title'][:55]}...\n"
-                f"   💰 *Price:* {product['price']}\n"
-                f"   [🔗 View Product]({product['link']})\n\n"
+        def render():
+            filtered = filter_results(results, filter_type, search_query)
+            return filtered, FILTERED_RESULTS.render(
+                f"🔍 *Search:* {escape_markdown(search_query)}\n"
+                f"📊 *Filter:* {FILTER_NAMES.get(filter_type, 'All')}\n"
+                f"🎯 *Showing:* {len(filtered)} products\n\n",
+                filtered
             )
         
-        if len(filtered) > 10:
-            message += f"_...and {len(filtered) - 10} more products_\n\n"
-        
-        message += "👇 _Choose filter:_"
-        
+        filtered, message = render()
         await query.edit_message_text(
             message,
             parse_mode="Markdown",
-            reply_markup=filter_menu(),
+            reply_markup=FILTER_MENU,
             disable_web_page_preview=True
         )
+        
+        # Prices for the rows on screen; the order is worked out again with them
+        track_task(asyncio.create_task(
+            enrich_shown(context, query.message, filtered[:10], lambda: render()[1])
+        ))
 
 # ============================================================================
 # MESSAGE HANDLER
@@ -343,7 +652,7 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         credits = get_available_searches(telegram_id)
         if credits <= 0:
-            await update.message.reply_text("❌ No credits!", reply_markup=main_menu())
+            await update.message.reply_text("❌ No credits!", reply_markup=MAIN_MENU)
             return
         
         # Get selected site
@@ -355,77 +664,73 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
             site_display = f"✏️ {custom_url}"
             search_site = custom_url
         else:
-            site_names = {
-                "all": "🌐 All Sites",
-                "amazon": "📦 Amazon",
-                "ebay": "🛍️ eBay",
-                "walmart": "🏪 Walmart",
-                "bestbuy": "🔵 BestBuy",
-                "etsy": "🎨 Etsy",
-                "newegg": "💻 Newegg",
-                "umico": "🇦🇿 Umico"
-            }
-            site_display = site_names.get(selected_site, "🌐 All Sites")
+            site_display = SITE_NAMES.get(selected_site, "🌐 All Sites")
             search_site = selected_site
         
-        await update.message.reply_text(
-            f"🔍 *Searching:* {text}\n"
-            f"📍 *Site:* {site_display}\n"
+        # One status message per search, edited into the results
+        status = await update.message.reply_text(
+            f"🔍 *Searching:* {escape_markdown(text)}\n"
+            f"📍 *Site:* {escape_markdown(site_display)}\n"
             f"⏳ Please wait...", 
             parse_mode="Markdown"
         )
         
         # Search using Google API with selected site
         loop = asyncio.get_running_loop()
-        results = await loop.run_in_executor(None, fetch_amazon, text, search_site)
+        served = {}
+        results = await loop.run_in_executor(None, fetch_amazon, text, search_site, telegram_id, served)
         
         if not results:
-            await update.message.reply_text(
+            await status.edit_text(
                 f"😔 *No results found.*\n\n"
+                f"{did_you_mean_line(text)}"
                 f"💡 Try different keywords.",
                 parse_mode="Markdown",
-                reply_markup=main_menu()
+                reply_markup=MAIN_MENU
             )
             return
         
         # Save results for filtering
         context.user_data['search_results'] = results
         context.user_data['search_query'] = text
+        context.user_data['search_site'] = search_site
         
         # Display results
-        message = (
-            f"🔍 *Search:* {text}\n"
-            f"📍 *Site:* {site_display}\n"
+        header = (
+            f"🔍 *Search:* {escape_markdown(text)}\n"
+            f"📍 *Site:* {escape_markdown(site_display)}\n"
             f"🎯 *Found:* {len(results)} products\n\n"
+            f"{did_you_mean_line(text)}"
         )
-        
-        for i, product in enumerate(results[:10], 1):
-            message += (
-                f"{i}. 🌐 *{product['site']}*\n"
-                f"   📦 {product['title'][:55]}...\n"
-                f"   💰 *Price:* {product['price']}\n"
-                f"   [🔗 View]({product['link']})\n\n"
+        # Only a notice when saved results were actually served, saying why
+        reason = served.get("reason")
+        if reason and served_from_index(results):
+            if reason == SERVED_REFRESHING:
+                header += "🕒 _Stores are slow to answer - showing saved results, fresh ones are on the way._\n\n"
+            elif served["level"] >= quota_budget.STALE:
+                header += "⚠️ _Today's search quota is used up - showing saved results, prices may be outdated._\n\n"
+            else:
+                header += "💾 _Searches are busy today - showing saved results from the last few days to save quota._\n\n"
+        def render():
+            return SEARCH_RESULTS.render(
+                header, results,
+                footer=f"✅ *Search complete!* 💰 Remaining credits: {credits - 1}\n\n{SEARCH_RESULTS.footer}"
             )
         
-        if len(results) > 10:
-            message += f"_...and {len(results) - 10} more products_\n\n"
-        
-        message += "👇 _Choose filter:_"
-        
-        await update.message.reply_text(
-            message,
+        new_view(context)
+        await status.edit_text(
+            render(),
             parse_mode="Markdown",
-            reply_markup=filter_menu(),
+            reply_markup=FILTER_MENU,
             disable_web_page_preview=True
         )
+        # Real prices for the "Check site" products on the first page, after it is shown
+        track_task(asyncio.create_task(enrich_shown(context, status, results[:10], render)))
         
         # Deduct credit
         increment_search_count(telegram_id)
         log_search_query(telegram_id, f"{text} [{selected_site}]")
-        
-        # Show remaining
-        remaining = get_available_searches(telegram_id)
-        await update.message.reply_text(f"✅ *Search complete!*\n💰 Remaining credits: {remaining}", parse_mode="Markdown")
+        autocomplete.add_query(text)
     
     # CUSTOM SITE
     elif waiting_for == 'custom_site':
@@ -445,7 +750,7 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Please enter a valid website URL.\n"
                 "_Example: trendyol.com_",
                 parse_mode="Markdown",
-                reply_markup=main_menu()
+                reply_markup=MAIN_MENU
             )
             return
         
@@ -453,12 +758,7 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['selected_site'] = f"custom:{custom_site}"
         context.user_data['waiting_for'] = 'search'
         
-        await update.message.reply_text(
-            f"✅ *Selected:* {custom_site}\n\n"
-            f"🔍 *Now enter product name:*\n\n"
-            f"_Type the product you want to search..._",
-            parse_mode="Markdown"
-        )
+        await update.message.reply_text(search_prompt(custom_site), parse_mode="Markdown")
     
     # FEEDBACK
     elif waiting_for == 'feedback':
@@ -472,8 +772,7 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Send to admin
         try:
-            admin_bot = Bot(ADMIN_BOT_TOKEN)
-            await admin_bot.send_message(
+            await get_admin_bot().send_message(
                 ADMIN_TELEGRAM_ID,
                 f"💬 *New Feedback!*\n\n"
                 f"👤 User: @{username}\n"
@@ -489,7 +788,7 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "✅ *Thank you for your feedback!*\n\n"
             "We appreciate your input.",
             parse_mode="Markdown",
-            reply_markup=main_menu()
+            reply_markup=MAIN_MENU
         )
     
     # DEFAULT
@@ -498,9 +797,219 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📱 *Main Menu*\n\n"
             "Choose an option below:",
             parse_mode="Markdown",
-            reply_markup=main_menu()
+            reply_markup=MAIN_MENU
         )
 
+# ============================================================================
+# INLINE MODE (@bot query from any chat - enable with /setinline in BotFather)
+# ============================================================================
+
+# user id -> id of their latest inline query, to drop superseded keystrokes
+_inline_latest = {}
+
+def inline_search_button(text: str) -> InlineKeyboardMarkup:
+    # callback_data is limited to 64 bytes
+    data = "isearch:" + text.encode("utf-8")[:56].decode("utf-8", "ignore")
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Search all stores (1 credit)", callback_data=data)]])
+
+def _inline_id(kind: str, value: str) -> str:
+    return f"{kind}:{hashlib.md5(value.encode()).hexdigest()}"
+
+def _search_article(text: str, description: str) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=_inline_id("q", text),
+        title=f"🔍 {text}",
+        description=description,
+        input_message_content=InputTextMessageContent(
+            f"🔍 *{escape_markdown(text)}*\n\n_Tap below to search all stores._",
+            parse_mode="Markdown"
+        ),
+        reply_markup=inline_search_button(text)
+    )
+
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Answer @bot queries from the local index and autocomplete only -
+    nothing goes upstream until someone taps "Search all stores"
+    """
+    inline = update.inline_query
+    text = inline.query.strip()
+    user_id = inline.from_user.id
+    if len(text) < 2:
+        return
+    
+    # Debounce: Telegram sends a query per keystroke; only answer the last one
+    _inline_latest[user_id] = inline.id
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if _inline_latest.get(user_id) != inline.id:
+        return
+    del _inline_latest[user_id]
+    
+    articles = [_search_article(text, "Search all stores for the latest prices")]
+    for suggestion in autocomplete.complete(text, 3):
+        if suggestion != text.lower():
+            articles.append(_search_article(suggestion, "Popular search"))
+    
+    products = product_index.search(text, ALL_SITES, INLINE_MAX_RESULTS, max_age=PRODUCT_INDEX_RETENTION, prefix=True)
+    for product in products:
+        articles.append(InlineQueryResultArticle(
+            id=_inline_id("p", product['link']),
+            title=product['title'][:100],
+            description=f"{product['price']} · {product['site']}",
+            url=product['link'],
+            hide_url=True,
+            input_message_content=InputTextMessageContent(
+                INLINE_PRODUCT.render_item(1, product),
+                parse_mode="Markdown",
+                disable_web_page_preview=True
+            ),
+            reply_markup=inline_search_button(text)
+        ))
+    
+    try:
+        await inline.answer(articles, cache_time=INLINE_CACHE_TIME)
+    except Exception as e:
+        # Query too old (user kept typing) - nothing to do
+        logging.warning(f"Inline answer failed: {e}")
+
+async def handle_inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """"Search all stores" under an inline message: the only upstream path of inline mode"""
+    query = update.callback_query
+    text = query.data.split(":", 1)[1]
+    telegram_id = query.from_user.id
+    
+    if not is_user_registered(telegram_id):
+        register_user(telegram_id, query.from_user.username or query.from_user.first_name or f"User{telegram_id}")
+    
+    if get_available_searches(telegram_id) <= 0:
+        await query.answer("❌ No credits! Open the bot to buy more.", show_alert=True)
+        return
+    await query.answer("🔍 Searching...")
+    
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(None, fetch_amazon, text, "all", telegram_id)
+    
+    if not results:
+        await query.edit_message_text(
+            f"😔 *No results found for* {escape_markdown(text)}",
+            parse_mode="Markdown"
+        )
+        return
+    
+    message = INLINE_RESULTS.render(
+        f"🔍 *Search:* {escape_markdown(text)}\n"
+        f"🎯 *Found:* {len(results)} products\n\n",
+        filter_results(results, "cheapest", text)
+    )
+    await query.edit_message_text(message, parse_mode="Markdown", disable_web_page_preview=True)
+    
+    increment_search_count(telegram_id)
+    log_search_query(telegram_id, f"{text} [all]")
+    autocomplete.add_query(text)
+
+# ============================================================================
+# BACKGROUND TASKS
+# ============================================================================
+
+background_tasks = []   # workers that run for the life of the bot
+request_tasks = set()    # broadcasts, bulk searches, ... - dropped when done
+webhook_servers = []
+
+def track_task(task):
+    """Keep a per-request task referenced until it finishes (and cancel it on shutdown)"""
+    request_tasks.add(task)
+    task.add_done_callback(request_tasks.discard)
+    return task
+
+def register_user_data_snapshot(app):
+    """Include users' conversation state and last results in snapshots"""
+    def dump():
+        return {user_id: dict(data) for user_id, data in app.user_data.items() if data}
+    
+    def load(saved):
+        for user_id, data in saved.items():
+            # app.user_data is a read-only view of a defaultdict, so indexing
+            # creates the user's dict and we can fill it in place
+            app.user_data[user_id].update(data)
+    
+    # Handlers change user_data on the event loop - copy it there
+    snapshot.register("user_data", dump, load, on_loop=True)
+
+async def load_autocomplete():
+    """Build the autocomplete trie from search_history without delaying startup"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, autocomplete.load_history)
+    except Exception as e:
+        logging.error(f"Failed to load autocomplete history: {e}")
+
+async def warm_browsers():
+    """Launch the headless browsers before the first JavaScript-store search"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, browser_pool.pool.warm)
+    except Exception as e:
+        logging.error(f"Failed to start headless browsers: {e}")
+
+async def on_startup(app):
+    """Start background workers once the bot is initialized"""
+    register_user_data_snapshot(app)
+    snapshot.restore_snapshot()
+    
+    background_tasks.append(asyncio.create_task(run_payment_reconciler(app.bot)))
+    background_tasks.append(asyncio.create_task(snapshot.run_snapshot_saver()))
+    background_tasks.append(asyncio.create_task(load_autocomplete()))
+    
+    try:
+        for task in await broadcast.resume_broadcasts(app.bot):
+            track_task(task)
+    except Exception as e:
+        logging.error(f"Failed to resume broadcasts: {e}")
+    if PREWARM_ENABLED:
+        background_tasks.append(asyncio.create_task(run_prewarmer()))
+    if PRICE_WATCH_ENABLED:
+        background_tasks.append(asyncio.create_task(run_price_watcher(app.bot)))
+    if BROWSER_ENABLED:
+        background_tasks.append(asyncio.create_task(warm_browsers()))
+    
+    if PAYPAL_WEBHOOK_ENABLED:
+        loop = asyncio.get_running_loop()
+        
+        def on_credited(item):
+            # Called from the webhook thread - hand the message to the bot's loop
+            asyncio.run_coroutine_threadsafe(notify_payment_credited(app.bot, item), loop)
+        
+        try:
+            processor = WebhookProcessor(apply_paypal_event, on_credited=on_credited)
+            webhook_servers.append(start_webhook_server(processor))
+        except (OSError, ValueError) as e:
+            logging.error(f"PayPal webhook receiver not started: {e}")
+
+async def on_shutdown(app):
+    """Stop background workers"""
+    for server in webhook_servers:
+        server.shutdown()
+    webhook_servers.clear()
+    
+    tasks = background_tasks + list(request_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    background_tasks.clear()
+    
+    try:
+        size = snapshot.save_snapshot()
+        logging.info(f"💾 Snapshot saved ({size} bytes)")
+    except Exception as e:
+        logging.error(f"Failed to save snapshot on shutdown: {e}")
+    
+    try:
+        await price_enrichment.fetcher.aclose()
+    except Exception as e:
+        logging.error(f"Failed to close the enrichment client: {e}")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, browser_pool.pool.close)
+    except Exception as e:
+        logging.error(f"Failed to close the browser pool: {e}")
+
 # ============================================================================
 # MAIN
 # ============================================================================
@@ -513,14 +1022,24 @@ if __name__ == "__main__":
     print("  🔄 Auto-restart on crash")
     print("  🌐 Multi-site product search")
     print("  💰 3 API failover system (300 queries/day)")
+    print("  💳 Automatic PayPal payment reconciliation + webhooks")
     print("="*60 + "\n")
     
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = ApplicationBuilder().token(BOT_TOKEN).rate_limiter(FloodControl()) \
+        .post_init(on_startup).post_shutdown(on_shutdown).build()
     
     # Add handlers
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("quota", quota))
+    app.add_handler(CommandHandler("broadcast", broadcast_command))
+    app.add_handler(CommandHandler("watches", watches))
+    app.add_handler(CommandHandler("bulk", bulk))
+    app.add_handler(CallbackQueryHandler(handle_inline_search, pattern="^isearch:"))
     app.add_handler(CallbackQueryHandler(handle_buttons))
+    # block=False so a newer keystroke's query can supersede one still debouncing
+    app.add_handler(InlineQueryHandler(handle_inline_query, block=False))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_messages))
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     
     logging.info("🚀 Bot starting...")
     logging.info("📱 Listening for messages...")
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+BROADCAST ENGINE
+
+Sends an admin announcement to every user without holding up search
+handling: users are streamed from Supabase a page at a time (keyset
+pagination on users.id), a small pool of workers sends through a token
+bucket capped at BROADCAST_RATE (well under Telegram's global limit, and
+at low priority in outbound.FloodControl), and after every page the last
+users.id done is checkpointed in the broadcasts table so a restart
+resumes where it stopped.
+
+At most one page can be re-sent after a crash - never a whole broadcast.
+"""
+
+import asyncio
+import logging
+from telegram.error import Forbidden, BadRequest, TelegramError
+from functions import (
+    get_users_page, create_broadcast, get_running_broadcasts,
+    save_broadcast_progress, finish_broadcast
+)
+from outbound import PRIORITY_LOW
+from config import ADMIN_TELEGRAM_ID, BROADCAST_RATE, BROADCAST_WORKERS, BROADCAST_PAGE_SIZE
+
+# broadcast id -> progress dict, for /broadcast status
+active = {}
+
+class TokenBucket:
+    """Async token bucket: rate tokens/second, bursts up to capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._last = None
+        self._lock = asyncio.Lock()
+
+    async def take(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._last is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+# ============================================================================
+# SENDING
+# ============================================================================
+
+async def _send(bot, telegram_id: int, message: str) -> str:
+    """Returns "delivered", "blocked" or "failed" """
+    try:
+        await bot.send_message(telegram_id, message, rate_limit_args=PRIORITY_LOW)
+        return "delivered"
+    except Forbidden:
+        # Blocked the bot or deleted their account
+        return "blocked"
+    except BadRequest as e:
+        logging.info(f"[Broadcast] {telegram_id}: {e}")
+        return "failed"
+    except TelegramError as e:
+        logging.warning(f"[Broadcast] {telegram_id}: {e}")
+        return "failed"
+
+async def run_broadcast(bot, row: dict):
+    """Send (or resume) one broadcast, then report to the admin"""
+    loop = asyncio.get_running_loop()
+    broadcast_id = row["id"]
+    progress = active[broadcast_id] = {
+        "delivered": row.get("delivered") or 0,
+        "blocked": row.get("blocked") or 0,
+        "failed": row.get("failed") or 0,
+        "last_user_id": row.get("last_user_id") or 0
+    }
+    bucket = TokenBucket(BROADCAST_RATE)
+    queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            telegram_id = await queue.get()
+            try:
+                await bucket.take()
+                progress[await _send(bot, telegram_id, row["message"])] += 1
+            except Exception as e:
+                # Never leave an item undone - queue.join() would wait forever
+                logging.error(f"[Broadcast] {telegram_id}: {e}")
+                progress["failed"] += 1
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(BROADCAST_WORKERS)]
+    logging.info(f"[Broadcast] #{broadcast_id} running from user id {progress['last_user_id']}")
+
+    try:
+        while True:
+            page = await loop.run_in_executor(
+                None, get_users_page, progress["last_user_id"], BROADCAST_PAGE_SIZE
+            )
+            if not page:
+                break
+            for user in page:
+                queue.put_nowait(user["telegram_id"])
+            await queue.join()
+
+            progress["last_user_id"] = page[-1]["id"]
+            await loop.run_in_executor(
+                None, save_broadcast_progress, broadcast_id, progress["last_user_id"],
+                progress["delivered"], progress["blocked"], progress["failed"]
+            )
+
+        await loop.run_in_executor(None, finish_broadcast, broadcast_id)
+        logging.info(f"[Broadcast] #{broadcast_id} done: {progress}")
+        report = f"📣 *Broadcast #{broadcast_id} finished*"
+    except asyncio.CancelledError:
+        # Shutdown - the checkpoint of the last full page stays "running"
+        raise
+    except Exception as e:
+        # Marked failed so the next start doesn't resume it over and over
+        logging.error(f"[Broadcast] #{broadcast_id} stopped: {e}")
+        try:
+            await loop.run_in_executor(None, finish_broadcast, broadcast_id, "failed")
+        except Exception as e:
+            logging.error(f"[Broadcast] #{broadcast_id} could not be marked failed: {e}")
+        report = f"⚠️ *Broadcast #{broadcast_id} stopped* after user id {progress['last_user_id']}"
+    finally:
+        for task in workers:
+            task.cancel()
+        active.pop(broadcast_id, None)
+
+    try:
+        await bot.send_message(
+            ADMIN_TELEGRAM_ID,
+            f"{report}\n\n"
+            f"✅ Delivered: {progress['delivered']}\n"
+            f"🚫 Blocked: {progress['blocked']}\n"
+            f"❌ Failed: {progress['failed']}",
+            parse_mode="Markdown"
+        )
+    except TelegramError as e:
+        logging.error(f"[Broadcast] #{broadcast_id} report not sent: {e}")
+
+# ============================================================================
+# ENTRY POINTS
+# ============================================================================
+
+async def start_broadcast(bot, message: str) -> tuple:
+    """Create a broadcast and start sending it. Returns (id, task)."""
+    row = await asyncio.get_running_loop().run_in_executor(None, create_broadcast, message)
+    return row["id"], asyncio.create_task(run_broadcast(bot, row))
+
+async def resume_broadcasts(bot) -> list:
+    """Restart broadcasts interrupted by a shutdown. Returns their tasks."""
+    rows = await asyncio.get_running_loop().run_in_executor(None, get_running_broadcasts)
+    return [asyncio.create_task(run_broadcast(bot, row)) for row in rows]
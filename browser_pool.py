@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+HEADLESS BROWSER POOL
+
+Some stores (Trendyol, AliExpress, Target) build their search pages with
+JavaScript, so neither CSE snippets nor a plain HTTP fetch see the
+products. Launching Chrome takes seconds, so a few headless browsers are
+kept warm and lent out one page at a time:
+
+- a browser is retired after BROWSER_MAX_PAGES pages (Chrome's memory
+  only grows) or after any error, and replaced lazily
+- every page has a deadline (BROWSER_PAGE_DEADLINE) covering the load and
+  the wait for the store's product grid
+- everything here is blocking and runs in executor threads, never on the
+  event loop
+
+selenium / undetected-chromedriver are only imported when the first
+browser is launched.
+"""
+
+import time
+import queue
+import logging
+import threading
+from config import (
+    BROWSER_POOL_SIZE, BROWSER_MAX_PAGES, BROWSER_PAGE_DEADLINE, BROWSER_UNDETECTED, BROWSER_WINDOW
+)
+
+class BrowserUnavailable(Exception):
+    """No browser could be borrowed or launched in time"""
+
+def _launch():
+    """Start one headless Chrome"""
+    if BROWSER_UNDETECTED:
+        import undetected_chromedriver as uc
+        options = uc.ChromeOptions()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")  # the service runs as root
+        options.add_argument(f"--window-size={BROWSER_WINDOW}")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        return uc.Chrome(options=options)
+
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument(f"--window-size={BROWSER_WINDOW}")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    # Return from get() at DOMContentLoaded; the product grid is waited for separately
+    options.page_load_strategy = "eager"
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+
+class BrowserWorker:
+    """One warm browser and the number of pages it has rendered"""
+
+    def __init__(self, launch=_launch):
+        started = time.perf_counter()
+        self.driver = launch()
+        self.pages = 0
+        logging.info(f"[Browser] Launched in {time.perf_counter() - started:.1f}s")
+
+    def render(self, url: str, ready_selector: str, deadline: float) -> str:
+        """
+        HTML of url once ready_selector matches, or as it is at the deadline
+        (a search without results never shows the product grid). Raises
+        WebDriverException when the page itself failed to load in time.
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        end = time.monotonic() + deadline
+        self.pages += 1
+        self.driver.set_page_load_timeout(max(1, deadline))
+        self.driver.get(url)
+        try:
+            WebDriverWait(self.driver, max(0.1, end - time.monotonic())).until(
+                expected_conditions.presence_of_element_located((By.CSS_SELECTOR, ready_selector))
+            )
+        except TimeoutException:
+            logging.info(f"[Browser] '{ready_selector}' not on the page after {deadline:.0f}s")
+        return self.driver.page_source
+
+    def close(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.warning(f"[Browser] quit failed: {e}")
+
+class BrowserPool:
+    """
+    Args:
+        size: browsers kept at most
+        max_pages: pages a browser renders before it is replaced
+        deadline: seconds per page (including waiting for a free browser)
+        launch: starts a driver (tests can pass their own)
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_pages: int = BROWSER_MAX_PAGES,
+                 deadline: float = BROWSER_PAGE_DEADLINE, launch=_launch):
+        self.size = size
+        self.max_pages = max_pages
+        self.deadline = deadline
+        self.launch = launch
+        self._idle = queue.LifoQueue()   # most recently used first - its caches are warm
+        self._slots = threading.Semaphore(size)
+        self._closed = False
+
+    def warm(self, count: int = None):
+        """Launch browsers ahead of the first search (blocking)"""
+        workers = []
+        for _ in range(count or self.size):
+            if not self._slots.acquire(blocking=False):
+                break
+            try:
+                workers.append(BrowserWorker(self.launch))
+            except Exception as e:
+                self._slots.release()
+                logging.error(f"[Browser] Launch failed: {e}")
+                break
+        for worker in workers:
+            # close() may have run while these were launching
+            if self._closed:
+                self._retire(worker)
+            else:
+                self._idle.put(worker)
+
+    def _borrow(self, timeout: float) -> BrowserWorker:
+        end = time.monotonic() + timeout
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            # Launch a new one if the pool isn't full, otherwise wait for a
+            # free one (or for a retired one's slot)
+            if self._slots.acquire(blocking=False):
+                try:
+                    return BrowserWorker(self.launch)
+                except Exception as e:
+                    self._slots.release()
+                    raise BrowserUnavailable(f"launch failed: {e}")
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise BrowserUnavailable("all browsers busy")
+            try:
+                return self._idle.get(timeout=min(0.25, remaining))
+            except queue.Empty:
+                continue
+
+    def _retire(self, worker: BrowserWorker):
+        worker.close()
+        self._slots.release()
+
+    def render(self, url: str, ready_selector: str, deadline: float = None) -> str:
+        """HTML of a page after its JavaScript ran. Raises BrowserUnavailable or the driver's error."""
+        if self._closed:
+            raise BrowserUnavailable("pool closed")
+        deadline = deadline or self.deadline
+        started = time.monotonic()
+        worker = self._borrow(deadline)
+        try:
+            html = worker.render(url, ready_selector, deadline - (time.monotonic() - started))
+        except BaseException:
+            # A timed-out browser may still be busy with the page - don't reuse it
+            self._retire(worker)
+            raise
+        if worker.pages >= self.max_pages or self._closed:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        return html
+
+    def close(self):
+        """Quit idle browsers (busy ones quit when they are returned)"""
+        self._closed = True
+        while True:
+            try:
+                self._retire(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+pool = BrowserPool()
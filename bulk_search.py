@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+BULK SEARCH
+
+A user sends a .txt or .csv file with one product per line (first column
+for CSV) and gets back one CSV comparing the best offers for all of
+them, instead of searching one message at a time.
+
+All credits are taken up front in one atomic update
+(charge_search_credits); queries that find nothing are refunded at the
+end. Queries run BULK_CONCURRENCY at a time through the normal search
+path, so the local index and the quota budget apply to them like to any
+other search - a long list from one user falls back to cached results
+once that user's daily share of quota is spent. Rows are written to the
+CSV as each query finishes and the status message shows the progress.
+Cells starting with = + - or @ are quoted with ' so spreadsheets don't
+run titles from the stores as formulas.
+"""
+
+import io
+import os
+import csv
+import time
+import asyncio
+import logging
+import tempfile
+from telegram.error import TelegramError
+from functions import charge_search_credits, refund_search_credits, log_bulk_queries
+from search_script import fetch_amazon
+import ranking
+from query_normalizer import query_key
+from config import BULK_CONCURRENCY, BULK_ROWS_PER_QUERY, BULK_PROGRESS_INTERVAL
+
+CSV_COLUMNS = ["query", "rank", "store", "title", "price", "price_usd", "link"]
+_HEADER_WORDS = {"query", "product", "products", "name", "item", "title", "search"}
+# First characters that make Excel/Sheets read a cell as a formula
+_FORMULA_CHARS = ("=", "+", "-", "@")
+
+# telegram_id of users with a bulk search running (one at a time each)
+running = set()
+
+def parse_queries(data: bytes, filename: str = "") -> list:
+    """Distinct queries from an uploaded text or CSV file, in file order"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("cp1252", errors="replace")
+
+    if filename.lower().endswith(".csv"):
+        try:
+            dialect = csv.Sniffer().sniff(text[:2048], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = (row[0] if row else "" for row in csv.reader(io.StringIO(text), dialect))
+    else:
+        rows = text.splitlines()
+
+    queries = []
+    seen = set()
+    for i, row in enumerate(rows):
+        query = " ".join(row.split())
+        if i == 0 and query.lower() in _HEADER_WORDS:
+            continue
+        key = query_key(query)
+        if len(query) < 3 or not key or key in seen:
+            continue
+        seen.add(key)
+        queries.append(query[:100])
+    return queries
+
+def _cell(value: str) -> str:
+    """A text cell that spreadsheets show as text, never as a formula"""
+    return "'" + value if value.startswith(_FORMULA_CHARS) else value
+
+def _csv_rows(query: str, results: list) -> list:
+    """The best-ranked BULK_ROWS_PER_QUERY offers (unpriced ones last)"""
+    ranked = [results[i] for i in ranking.rank(results, query)[:BULK_ROWS_PER_QUERY]]
+    return [
+        [_cell(query), rank, _cell(r["site"]), _cell(r["title"]), _cell(r["price"]),
+         f"{r['price_value']:.2f}" if r["price_value"] < 999999 else "", _cell(r["link"])]
+        for rank, r in enumerate(ranked, 1)
+    ]
+
+async def run_bulk(bot, telegram_id: int, queries: list, site: str, status, progress: dict) -> int:
+    """
+    Search every query and send the comparison CSV. Returns how many
+    queries found nothing.
+
+    Args:
+        status: the message edited with progress (and the summary at the end)
+        progress: updated with "found" (queries with results so far), so a
+            cancelled run knows which credits were used
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    started = time.monotonic()
+
+    async def search(query):
+        async with semaphore:
+            try:
+                return query, await loop.run_in_executor(None, fetch_amazon, query, site, telegram_id)
+            except Exception as e:
+                logging.error(f"[Bulk] '{query}' failed: {e}")
+                return query, []
+
+    fd, path = tempfile.mkstemp(prefix="indicome_bulk_", suffix=".csv")
+    found = 0
+    try:
+        # utf-8-sig so Excel shows ₼ and non-English titles correctly
+        with os.fdopen(fd, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            last_edit = 0.0
+            done = 0
+            for next_done in asyncio.as_completed([search(q) for q in queries]):
+                query, results = await next_done
+                done += 1
+                if results:
+                    found += 1
+                    progress["found"] = found
+                    writer.writerows(_csv_rows(query, results))
+                    f.flush()
+
+                now = time.monotonic()
+                if done < len(queries) and now - last_edit >= BULK_PROGRESS_INTERVAL:
+                    last_edit = now
+                    try:
+                        await status.edit_text(f"📄 Bulk search: {done}/{len(queries)} done, {found} with results...")
+                    except TelegramError:
+                        pass
+
+        missing = len(queries) - found
+        summary = (
+            f"✅ Bulk search done in {time.monotonic() - started:.0f}s\n\n"
+            f"🔍 Queries: {len(queries)}\n"
+            f"🎯 With results: {found}"
+            + (f"\n💰 Refunded: {missing} credits (no results)" if missing else "")
+        )
+        await status.edit_text(summary)
+        with open(path, "rb") as f:
+            await bot.send_document(
+                telegram_id, f, filename=f"indicome_bulk_{len(queries)}.csv",
+                caption=f"📊 Best {BULK_ROWS_PER_QUERY} offers per product"
+            )
+        logging.info(f"[Bulk] {telegram_id}: {found}/{len(queries)} queries with results")
+    finally:
+        os.remove(path)
+
+    try:
+        await loop.run_in_executor(None, log_bulk_queries, telegram_id, queries, site)
+    except Exception as e:
+        logging.error(f"[Bulk] Failed to log queries: {e}")
+    return missing
+
+async def start_bulk(bot, telegram_id: int, queries: list, site: str, status) -> bool:
+    """
+    Charge the credits and run the bulk search. False when credits are
+    short. If the CSV can't be delivered every credit is given back.
+    """
+    loop = asyncio.get_running_loop()
+    running.add(telegram_id)
+    try:
+        balance = await loop.run_in_executor(None, charge_search_credits, telegram_id, len(queries))
+        if balance is None:
+            return False
+        progress = {"found": 0}
+        try:
+            refund = await run_bulk(bot, telegram_id, queries, site, status, progress)
+        except asyncio.CancelledError:
+            # Bot shutting down mid-list: give back what didn't find results yet
+            refund = len(queries) - progress["found"]
+            logging.warning(f"[Bulk] {telegram_id}: cancelled, refunding {refund} credits")
+            if refund:
+                await loop.run_in_executor(None, refund_search_credits, telegram_id, refund)
+            raise
+        except Exception as e:
+            logging.error(f"[Bulk] {telegram_id}: failed, refunding {len(queries)} credits: {e}")
+            refund = len(queries)
+        if refund:
+            await loop.run_in_executor(None, refund_search_credits, telegram_id, refund)
+        return True
+    finally:
+        running.discard(telegram_id)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+CIRCUIT BREAKERS AND ADAPTIVE TIMEOUTS
+
+A breaker opens after repeated failures of an upstream (a provider or a
+single API key) and fails requests instantly while open. After a cool-down
+it lets one probe request through (half-open): success closes it, failure
+re-opens it with a longer cool-down.
+
+Timeouts are derived from observed latency instead of a fixed 15 seconds.
+"""
+
+import time
+import logging
+import threading
+from config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_MAX_RESET_TIMEOUT,
+    TIMEOUT_PERCENTILE, TIMEOUT_MULTIPLIER, TIMEOUT_MIN, TIMEOUT_MAX, HEDGE_MIN_SAMPLES
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """
+    Args:
+        name: for logs, e.g. "google:API 1"
+        failure_threshold: consecutive failures that open the breaker
+        reset_timeout: seconds to stay open before the first probe
+        max_reset_timeout: cap for the cool-down, which doubles on every failed probe
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT,
+                 max_reset_timeout: float = BREAKER_MAX_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self._state = CLOSED
+        self._failures = 0
+        self._cooldown = reset_timeout
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self._cooldown:
+                return HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """True if a request may go upstream now (claims the probe when half-open)"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self._cooldown:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logging.info(f"[Breaker] {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._cooldown = self.reset_timeout
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open(min(self._cooldown * 2, self.max_reset_timeout))
+                return
+            self._failures += 1
+            if self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+
+    def release(self):
+        """Give back a half-open probe that ended without a verdict (e.g. cancelled)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def trip(self):
+        """Open immediately (e.g. quota exhausted - retrying won't help)"""
+        with self._lock:
+            if self._state == OPEN:
+                return
+            cooldown = self._cooldown * 2 if self._state == HALF_OPEN else self.reset_timeout
+            self._open(min(cooldown, self.max_reset_timeout))
+
+    def _open(self, cooldown: float):
+        self._state = OPEN
+        self._cooldown = cooldown
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        logging.warning(f"[Breaker] {self.name} open for {cooldown:.0f}s")
+
+def adaptive_timeout(latency) -> float:
+    """
+    Request timeout from a LatencyTracker: a multiple of the observed
+    p95, clamped to [TIMEOUT_MIN, TIMEOUT_MAX]. TIMEOUT_MAX until there
+    are enough samples.
+    """
+    if len(latency) < HEDGE_MIN_SAMPLES:
+        return TIMEOUT_MAX
+    observed = latency.percentile(TIMEOUT_PERCENTILE) * TIMEOUT_MULTIPLIER
+    return max(TIMEOUT_MIN, min(TIMEOUT_MAX, observed))
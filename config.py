@@ -85,3 +85,217 @@ GOOGLE_API_KEYS = [
 GOOGLE_API_KEY = GOOGLE_API_KEYS[0]["api_key"]
 GOOGLE_SEARCH_ENGINE_ID = GOOGLE_API_KEYS[0]["search_engine_id"]
 
+
+# ============================================================================
+# PAYMENT RECONCILIATION
+# ============================================================================
+
+PAYMENT_RECONCILE_INTERVAL = 10      # Seconds between scans of pending payments
+PAYMENT_RECONCILE_BATCH = 50         # Pending payments fetched per page
+PAYMENT_RECONCILE_CONCURRENCY = 5    # Parallel PayPal lookups per batch
+PAYMENT_RECHECK_MAX_DELAY = 300      # Max backoff (seconds) for a not-yet-approved payment
+PAYMENT_EXPIRE_HOURS = 3             # PayPal approval links expire after 3 hours
+
+# ============================================================================
+# PAYPAL WEBHOOKS
+# ============================================================================
+
+PAYPAL_WEBHOOK_ENABLED = False       # Needs PAYPAL_WEBHOOK_ID - the receiver won't start without it
+PAYPAL_WEBHOOK_ID = ""               # Webhook ID from the PayPal developer dashboard
+PAYPAL_WEBHOOK_HOST = "0.0.0.0"
+PAYPAL_WEBHOOK_PORT = 8080
+PAYPAL_WEBHOOK_PATH = "/paypal/webhook"
+PAYPAL_WEBHOOK_MAX_BYTES = 64_000    # PayPal events are a few KB
+
+# ============================================================================
+# WARM-START SNAPSHOT
+# ============================================================================
+
+SNAPSHOT_PATH = "data/bot_state.snapshot"
+SNAPSHOT_INTERVAL = 60               # Seconds between periodic snapshots
+SNAPSHOT_MAX_AGE = 6 * 3600          # Ignore snapshots older than this on boot
+
+# ============================================================================
+# LOCAL PRODUCT INDEX
+# ============================================================================
+
+PRODUCT_INDEX_PATH = "data/products.db"
+PRODUCT_INDEX_MAX_AGE = 24 * 3600        # Products older than this don't answer searches
+PRODUCT_INDEX_MIN_RESULTS = 3            # Go upstream when the index has fewer fresh hits
+PRODUCT_INDEX_RETENTION = 30 * 24 * 3600 # Delete products not seen for this long
+
+# ============================================================================
+# HEDGED SEARCH (Google CSE primary, DuckDuckGo secondary)
+# ============================================================================
+
+HEDGE_ENABLED = True
+HEDGE_PERCENTILE = 90                # Hedge when the primary is slower than its p90
+HEDGE_DEFAULT_DELAY = 3.0            # Seconds, until enough latency samples exist
+HEDGE_MIN_SAMPLES = 20
+
+# ============================================================================
+# CIRCUIT BREAKERS AND TIMEOUTS
+# ============================================================================
+
+BREAKER_FAILURE_THRESHOLD = 3        # Consecutive failures before a breaker opens
+BREAKER_RESET_TIMEOUT = 30           # Seconds open before the first half-open probe
+BREAKER_MAX_RESET_TIMEOUT = 600      # Cool-down doubles per failed probe up to this
+TIMEOUT_PERCENTILE = 95              # Request timeout = p95 latency x multiplier...
+TIMEOUT_MULTIPLIER = 2.0
+TIMEOUT_MIN = 2.0                    # ...clamped to [TIMEOUT_MIN, TIMEOUT_MAX] seconds
+TIMEOUT_MAX = 15.0
+
+# ============================================================================
+# ADAPTIVE QUERY PLANNER ("all sites" grouping)
+# ============================================================================
+
+PLANNER_TARGET_PER_SITE = 2          # Usable products wanted from each site
+PLANNER_MIN_SAMPLES = 5              # CSE calls per site before its yield is trusted
+PLANNER_MIN_YIELD = 0.1              # Below this a site only gets a single slot
+PLANNER_REFRESH_SECONDS = 3600       # Recompute the plan this often
+PLANNER_MAX_RESULTS = 10             # CSE max results per call
+
+# ============================================================================
+# DAILY QUOTA BUDGET
+# ============================================================================
+
+QUOTA_PER_KEY = 100                  # Free CSE requests per API key per day
+QUOTA_BURST = 15                     # Requests we may run ahead of the even pace
+QUOTA_COLLAPSE_MARGIN = 15           # Further ahead than this -> prefer index results
+QUOTA_RESERVE = 5                    # Stop upstream calls when this few remain
+QUOTA_PER_USER_DAILY = 30            # Users past this are served from the index first
+QUOTA_CACHE_MAX_AGE = 7 * 24 * 3600  # Index results accepted in CACHE_FIRST mode
+
+# ============================================================================
+# STALE-WHILE-REVALIDATE
+# ============================================================================
+
+SWR_REFRESH_ATTEMPTS = 5             # Background refresh tries per stale query...
+SWR_REFRESH_DELAY = 60               # ...this many seconds apart (waits out breakers)
+
+# ============================================================================
+# CSE REQUESTS
+# ============================================================================
+
+CSE_FIELDS = "items(title,link,snippet)"   # Partial response: what _parse_search_items reads
+CSE_USER_AGENT = "Indicome/1.0 (gzip)"
+
+# ============================================================================
+# OFF-PEAK PRE-WARMING
+# ============================================================================
+
+PREWARM_ENABLED = True
+PREWARM_WINDOW = 3600                # Spend leftover quota in the last hour before the reset
+PREWARM_HISTORY_DAYS = 7             # Popularity is counted over this much search_history
+PREWARM_TOP_N = 50                   # Most popular (query, site) pairs to refresh
+PREWARM_SKIP_AGE = 6 * 3600          # Don't refresh site groups fetched more recently
+PREWARM_CHECK_INTERVAL = 60
+
+# ============================================================================
+# AUTOCOMPLETE
+# ============================================================================
+
+AUTOCOMPLETE_TOP_K = 8               # Completions kept per trie node
+AUTOCOMPLETE_HISTORY_DAYS = 90       # search_history loaded into the trie at startup
+AUTOCOMPLETE_MIN_WEIGHT = 3          # Searches before a query is suggested as "did you mean"
+
+# ============================================================================
+# INLINE MODE
+# ============================================================================
+
+INLINE_DEBOUNCE = 0.4                # Seconds without a newer keystroke before answering
+INLINE_CACHE_TIME = 300              # Telegram caches an inline answer this long
+INLINE_MAX_RESULTS = 10              # Indexed products shown per inline answer
+
+# ============================================================================
+# OUTBOUND FLOOD CONTROL
+# ============================================================================
+
+FLOOD_GLOBAL_RATE = 25               # Bot API requests/second overall (Telegram allows ~30)
+FLOOD_CHAT_INTERVAL = 1.0            # Seconds between messages to one private chat
+FLOOD_GROUP_INTERVAL = 3.0           # Seconds between messages to one group (20/minute)
+FLOOD_MAX_RETRIES = 3                # RetryAfter retries before giving up
+
+# ============================================================================
+# BROADCASTS
+# ============================================================================
+
+BROADCAST_RATE = 15                  # Messages/second (leaves room for search replies)
+BROADCAST_WORKERS = 8
+BROADCAST_PAGE_SIZE = 200            # Users per page; progress is checkpointed per page
+
+# ============================================================================
+# PRICE WATCH
+# ============================================================================
+
+PRICE_WATCH_ENABLED = True
+PRICE_WATCH_INTERVAL = 6 * 3600      # Seconds between re-checks of watched searches
+PRICE_WATCH_MAX_FETCHES = 40         # Distinct searches re-fetched per round at most
+PRICE_WATCH_MAX_RENDERS = 10         # Storefront searches (browser, no quota) per round at most
+PRICE_WATCH_PER_USER = 5             # Active watches per user
+
+# ============================================================================
+# PRICE HISTORY
+# ============================================================================
+
+PRICE_HISTORY_PATH = "data/price_history.bin"
+PRICE_HISTORY_MIN_INTERVAL = 6 * 3600  # Unchanged prices are recorded at most this often
+PRICE_HISTORY_LOW_DAYS = 30            # "Lowest in N days" window
+
+# ============================================================================
+# PRICE ENRICHMENT
+# ============================================================================
+
+ENRICH_ENABLED = True
+ENRICH_MAX_CONNECTIONS = 10          # Product page requests in flight overall
+ENRICH_PER_DOMAIN = 2                # ... and per store
+ENRICH_TIMEOUT = 3                   # Seconds per page request
+ENRICH_DEADLINE = 4                  # Seconds a search waits for page prices
+ENRICH_MAX_BYTES = 1_500_000         # Page bytes read at most (JSON-LD sits in the head)
+ENRICH_CACHE_TTL = 6 * 3600          # Page prices are reused this long
+ENRICH_MISS_TTL = 24 * 3600          # Pages without a price aren't fetched again for this long
+ENRICH_USER_AGENT = "Mozilla/5.0 (compatible; Indicome/1.0)"
+
+# ============================================================================
+# HEADLESS BROWSERS
+# ============================================================================
+
+BROWSER_ENABLED = False              # Needs Chrome and chromedriver on the host
+BROWSER_POOL_SIZE = 2                # Warm Chrome instances (~300 MB each)
+BROWSER_MAX_PAGES = 50               # Pages before a browser is replaced
+BROWSER_PAGE_DEADLINE = 15           # Seconds per page, waiting for a browser included
+BROWSER_UNDETECTED = True            # undetected-chromedriver instead of plain selenium
+BROWSER_WINDOW = "1366,900"
+
+# ============================================================================
+# BULK SEARCH
+# ============================================================================
+
+BULK_MAX_QUERIES = 50                # Products per uploaded list
+BULK_MAX_FILE_BYTES = 100_000
+BULK_CONCURRENCY = 3                 # Queries searched at the same time
+BULK_ROWS_PER_QUERY = 5              # Best-ranked offers per product in the CSV
+BULK_PROGRESS_INTERVAL = 3           # Seconds between progress edits
+
+# ============================================================================
+# RESULT RANKING
+# ============================================================================
+
+RANK_WEIGHT_PRICE = 1.0              # Cheapest non-outlier offer gets the full weight
+RANK_WEIGHT_RELEVANCE = 1.5          # All query words in the title
+RANK_WEIGHT_STORE = 0.5              # Times the store's trust weight
+RANK_OUTLIER_PENALTY = 1.0           # Price outside the IQR fences
+RANK_OUTLIER_IQR = 1.5               # Fence distance in IQRs (of log prices)
+RANK_DEFAULT_STORE_WEIGHT = 0.7
+RANK_STORE_WEIGHTS = {               # By result "site" (lowercase)
+    "amazon": 1.0,
+    "bestbuy": 1.0,
+    "walmart": 0.95,
+    "target": 0.95,
+    "newegg": 0.9,
+    "umico": 0.9,
+    "ebay": 0.8,
+    "trendyol": 0.8,
+    "etsy": 0.75,
+    "aliexpress": 0.6
+}
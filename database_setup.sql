@@ -43,6 +43,40 @@ CREATE TABLE IF NOT EXISTS payments (
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Processed PayPal webhook events (dedup by event id)
+CREATE TABLE IF NOT EXISTS paypal_webhook_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    payment_id TEXT,
+    received_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Admin broadcasts, with a checkpoint (last users.id done) to resume after restarts
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id BIGSERIAL PRIMARY KEY,
+    message TEXT NOT NULL,
+    status TEXT DEFAULT 'running',
+    last_user_id BIGINT DEFAULT 0,
+    delivered INT DEFAULT 0,
+    blocked INT DEFAULT 0,
+    failed INT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+-- Price watches: notify a user when a search's lowest price reaches their target
+CREATE TABLE IF NOT EXISTS price_watches (
+    id BIGSERIAL PRIMARY KEY,
+    telegram_id BIGINT NOT NULL,
+    query TEXT NOT NULL,
+    site TEXT NOT NULL DEFAULT 'all',
+    target_price DECIMAL(10, 2) NOT NULL,
+    last_price DECIMAL(10, 2),
+    active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT NOW(),
+    checked_at TIMESTAMP
+);
+
 -- ============================================================================
 -- INDEXES FOR PERFORMANCE
 -- ============================================================================
@@ -50,9 +84,107 @@ CREATE TABLE IF NOT EXISTS payments (
 CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_messages_telegram_id ON messages(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_search_history_telegram_id ON search_history(telegram_id);
+CREATE INDEX IF NOT EXISTS idx_search_history_created_at ON search_history(created_at);
 CREATE INDEX IF NOT EXISTS idx_payments_telegram_id ON payments(telegram_id);
 CREATE INDEX IF NOT EXISTS idx_payments_payment_id ON payments(payment_id);
 CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
+CREATE INDEX IF NOT EXISTS idx_price_watches_active ON price_watches(active, id);
+CREATE INDEX IF NOT EXISTS idx_price_watches_telegram_id ON price_watches(telegram_id);
+
+-- ============================================================================
+-- FUNCTIONS
+-- ============================================================================
+
+-- Complete a pending payment and credit the user in one transaction.
+-- Idempotent: only a row still in 'pending' is completed, so calling it
+-- again for the same payment_id credits nothing and returns no rows.
+CREATE OR REPLACE FUNCTION complete_payment(p_payment_id TEXT, p_payer_id TEXT)
+RETURNS TABLE (telegram_id BIGINT, credits INT, search_credits INT)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_telegram_id BIGINT;
+    v_credits INT;
+BEGIN
+    UPDATE payments
+       SET status = 'completed',
+           payer_id = COALESCE(p_payer_id, payments.payer_id),
+           updated_at = NOW()
+     WHERE payments.payment_id = p_payment_id
+       AND payments.status = 'pending'
+    RETURNING payments.telegram_id, payments.credits
+         INTO v_telegram_id, v_credits;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    UPDATE users
+       SET search_credits = users.search_credits + v_credits
+     WHERE users.telegram_id = v_telegram_id
+    RETURNING users.telegram_id, v_credits, users.search_credits;
+END;
+$$;
+
+-- Atomically add search credits to a user, returns the new balance
+CREATE OR REPLACE FUNCTION add_search_credits(p_telegram_id BIGINT, p_credits INT)
+RETURNS TABLE (username TEXT, search_credits INT)
+LANGUAGE sql
+AS $$
+    UPDATE users
+       SET search_credits = users.search_credits + p_credits
+     WHERE users.telegram_id = p_telegram_id
+    RETURNING users.username, users.search_credits;
+$$;
+
+-- Atomically take p_count search credits from a user (bulk searches pay up
+-- front). Returns the new balance, or no rows if the user has fewer credits.
+CREATE OR REPLACE FUNCTION charge_search_credits(p_telegram_id BIGINT, p_count INT)
+RETURNS TABLE (search_credits INT)
+LANGUAGE sql
+AS $$
+    UPDATE users
+       SET search_credits = users.search_credits - p_count,
+           search_count = users.search_count + p_count
+     WHERE users.telegram_id = p_telegram_id
+       AND users.search_credits >= p_count
+    RETURNING users.search_credits;
+$$;
+
+-- Give back p_count credits charged by charge_search_credits() for searches
+-- that found nothing - they no longer count as searches either.
+CREATE OR REPLACE FUNCTION refund_search_credits(p_telegram_id BIGINT, p_count INT)
+RETURNS TABLE (search_credits INT)
+LANGUAGE sql
+AS $$
+    UPDATE users
+       SET search_credits = users.search_credits + p_count,
+           search_count = GREATEST(users.search_count - p_count, 0)
+     WHERE users.telegram_id = p_telegram_id
+    RETURNING users.search_credits;
+$$;
+
+-- Record a PayPal webhook event and complete its payment in one transaction.
+-- A redelivered event (same event_id) is a no-op and returns no rows.
+CREATE OR REPLACE FUNCTION apply_paypal_event(
+    p_event_id TEXT, p_event_type TEXT, p_payment_id TEXT, p_payer_id TEXT
+)
+RETURNS TABLE (telegram_id BIGINT, credits INT, search_credits INT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO paypal_webhook_events (event_id, event_type, payment_id)
+    VALUES (p_event_id, p_event_type, p_payment_id)
+    ON CONFLICT (event_id) DO NOTHING;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY SELECT * FROM complete_payment(p_payment_id, p_payer_id);
+END;
+$$;
 
 -- ============================================================================
 -- NOTES
@@ -62,4 +194,10 @@ CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status);
 -- 3. Users can buy credits via PayPal
 -- 4. Credits never expire
 -- 5. Each search costs 1 credit
+-- 6. Pending payments are completed by payment_worker.py via complete_payment()
+-- 7. PayPal webhooks (paypal_webhook.py) complete payments via apply_paypal_event()
+-- 8. Broadcasts (broadcast.py) walk users by id and checkpoint in broadcasts.last_user_id
+-- 9. Price watches are re-checked by price_watch.py, one fetch per distinct query and site
+-- 10. Bulk searches (bulk_search.py) charge all their credits up front via charge_search_credits()
+--     and give back the credits of queries that found nothing via refund_search_credits()
 
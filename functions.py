@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from supabase_client import supabase
-import paypalrestsdk
+import re
 import logging
+import threading
 import requests
+from datetime import datetime, timezone
 from config import (
     PAYPAL_MODE, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET,
     PAYMENT_SUCCESS_URL, PAYMENT_CANCEL_URL, FREE_CREDITS_ON_SIGNUP,
@@ -13,17 +15,39 @@ from config import (
 # PAYPAL CONFIGURATION
 # ============================================================================
 
-# Configure PayPal SDK
-paypalrestsdk.configure({
-    "mode": PAYPAL_MODE,
-    "client_id": PAYPAL_CLIENT_ID,
-    "client_secret": PAYPAL_CLIENT_SECRET
-})
+_paypal_configured = False
+_admin_bot = None
+_init_lock = threading.Lock()
+
+def get_paypal():
+    """Import and configure the PayPal SDK on first use"""
+    global _paypal_configured
+    import paypalrestsdk
+    if not _paypal_configured:
+        with _init_lock:
+            if not _paypal_configured:
+                paypalrestsdk.configure({
+                    "mode": PAYPAL_MODE,
+                    "client_id": PAYPAL_CLIENT_ID,
+                    "client_secret": PAYPAL_CLIENT_SECRET
+                })
+                _paypal_configured = True
+    return paypalrestsdk
 
 # ============================================================================
 # ADMIN NOTIFICATION FUNCTIONS
 # ============================================================================
 
+def get_admin_bot():
+    """Shared telegram Bot for the admin notification bot, created on first use"""
+    global _admin_bot
+    if _admin_bot is None:
+        from telegram import Bot
+        with _init_lock:
+            if _admin_bot is None:
+                _admin_bot = Bot(ADMIN_BOT_TOKEN)
+    return _admin_bot
+
 def send_admin_notification(message: str):
     """Send notification to admin via Telegram"""
     try:
@@ -87,17 +111,16 @@ def increment_search_count(telegram_id: int, count: int = 1):
         }).eq("telegram_id", telegram_id).execute()
 
 def add_search_credits(telegram_id: int, credits: int):
-    """Add search credits to user account"""
+    """Add search credits to user account (atomic increment in the database)"""
     try:
-        user_info = get_user_info(telegram_id)
-        if user_info:
-            current_credits = user_info.get("search_credits", 0)
-            new_credits = current_credits + credits
-            username = user_info.get('username', 'Unknown')
-            
-            supabase.table("users").update({
-                "search_credits": new_credits
-            }).eq("telegram_id", telegram_id).execute()
+        result = supabase.rpc("add_search_credits", {
+            "p_telegram_id": telegram_id,
+            "p_credits": credits
+        }).execute()
+        
+        if result.data:
+            new_credits = result.data[0].get("search_credits", 0)
+            username = result.data[0].get('username', 'Unknown')
             
             logging.info(f"Added {credits} search credits to user {telegram_id}")
             
@@ -116,6 +139,21 @@ def add_search_credits(telegram_id: int, credits: int):
         logging.error(f"Error adding search credits: {e}")
         return False
 
+def charge_search_credits(telegram_id: int, count: int):
+    """Take count credits in one atomic update. Returns the new balance, or None if there weren't enough."""
+    result = supabase.rpc("charge_search_credits", {
+        "p_telegram_id": telegram_id,
+        "p_count": count
+    }).execute()
+    return result.data[0]["search_credits"] if result.data else None
+
+def refund_search_credits(telegram_id: int, count: int):
+    """Give back credits of charged searches that found nothing, uncounting them (no admin notification)"""
+    supabase.rpc("refund_search_credits", {
+        "p_telegram_id": telegram_id,
+        "p_count": count
+    }).execute()
+
 def get_available_searches(telegram_id: int) -> int:
     """Get available search credits for a user"""
     user_info = get_user_info(telegram_id)
@@ -150,6 +188,26 @@ def log_search_query(telegram_id: int, query: str):
         f"💰 Qalan kreditlər: {credits_left}"
     )
 
+# bot_final logs searches as "<query> [<site>]"
+_SITE_SUFFIX_RE = re.compile(r"^(.*?)\s*\[([^\]]*)\]\s*$")
+
+def split_logged_query(logged: str):
+    """(query, site) from a search_history row - site as fetch_google_shopping takes it"""
+    m = _SITE_SUFFIX_RE.match(logged)
+    if not m:
+        return logged.strip(), "all"
+    query, site = m.group(1), m.group(2)
+    if site.startswith("custom:"):
+        site = site[len("custom:"):]
+    return query, site
+
+def get_search_history(since: str, after_id: int = 0, limit: int = 1000) -> list:
+    """Fetch a page of searches logged since an ISO timestamp (keyset pagination on id)"""
+    result = supabase.table("search_history").select(
+        "id", "query", "created_at"
+    ).gte("created_at", since).gt("id", after_id).order("id").limit(limit).execute()
+    return result.data or []
+
 def convert_price_to_usd(raw_price: str) -> str:
     """Convert various currency formats to USD"""
     try:
@@ -193,7 +251,7 @@ def create_paypal_payment(telegram_id: int, amount: float, credits: int = 0, des
         item_sku = f"credits_{credits}"
         item_desc = description or f"{credits} product searches"
         
-        payment = paypalrestsdk.Payment({
+        payment = get_paypal().Payment({
             "intent": "sale",
             "payer": {
                 "payment_method": "paypal"
@@ -263,15 +321,11 @@ def execute_paypal_payment(payment_id: str, payer_id: str) -> bool:
     Returns True if successful, False otherwise
     """
     try:
-        payment = paypalrestsdk.Payment.find(payment_id)
+        payment = get_paypal().Payment.find(payment_id)
         
         if payment.execute({"payer_id": payer_id}):
-            # Update payment status in database
-            supabase.table("payments").update({
-                "status": "completed",
-                "payer_id": payer_id
-            }).eq("payment_id", payment_id).execute()
-            
+            # Mark completed and credit the user (no-op if already done)
+            complete_payment(payment_id, payer_id)
             return True
         else:
             logging.error(f"PayPal payment execution failed: {payment.error}")
@@ -280,3 +334,173 @@ def execute_paypal_payment(payment_id: str, payer_id: str) -> bool:
     except Exception as e:
         logging.error(f"PayPal execution error: {e}")
         return False
+
+def get_pending_payments(after_id: int = 0, limit: int = 50) -> list:
+    """Fetch a page of pending payments (keyset pagination on id, uses idx_payments_status)"""
+    result = supabase.table("payments").select(
+        "id", "telegram_id", "payment_id", "credits", "created_at"
+    ).eq("status", "pending").gt("id", after_id).order("id").limit(limit).execute()
+    return result.data or []
+
+def set_payment_status(payment_id: str, status: str) -> bool:
+    """Move a pending payment to a final status (failed, expired). Returns True if it changed."""
+    result = supabase.table("payments").update({
+        "status": status
+    }).eq("payment_id", payment_id).eq("status", "pending").execute()
+    return bool(result.data)
+
+def complete_payment(payment_id: str, payer_id: str = None):
+    """
+    Mark a pending payment completed and add its credits, atomically
+    
+    Safe to call any number of times for the same payment_id - only the
+    first call credits the user.
+    
+    Returns:
+        dict with telegram_id, credits and search_credits, or None if the
+        payment was not pending (already completed, unknown, or failed)
+    """
+    try:
+        result = supabase.rpc("complete_payment", {
+            "p_payment_id": payment_id,
+            "p_payer_id": payer_id
+        }).execute()
+    except Exception as e:
+        logging.error(f"Error completing payment {payment_id}: {e}")
+        return None
+    
+    if not result.data:
+        return None
+    
+    credited = result.data[0]
+    _notify_payment_completed(payment_id, credited)
+    return credited
+
+def apply_paypal_event(event_id: str, event_type: str, payment_id: str, payer_id: str = None):
+    """
+    Record a PayPal webhook event and complete its payment, atomically
+    
+    A redelivered event (same event_id) or an already completed payment
+    credits nothing.
+    
+    Returns:
+        dict with telegram_id, credits and search_credits, or None
+    """
+    result = supabase.rpc("apply_paypal_event", {
+        "p_event_id": event_id,
+        "p_event_type": event_type,
+        "p_payment_id": payment_id,
+        "p_payer_id": payer_id
+    }).execute()
+    
+    if not result.data:
+        return None
+    
+    credited = result.data[0]
+    _notify_payment_completed(payment_id, credited)
+    return credited
+
+def _notify_payment_completed(payment_id: str, credited: dict):
+    logging.info(f"Payment {payment_id} completed: +{credited['credits']} credits for user {credited['telegram_id']}")
+    
+    send_admin_notification(
+        f"✅ <b>Ödəniş Tamamlandı</b>\n\n"
+        f"🆔 ID: <code>{credited['telegram_id']}</code>\n"
+        f"➕ Əlavə edilən: {credited['credits']} kredit\n"
+        f"💰 Yeni balans: {credited['search_credits']} kredit\n"
+        f"📝 Payment ID: <code>{payment_id}</code>"
+    )
+
+# ============================================================================
+# BROADCAST FUNCTIONS
+# ============================================================================
+
+def get_users_page(after_id: int = 0, limit: int = 100) -> list:
+    """Fetch a page of users (keyset pagination on id)"""
+    result = supabase.table("users").select(
+        "id", "telegram_id"
+    ).gt("id", after_id).order("id").limit(limit).execute()
+    return result.data or []
+
+def create_broadcast(message: str) -> dict:
+    result = supabase.table("broadcasts").insert({"message": message}).execute()
+    return result.data[0]
+
+def get_running_broadcasts() -> list:
+    """Broadcasts interrupted by a restart, to resume from their checkpoint"""
+    result = supabase.table("broadcasts").select("*").eq("status", "running").order("id").execute()
+    return result.data or []
+
+def save_broadcast_progress(broadcast_id: int, last_user_id: int, delivered: int, blocked: int, failed: int):
+    supabase.table("broadcasts").update({
+        "last_user_id": last_user_id,
+        "delivered": delivered,
+        "blocked": blocked,
+        "failed": failed
+    }).eq("id", broadcast_id).execute()
+
+def finish_broadcast(broadcast_id: int, status: str = "done"):
+    supabase.table("broadcasts").update({
+        "status": status,
+        "finished_at": datetime.now(timezone.utc).isoformat()
+    }).eq("id", broadcast_id).execute()
+
+# ============================================================================
+# PRICE WATCH FUNCTIONS
+# ============================================================================
+
+def add_price_watch(telegram_id: int, query: str, site: str, target_price: float, last_price: float = None) -> dict:
+    result = supabase.table("price_watches").insert({
+        "telegram_id": telegram_id,
+        "query": query,
+        "site": site,
+        "target_price": round(target_price, 2),
+        "last_price": last_price
+    }).execute()
+    return result.data[0]
+
+def get_user_watches(telegram_id: int) -> list:
+    result = supabase.table("price_watches").select("*").eq(
+        "telegram_id", telegram_id
+    ).eq("active", True).order("id").execute()
+    return result.data or []
+
+def cancel_price_watch(telegram_id: int, watch_id: int) -> bool:
+    result = supabase.table("price_watches").update({
+        "active": False
+    }).eq("id", watch_id).eq("telegram_id", telegram_id).execute()
+    return bool(result.data)
+
+def get_active_watches(after_id: int = 0, limit: int = 500) -> list:
+    """Fetch a page of active watches (keyset pagination on id, uses idx_price_watches_active)"""
+    result = supabase.table("price_watches").select(
+        "id", "telegram_id", "query", "site", "target_price", "last_price"
+    ).eq("active", True).gt("id", after_id).order("id").limit(limit).execute()
+    return result.data or []
+
+def update_watches(watch_ids: list, last_price: float, active: bool = True):
+    """Record the latest lowest price for a group of watches (and close them once notified)"""
+    supabase.table("price_watches").update({
+        "last_price": last_price,
+        "active": active,
+        "checked_at": datetime.now(timezone.utc).isoformat()
+    }).in_("id", watch_ids).execute()
+
+# ============================================================================
+# BULK SEARCH FUNCTIONS
+# ============================================================================
+
+def log_bulk_queries(telegram_id: int, queries: list, site: str):
+    """Log a bulk search's queries in one insert (with one admin notification)"""
+    supabase.table("search_history").insert([
+        {"telegram_id": telegram_id, "query": f"{query} [{site}]"} for query in queries
+    ]).execute()
+    
+    user_info = get_user_info(telegram_id)
+    username = user_info.get('username', 'Unknown') if user_info else 'Unknown'
+    send_admin_notification(
+        f"📄 <b>Toplu Axtarış</b>\n\n"
+        f"👤 İstifadəçi: @{username}\n"
+        f"🆔 ID: <code>{telegram_id}</code>\n"
+        f"📝 Sorğular: {len(queries)}"
+    )
@@ -2,7 +2,7 @@
 import logging
 import asyncio
 from collections import defaultdict
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, Bot
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler,
     ContextTypes, ConversationHandler, filters
@@ -13,9 +13,11 @@ from functions import (
     store_feedback, log_search_query, convert_price_to_usd,
     create_paypal_payment, execute_paypal_payment,
     add_search_credits, get_available_searches,
-    send_admin_notification
+    send_admin_notification, get_admin_bot
 )
 from search_script import fetch_ebay, fetch_walmart, fetch_amazon, fetch_trendyol, fetch_aliexpress, fetch_target
+from rendering import ResultTemplate, escape_markdown
+from outbound import FloodControl
 from config import BOT_TOKEN, CREDIT_PACKAGES
 
 # ============================================================================
@@ -34,68 +36,87 @@ MAIN_MENU, SIGNUP_USERNAME, LOGIN_USERNAME, GET_QUERY, GET_FEEDBACK = range(5)
 # MENU BUILDERS
 # ============================================================================
 
-def main_menu_buttons():
-    """Build main menu keyboard"""
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔍 Search Products", callback_data="search")],
-        [InlineKeyboardButton("💰 Buy Search Credits", callback_data="buy_credits")],
-        [InlineKeyboardButton("💬 Feedback", callback_data="feedback")],
-        [InlineKeyboardButton("🚪 Exit", callback_data="exit")]
-    ])
-
-async def show_search_results(update, context, products, query, filter_type="all"):
-    """Show search results with filter buttons"""
+# Keyboards are immutable, so they are built once and shared by every message
+
+MAIN_MENU_BUTTONS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔍 Search Products", callback_data="search")],
+    [InlineKeyboardButton("💰 Buy Search Credits", callback_data="buy_credits")],
+    [InlineKeyboardButton("💬 Feedback", callback_data="feedback")],
+    [InlineKeyboardButton("🚪 Exit", callback_data="exit")]
+])
+
+FILTER_BUTTONS = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("💰 Ucuzdan →", callback_data="filter_cheapest"),
+        InlineKeyboardButton("💎 ← Bahalıdan", callback_data="filter_expensive")
+    ],
+    [
+        InlineKeyboardButton("🏆 Top 3 Ucuz", callback_data="filter_top3_cheap"),
+        InlineKeyboardButton("🌟 Top 5 Ucuz", callback_data="filter_top5_cheap")
+    ],
+    [InlineKeyboardButton("📊 Hamısı", callback_data="filter_all")],
+    [InlineKeyboardButton("🔙 Ana Menyu", callback_data="back_to_menu")]
+])
+
+NO_CREDITS_BUTTONS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💰 Buy Credits", callback_data="buy_credits")],
+    [InlineKeyboardButton("🔙 Back", callback_data="back_to_menu")]
+])
+
+CREDIT_PACKAGES_BUTTONS = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(
+        f"{package['name']} - ${package['price']:.2f} (${package['price'] / package['credits']:.2f}/search)",
+        callback_data=f"buy_package_{key}"
+    )] for key, package in CREDIT_PACKAGES.items()]
+    + [[InlineKeyboardButton("🔙 Back to Menu", callback_data="back_to_menu")]]
+)
+
+FILTER_NAMES = {
+    "all": "Bütün nəticələr",
+    "cheapest": "Ucuzdan bahалıya",
+    "expensive": "Bahалıdan ucuza",
+    "top3_cheap": "Ən ucuz 3",
+    "top5_cheap": "Ən ucuz 5"
+}
+
+RESULTS_TEMPLATE = ResultTemplate(
+    item="{i}. 🌐 *{site}*\n   📦 {title}...\n   💰 *Qiymət:* {price}\n   [🔗 Məhsula Bax]({link})\n\n",
+    more="_...və daha {count} məhsul_\n\n",
+    footer="_Filter seçin:_",
+    title_width=60
+)
+
+async def show_search_results(update, context, products, query, filter_type="all", status=None, footer=None):
+    """Show search results with filter buttons (editing the status message when given)"""
     from search_script import filter_results
     
     # Filter results
-    filtered_products = filter_results(products, filter_type)
-    
-    # Create filter buttons
-    filter_buttons = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("💰 Ucuzdan →", callback_data=f"filter_cheapest"),
-            InlineKeyboardButton("💎 ← Bahalıdan", callback_data=f"filter_expensive")
-        ],
-        [
-            InlineKeyboardButton("🏆 Top 3 Ucuz", callback_data=f"filter_top3_cheap"),
-            InlineKeyboardButton("🌟 Top 5 Ucuz", callback_data=f"filter_top5_cheap")
-        ],
-        [InlineKeyboardButton("📊 Hamısı", callback_data=f"filter_all")],
-        [InlineKeyboardButton("🔙 Ana Menyu", callback_data="back_to_menu")]
-    ])
-    
-    # Filter name for display
-    filter_names = {
-        "all": "Bütün nəticələr",
-        "cheapest": "Ucuzdan bahалıya",
-        "expensive": "Bahалıdan ucuza",
-        "top3_cheap": "Ən ucuz 3",
-        "top5_cheap": "Ən ucuz 5"
-    }
-    
-    filter_display = filter_names.get(filter_type, "Bütün nəticələr")
+    filtered_products = filter_results(products, filter_type, query)
+    filter_display = FILTER_NAMES.get(filter_type, "Bütün nəticələr")
     
     # Build message
-    message = f"🔍 *Axtarış:* {query}\n"
-    message += f"📊 *Filter:* {filter_display}\n"
-    message += f"🎯 *Tapıldı:* {len(filtered_products)} məhsul\n\n"
-    
-    for i, product in enumerate(filtered_products[:10], 1):
-        message += f"{i}. 🌐 *{product['site']}*\n"
-        message += f"   📦 {product['title'][:60]}...\n"
-        message += f"   💰 *Qiymət:* {product['price']}\n"
-        message += f"   [🔗 Məhsula Bax]({product['link']})\n\n"
-    
-    if len(filtered_products) > 10:
-        message += f"_...və daha {len(filtered_products) - 10} məhsul_\n\n"
+    message = RESULTS_TEMPLATE.render(
+        f"🔍 *Axtarış:* {escape_markdown(query)}\n"
+        f"📊 *Filter:* {filter_display}\n"
+        f"🎯 *Tapıldı:* {len(filtered_products)} məhsul\n\n",
+        filtered_products,
+        footer=footer
+    )
     
-    message += "_Filter seçin:_"
+    if status is not None:
+        await status.edit_text(
+            message,
+            parse_mode="Markdown",
+            reply_markup=FILTER_BUTTONS,
+            disable_web_page_preview=True
+        )
+        return
     
     try:
         await update.message.reply_text(
             message,
             parse_mode="Markdown",
-            reply_markup=filter_buttons,
+            reply_markup=FILTER_BUTTONS,
             disable_web_page_preview=True
         )
     except:
@@ -104,7 +125,7 @@ async def show_search_results(update, context, products, query, filter_type="all
             chat_id=update.effective_chat.id,
             text=message,
             parse_mode="Markdown",
-            reply_markup=filter_buttons,
+            reply_markup=FILTER_BUTTONS,
             disable_web_page_preview=True
         )
 
@@ -158,7 +179,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
         status_msg,
         parse_mode="Markdown",
-        reply_markup=main_menu_buttons()
+        reply_markup=MAIN_MENU_BUTTONS
         )
         return MAIN_MENU
 
@@ -191,53 +212,22 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Show filtered results
         from search_script import filter_results
-        filtered = filter_results(saved_results, filter_type)
+        filtered = filter_results(saved_results, filter_type, saved_query)
         
-        # Filter names
-        filter_names = {
-            "all": "Bütün nəticələr",
-            "cheapest": "Ucuzdan bahалıya",
-            "expensive": "Bahалıdan ucuza",
-            "top3_cheap": "Ən ucuz 3",
-            "top5_cheap": "Ən ucuz 5"
-        }
-        
-        filter_display = filter_names.get(filter_type, "Bütün nəticələr")
-        
-        # Rebuild filter buttons
-        filter_buttons = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("💰 Ucuzdan →", callback_data="filter_cheapest"),
-                InlineKeyboardButton("💎 ← Bahalıdan", callback_data="filter_expensive")
-            ],
-            [
-                InlineKeyboardButton("🏆 Top 3 Ucuz", callback_data="filter_top3_cheap"),
-                InlineKeyboardButton("🌟 Top 5 Ucuz", callback_data="filter_top5_cheap")
-            ],
-            [InlineKeyboardButton("📊 Hamısı", callback_data="filter_all")],
-            [InlineKeyboardButton("🔙 Ana Menyu", callback_data="back_to_menu")]
-        ])
+        filter_display = FILTER_NAMES.get(filter_type, "Bütün nəticələr")
         
         # Build message
-        message = f"🔍 *Axtarış:* {saved_query}\n"
-        message += f"📊 *Filter:* {filter_display}\n"
-        message += f"🎯 *Göstərilir:* {len(filtered)} məhsul\n\n"
-        
-        for i, product in enumerate(filtered[:10], 1):
-            message += f"{i}. 🌐 *{product['site']}*\n"
-            message += f"   📦 {product['title'][:60]}...\n"
-            message += f"   💰 *Qiymət:* {product['price']}\n"
-            message += f"   [🔗 Məhsula Bax]({product['link']})\n\n"
-        
-        if len(filtered) > 10:
-            message += f"_...və daha {len(filtered) - 10} məhsul_\n\n"
-        
-        message += "_Filter seçin:_"
+        message = RESULTS_TEMPLATE.render(
+            f"🔍 *Axtarış:* {escape_markdown(saved_query)}\n"
+            f"📊 *Filter:* {filter_display}\n"
+            f"🎯 *Göstərilir:* {len(filtered)} məhsul\n\n",
+            filtered
+        )
         
         await query.edit_message_text(
             message,
             parse_mode="Markdown",
-            reply_markup=filter_buttons,
+            reply_markup=FILTER_BUTTONS,
             disable_web_page_preview=True
         )
         return MAIN_MENU
@@ -264,7 +254,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"👋 Welcome {username}\n"
             f"💰 Search Credits: {search_credits}",
             parse_mode="Markdown",
-            reply_markup=main_menu_buttons()
+            reply_markup=MAIN_MENU_BUTTONS
         )
         return MAIN_MENU
 
@@ -279,15 +269,6 @@ async def show_credits_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     telegram_id = query.from_user.id
     
-    # Build credit packages buttons
-    buttons = []
-    for key, package in CREDIT_PACKAGES.items():
-        price_per_search = package['price'] / package['credits']
-        button_text = f"{package['name']} - ${package['price']:.2f} (${price_per_search:.2f}/search)"
-        buttons.append([InlineKeyboardButton(button_text, callback_data=f"buy_package_{key}")])
-    
-    buttons.append([InlineKeyboardButton("🔙 Back to Menu", callback_data="back_to_menu")])
-
     user_info = get_user_info(telegram_id)
     current_credits = user_info.get('search_credits', 0) if user_info else 0
     
@@ -301,7 +282,7 @@ async def show_credits_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"💡 1 credit = 1 product search\n"
         f"💡 Credits never expire!",
         parse_mode="Markdown",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=CREDIT_PACKAGES_BUTTONS
     )
 
 async def handle_credits_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE, package_key: str):
@@ -312,7 +293,7 @@ async def handle_credits_purchase(update: Update, context: ContextTypes.DEFAULT_
     if package_key not in CREDIT_PACKAGES:
         await query.edit_message_text(
             "❌ Invalid package selected.",
-            reply_markup=main_menu_buttons()
+            reply_markup=MAIN_MENU_BUTTONS
         )
         return
     
@@ -353,13 +334,13 @@ async def handle_credits_purchase(update: Update, context: ContextTypes.DEFAULT_
         else:
             await query.edit_message_text(
                 "❌ Error creating payment. Please try again later.",
-                reply_markup=main_menu_buttons()
+                reply_markup=MAIN_MENU_BUTTONS
             )
     except Exception as e:
         logging.error(f"PayPal payment creation error: {e}")
         await query.edit_message_text(
             "❌ Error processing your request. Please try again.",
-        reply_markup=main_menu_buttons()
+        reply_markup=MAIN_MENU_BUTTONS
     )
 
 # ============================================================================
@@ -382,18 +363,13 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     search_credits = user_info.get("search_credits", 0)
     
     if search_credits <= 0:
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("💰 Buy Credits", callback_data="buy_credits")],
-            [InlineKeyboardButton("🔙 Back", callback_data="back_to_menu")]
-        ])
-        
         await update.message.reply_text(
             f"🛑 *No search credits!*\n\n"
             f"Your Credits: {search_credits}\n\n"
             f"💡 Buy credits to start searching.\n"
             f"   Starting from $2.99 for 5 searches!",
             parse_mode="Markdown",
-            reply_markup=buttons
+            reply_markup=NO_CREDITS_BUTTONS
         )
         return MAIN_MENU
 
@@ -401,7 +377,8 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❓ Please enter a valid product name (e.g., *iPhone 15*)", parse_mode="Markdown")
         return GET_QUERY
 
-    await update.message.reply_text(f"🔎 Searching for *{query}*...", parse_mode="Markdown")
+    # One status message per search, edited into the results
+    status = await update.message.reply_text(f"🔎 Searching for *{escape_markdown(query)}*...", parse_mode="Markdown")
     log_search_query(telegram_id, query)
 
     # Get products from Google (1 API call for ALL sites!)
@@ -409,26 +386,23 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     all_products = await loop.run_in_executor(None, fetch_amazon, query)
 
     if not all_products:
-        await update.message.reply_text("😔 Sorry, no results found.", reply_markup=main_menu_buttons())
+        await status.edit_text("😔 Sorry, no results found.", reply_markup=MAIN_MENU_BUTTONS)
         return MAIN_MENU
 
     # Save results to context for filtering
     context.user_data['search_results'] = all_products
     context.user_data['search_query'] = query
     
-    # Show results with filter buttons
-    await show_search_results(update, context, all_products, query, filter_type="all")
+    # Show results with filter buttons and the remaining credits
+    remaining_credits = search_credits - 1
+    await show_search_results(
+        update, context, all_products, query, filter_type="all", status=status,
+        footer=f"✅ Search complete! 💰 Remaining credits: {remaining_credits}\n\n{RESULTS_TEMPLATE.footer}"
+    )
 
     # Deduct 1 credit
     increment_search_count(telegram_id)
     
-    # Show remaining credits
-    remaining_credits = search_credits - 1
-    await update.message.reply_text(
-        f"✅ Search complete!\n💰 Remaining credits: {remaining_credits}",
-        reply_markup=main_menu_buttons()
-    )
-    
     return MAIN_MENU
 
 async def handle_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -441,9 +415,8 @@ async def handle_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store_feedback(telegram_id, feedback_text)
     
     # Send to admin via notification bot
-    from config import ADMIN_BOT_TOKEN, ADMIN_TELEGRAM_ID
+    from config import ADMIN_TELEGRAM_ID
     try:
-        admin_bot = Bot(ADMIN_BOT_TOKEN)
         notification_message = (
             f"💬 <b>Yeni Feedback!</b>\n\n"
             f"👤 İstifadəçi: @{username}\n"
@@ -451,7 +424,7 @@ async def handle_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📝 Ad: {first_name}\n\n"
             f"<b>Mesaj:</b>\n{feedback_text}"
         )
-        await admin_bot.send_message(
+        await get_admin_bot().send_message(
             chat_id=ADMIN_TELEGRAM_ID,
             text=notification_message,
             parse_mode='HTML'
@@ -459,7 +432,7 @@ async def handle_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logging.error(f"Failed to send feedback notification: {e}")
     
-    await update.message.reply_text("✅ Thank you for your feedback! We appreciate it.", reply_markup=main_menu_buttons())
+    await update.message.reply_text("✅ Thank you for your feedback! We appreciate it.", reply_markup=MAIN_MENU_BUTTONS)
     return MAIN_MENU
 
 # ============================================================================
@@ -491,7 +464,7 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ============================================================================
 
 if __name__ == "__main__":
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+    application = ApplicationBuilder().token(BOT_TOKEN).rate_limiter(FloodControl()).build()
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
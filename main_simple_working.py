@@ -195,7 +195,7 @@ async def filter_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Nəticə yoxdur.", reply_markup=main_menu())
         return
     
-    filtered = filter_results(results, filter_type)
+    filtered = filter_results(results, filter_type, search_query)
     
     filter_buttons = InlineKeyboardMarkup([
         [InlineKeyboardButton("💰 Ucuz →", callback_data="filter_cheapest"), InlineKeyboardButton("💎 ← Bahalı", callback_data="filter_expensive")],
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+OUTBOUND FLOOD CONTROL
+
+Every Bot API request the bot makes goes through FloodControl (plugged in
+with ApplicationBuilder().rate_limiter(...)):
+
+- a global token bucket keeps us under Telegram's ~30 messages/second,
+  handing out tokens by priority, so replies to users go before
+  notifications and broadcasts (pass rate_limit_args=PRIORITY_LOW)
+- messages to the same chat are spaced out (private chats and groups
+  have different limits)
+- a 429 RetryAfter pauses that chat (or everything, for chat-less
+  requests) for the time Telegram asks and the request is retried
+"""
+
+import heapq
+import asyncio
+import logging
+import itertools
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import FLOOD_GLOBAL_RATE, FLOOD_CHAT_INTERVAL, FLOOD_GROUP_INTERVAL, FLOOD_MAX_RETRIES
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Not messages - answering these late makes the button/inline UI feel broken
+_IMMEDIATE = {"answerCallbackQuery", "answerInlineQuery", "getMe", "getUpdates"}
+
+class FloodControl(BaseRateLimiter[int]):
+    """
+    Args:
+        overall_rate: requests per second across all chats
+        chat_interval: seconds between messages to one private chat
+        group_interval: seconds between messages to one group
+        max_retries: RetryAfter retries before the error is raised
+    """
+
+    def __init__(self, overall_rate: float = FLOOD_GLOBAL_RATE,
+                 chat_interval: float = FLOOD_CHAT_INTERVAL,
+                 group_interval: float = FLOOD_GROUP_INTERVAL,
+                 max_retries: int = FLOOD_MAX_RETRIES):
+        self.overall_rate = overall_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+
+        self._chat_next = {}      # chat_id -> loop time the next message may go
+        self._waiters = []        # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._tokens = overall_rate
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    # ------------------------------------------------------------------------
+
+    async def _dispatch(self):
+        """Hand out global tokens to waiting requests, highest priority first"""
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            now = loop.time()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(self.overall_rate, self._tokens + (now - last) * self.overall_rate)
+            last = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.overall_rate)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._tokens -= 1
+                future.set_result(None)
+
+    async def _acquire(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def _wait_for_chat(self, chat_id):
+        """Reserve this chat's next send slot and wait for it"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        is_group = isinstance(chat_id, str) or chat_id < 0
+        start = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = start + (self.group_interval if is_group else self.chat_interval)
+
+        if len(self._chat_next) > 10000:
+            for key in [k for k, t in self._chat_next.items() if t < now]:
+                del self._chat_next[key]
+
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None and endpoint in _IMMEDIATE:
+            return await callback(*args, **kwargs)
+
+        priority = PRIORITY_NORMAL if rate_limit_args is None else rate_limit_args
+        loop = asyncio.get_running_loop()
+
+        for attempt in itertools.count():
+            if chat_id is not None:
+                await self._wait_for_chat(chat_id)
+            await self._acquire(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                logging.warning(f"[Flood] {endpoint} to {chat_id}: retry after {e.retry_after}s")
+                resume = loop.time() + e.retry_after
+                if chat_id is None:
+                    self._paused_until = max(self._paused_until, resume)
+                else:
+                    self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), resume)
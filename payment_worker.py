@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+PAYMENT RECONCILIATION WORKER
+
+Scans pending PayPal payments in the background, asks PayPal for their
+state in small concurrent batches, executes approved payments and credits
+users through complete_payment() - which is idempotent per payment_id,
+so a payment is never credited twice even if it is seen again.
+"""
+
+import logging
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functions import get_paypal, get_pending_payments, set_payment_status, complete_payment
+from config import (
+    PAYMENT_RECONCILE_INTERVAL, PAYMENT_RECONCILE_BATCH,
+    PAYMENT_RECONCILE_CONCURRENCY, PAYMENT_RECHECK_MAX_DELAY, PAYMENT_EXPIRE_HOURS
+)
+
+_executor = ThreadPoolExecutor(max_workers=PAYMENT_RECONCILE_CONCURRENCY, thread_name_prefix="paypal")
+
+# payment_id -> (next check time, current delay). Payments the buyer has not
+# approved yet are re-checked with exponential backoff instead of every scan.
+_recheck = {}
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def _payment_age_hours(row) -> float:
+    try:
+        created = datetime.fromisoformat(str(row["created_at"]).replace("Z", "+00:00"))
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - created).total_seconds() / 3600
+    except Exception:
+        return 0.0
+
+def _backoff(payment_id: str):
+    _, delay = _recheck.get(payment_id, (0, PAYMENT_RECONCILE_INTERVAL / 2))
+    delay = min(delay * 2, PAYMENT_RECHECK_MAX_DELAY)
+    _recheck[payment_id] = (time.monotonic() + delay, delay)
+
+def _reconcile_one(row):
+    """
+    Check one pending payment against PayPal.
+
+    Returns the complete_payment() result if the user was credited, else None.
+    """
+    payment_id = row["payment_id"]
+    payment = get_paypal().Payment.find(payment_id)
+    state = payment.state
+
+    # Already executed (e.g. via the return URL) - just make sure it is credited
+    if state == "approved":
+        payer_id = payment.payer.payer_info.payer_id if payment.payer and payment.payer.payer_info else None
+        return complete_payment(payment_id, payer_id)
+
+    if state == "failed":
+        set_payment_status(payment_id, "failed")
+        logging.info(f"Payment {payment_id} failed on PayPal side")
+        return None
+
+    # state == "created": approved by the buyer once payer_info is present
+    payer_info = payment.payer.payer_info if payment.payer else None
+    payer_id = payer_info.payer_id if payer_info else None
+    if payer_id:
+        if payment.execute({"payer_id": payer_id}):
+            return complete_payment(payment_id, payer_id)
+        logging.error(f"PayPal payment execution failed: {payment.error}")
+
+    if _payment_age_hours(row) > PAYMENT_EXPIRE_HOURS:
+        set_payment_status(payment_id, "expired")
+        logging.info(f"Payment {payment_id} expired without approval")
+        return None
+
+    _backoff(payment_id)
+    return None
+
+def _safe_reconcile_one(row):
+    try:
+        return _reconcile_one(row)
+    except Exception as e:
+        logging.error(f"Error reconciling payment {row.get('payment_id')}: {e}")
+        _backoff(row["payment_id"])
+        return None
+
+# ============================================================================
+# RECONCILIATION
+# ============================================================================
+
+def reconcile_pending_payments() -> list:
+    """
+    Run one reconciliation pass over all pending payments.
+
+    Returns:
+        List of complete_payment() results for payments credited in this pass
+    """
+    credited = []
+    seen = set()
+    after_id = 0
+    now = time.monotonic()
+
+    while True:
+        rows = get_pending_payments(after_id=after_id, limit=PAYMENT_RECONCILE_BATCH)
+        if not rows:
+            break
+        after_id = rows[-1]["id"]
+
+        due = [r for r in rows if _recheck.get(r["payment_id"], (0, 0))[0] <= now]
+        seen.update(r["payment_id"] for r in rows)
+
+        for result in _executor.map(_safe_reconcile_one, due):
+            if result:
+                credited.append(result)
+
+        if len(rows) < PAYMENT_RECONCILE_BATCH:
+            break
+
+    # Forget backoff state of payments that are no longer pending
+    for payment_id in list(_recheck):
+        if payment_id not in seen:
+            del _recheck[payment_id]
+
+    return credited
+
+async def notify_payment_credited(bot, item):
+    """Tell the user their payment went through (item is a complete_payment() result)"""
+    try:
+        await bot.send_message(
+            item["telegram_id"],
+            f"✅ *Payment received!*\n\n"
+            f"➕ {item['credits']} credits added\n"
+            f"💰 Your Credits: {item['search_credits']}",
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        logging.error(f"Failed to notify user {item['telegram_id']} about payment: {e}")
+
+async def run_payment_reconciler(bot):
+    """Background loop: reconcile pending payments and tell users about new credits"""
+    loop = asyncio.get_running_loop()
+    logging.info("💳 Payment reconciler started")
+
+    while True:
+        try:
+            credited = await loop.run_in_executor(None, reconcile_pending_payments)
+            for item in credited:
+                await notify_payment_credited(bot, item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Payment reconciler error: {e}")
+
+        await asyncio.sleep(PAYMENT_RECONCILE_INTERVAL)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PAYPAL WEBHOOK RECEIVER
+
+Small embedded HTTP endpoint for PayPal webhook events. Each event is
+verified, deduplicated by its event id and applied with apply_paypal_event(),
+which records the event and credits the payment in one transaction.
+
+Local testing without PayPal:
+    python paypal_webhook.py serve --no-verify --dry-run
+    python paypal_webhook.py replay fixtures/paypal_webhook_events.json
+"""
+
+import json
+import logging
+import threading
+import argparse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from config import (
+    PAYPAL_WEBHOOK_ID, PAYPAL_WEBHOOK_HOST, PAYPAL_WEBHOOK_PORT, PAYPAL_WEBHOOK_PATH,
+    PAYPAL_WEBHOOK_MAX_BYTES
+)
+
+# Events that mean money has been captured for a payment
+CREDIT_EVENTS = {"PAYMENT.SALE.COMPLETED"}
+
+# ============================================================================
+# VERIFICATION
+# ============================================================================
+
+def verify_with_paypal(headers, body: bytes) -> bool:
+    """Verify an event with PayPal's verify-webhook-signature API"""
+    from functions import get_paypal
+
+    try:
+        response = get_paypal().api.default().post("v1/notifications/verify-webhook-signature", {
+            "transmission_id": headers.get("Paypal-Transmission-Id"),
+            "transmission_time": headers.get("Paypal-Transmission-Time"),
+            "cert_url": headers.get("Paypal-Cert-Url"),
+            "auth_algo": headers.get("Paypal-Auth-Algo"),
+            "transmission_sig": headers.get("Paypal-Transmission-Sig"),
+            "webhook_id": PAYPAL_WEBHOOK_ID,
+            "webhook_event": json.loads(body)
+        })
+        return response.get("verification_status") == "SUCCESS"
+    except Exception as e:
+        logging.error(f"PayPal webhook verification error: {e}")
+        return False
+
+def skip_verification(headers, body: bytes) -> bool:
+    """Accept every event - only for local testing"""
+    return True
+
+# ============================================================================
+# EVENT PROCESSING
+# ============================================================================
+
+class WebhookProcessor:
+    """
+    Turns verified webhook events into credits.
+
+    Args:
+        apply_event: callable(event_id, event_type, payment_id, payer_id)
+            returning the credited row or None (functions.apply_paypal_event)
+        on_credited: optional callable(credited_row), e.g. to message the user
+        recent_size: how many event ids to remember in memory, so PayPal
+            retries are answered without a database round trip
+    """
+
+    def __init__(self, apply_event, on_credited=None, recent_size=1000):
+        self.apply_event = apply_event
+        self.on_credited = on_credited
+        self.recent_size = recent_size
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _seen(self, event_id: str) -> bool:
+        with self._lock:
+            if event_id in self._recent:
+                self._recent.move_to_end(event_id)
+                return True
+            return False
+
+    def _remember(self, event_id: str):
+        with self._lock:
+            self._recent[event_id] = True
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+
+    def process(self, event: dict) -> str:
+        """
+        Handle one event. Returns "credited", "duplicate" or "ignored".
+
+        Raises on database errors so the caller can answer 500 and let
+        PayPal redeliver.
+        """
+        event_id = event.get("id")
+        event_type = event.get("event_type", "")
+        if not event_id:
+            return "ignored"
+
+        if self._seen(event_id):
+            return "duplicate"
+
+        if event_type not in CREDIT_EVENTS:
+            self._remember(event_id)
+            return "ignored"
+
+        resource = event.get("resource") or {}
+        payment_id = resource.get("parent_payment")
+        if not payment_id:
+            self._remember(event_id)
+            return "ignored"
+
+        credited = self.apply_event(event_id, event_type, payment_id, None)
+        self._remember(event_id)
+
+        if not credited:
+            return "duplicate"
+
+        logging.info(f"[Webhook] {event_type} {event_id}: credited payment {payment_id}")
+        if self.on_credited:
+            try:
+                self.on_credited(credited)
+            except Exception as e:
+                logging.error(f"[Webhook] on_credited callback failed: {e}")
+        return "credited"
+
+# ============================================================================
+# HTTP SERVER
+# ============================================================================
+
+def _make_handler(processor, verify, path):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def _reply(self, code, status):
+            body = json.dumps({"status": status}).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path.split("?")[0] != path:
+                self._reply(404, "not_found")
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                self._reply(400, "bad_length")
+                return
+            if length < 0 or length > PAYPAL_WEBHOOK_MAX_BYTES:
+                self._reply(413 if length > 0 else 400, "bad_length")
+                return
+            body = self.rfile.read(length)
+
+            try:
+                event = json.loads(body)
+            except ValueError:
+                self._reply(400, "bad_json")
+                return
+
+            if not verify(self.headers, body):
+                logging.warning(f"[Webhook] Verification failed for event {event.get('id')}")
+                self._reply(401, "unverified")
+                return
+
+            try:
+                status = processor.process(event)
+            except Exception as e:
+                logging.error(f"[Webhook] Failed to apply event {event.get('id')}: {e}")
+                self._reply(500, "error")
+                return
+
+            self._reply(200, status)
+
+        def log_message(self, format, *args):
+            logging.debug(f"[Webhook] {self.address_string()} {format % args}")
+
+    return WebhookHandler
+
+def start_webhook_server(processor, verify=verify_with_paypal,
+                         host=PAYPAL_WEBHOOK_HOST, port=PAYPAL_WEBHOOK_PORT, path=PAYPAL_WEBHOOK_PATH):
+    """
+    Start the receiver in a daemon thread and return the server (call
+    .shutdown() to stop). Raises ValueError when events would be verified
+    without a PAYPAL_WEBHOOK_ID - every one of them would fail.
+    """
+    if verify is verify_with_paypal and not PAYPAL_WEBHOOK_ID:
+        raise ValueError("PAYPAL_WEBHOOK_ID is not set")
+    server = ThreadingHTTPServer((host, port), _make_handler(processor, verify, path))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="paypal-webhook", daemon=True)
+    thread.start()
+    logging.info(f"🔔 PayPal webhook receiver listening on {host}:{server.server_port}{path}")
+    return server
+
+# ============================================================================
+# LOCAL STAND-IN
+# ============================================================================
+
+def replay_events(events_file: str, url: str):
+    """POST sample events to a running receiver and print the responses"""
+    with open(events_file, encoding="utf-8") as f:
+        events = json.load(f)
+
+    for event in events:
+        response = requests.post(url, json=event, timeout=10)
+        print(f"{event.get('id')} {event.get('event_type')} -> {response.status_code} {response.text}")
+
+def _dry_run_apply(event_id, event_type, payment_id, payer_id):
+    print(f"[dry-run] apply {event_type} {event_id} for payment {payment_id}")
+    return {"telegram_id": 0, "credits": 0, "search_credits": 0}
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="PayPal webhook receiver")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Run the receiver")
+    serve.add_argument("--port", type=int, default=PAYPAL_WEBHOOK_PORT)
+    serve.add_argument("--no-verify", action="store_true", help="Skip PayPal signature verification")
+    serve.add_argument("--dry-run", action="store_true", help="Log events instead of crediting users")
+
+    replay = sub.add_parser("replay", help="Send sample events to a receiver")
+    replay.add_argument("events_file")
+    replay.add_argument("--url", default=f"http://127.0.0.1:{PAYPAL_WEBHOOK_PORT}{PAYPAL_WEBHOOK_PATH}")
+
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        replay_events(args.events_file, args.url)
+    else:
+        if args.dry_run:
+            apply_event = _dry_run_apply
+        else:
+            from functions import apply_paypal_event
+            apply_event = apply_paypal_event
+        verify = skip_verification if args.no_verify else verify_with_paypal
+        server = start_webhook_server(WebhookProcessor(apply_event), verify=verify, port=args.port)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
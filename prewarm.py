@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+OFF-PEAK CACHE PRE-WARMING
+
+CSE quota left over at the end of the quota day is lost at the reset.
+In the last PREWARM_WINDOW seconds before it, the most popular queries
+of recent search_history are re-fetched into the local product index,
+so the next day's searches for popular products are answered locally.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import quota_budget
+from functions import get_search_history, split_logged_query
+from search_script import prewarm_query
+from query_normalizer import query_key, normalize_query
+from providers import ProviderError, QuotaExceeded, CircuitOpen
+from config import (
+    PREWARM_WINDOW, PREWARM_HISTORY_DAYS, PREWARM_TOP_N, PREWARM_SKIP_AGE,
+    PREWARM_CHECK_INTERVAL, QUOTA_RESERVE
+)
+
+# ============================================================================
+# POPULAR QUERIES
+# ============================================================================
+
+def top_queries(days: int = PREWARM_HISTORY_DAYS, limit: int = PREWARM_TOP_N) -> list:
+    """
+    Most searched (query, site) pairs of the last days, by normalized query
+
+    Returns [(query, site, count), ...] with query normalized (synonyms
+    applied, so "ayfon 15" is searched as "iphone 15").
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    counts = Counter()
+    spelling = {}
+
+    after_id = 0
+    while True:
+        page = get_search_history(since, after_id)
+        if not page:
+            break
+        for row in page:
+            query, site = split_logged_query(row["query"])
+            key = (query_key(query), site)
+            if not key[0]:
+                continue
+            counts[key] += 1
+            spelling[key] = normalize_query(query)
+        after_id = page[-1]["id"]
+
+    return [(spelling[key], key[1], count) for key, count in counts.most_common(limit)]
+
+# ============================================================================
+# PRE-WARMING
+# ============================================================================
+
+def prewarm() -> int:
+    """Spend today's leftover quota on popular queries. Returns CSE searches made."""
+    budget = quota_budget.remaining() - QUOTA_RESERVE
+    if budget <= 0:
+        logging.info("[Prewarm] No leftover quota today")
+        return 0
+
+    queries = top_queries()
+    logging.info(f"[Prewarm] {budget} requests left for {len(queries)} popular queries")
+
+    spent = warmed = 0
+    for query, site, count in queries:
+        if quota_budget.remaining() - QUOTA_RESERVE <= 0:
+            break
+        try:
+            calls = prewarm_query(query, site, skip_age=PREWARM_SKIP_AGE)
+        except (QuotaExceeded, CircuitOpen) as e:
+            logging.warning(f"[Prewarm] Stopped: {e}")
+            break
+        except ProviderError as e:
+            logging.warning(f"[Prewarm] '{query}' [{site}]: {e}")
+            continue
+        spent += calls
+        warmed += bool(calls)
+
+    logging.info(f"[Prewarm] Refreshed {warmed} queries with {spent} searches")
+    return spent
+
+async def run_prewarmer():
+    """Background loop: pre-warm once per quota day, just before the reset"""
+    loop = asyncio.get_running_loop()
+    warmed_day = None
+    logging.info(f"[Prewarm] Pre-warmer started (last {PREWARM_WINDOW // 60} min before the quota reset)")
+
+    while True:
+        await asyncio.sleep(PREWARM_CHECK_INTERVAL)
+        try:
+            day = quota_budget.today()
+            if warmed_day == day or quota_budget.seconds_until_reset() > PREWARM_WINDOW:
+                continue
+            warmed_day = day
+            await loop.run_in_executor(None, prewarm)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[Prewarm] Pre-warming failed: {e}")
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+PRICE ENRICHMENT
+
+Many search results only say "Check site" - the snippet had no price.
+For the products we are about to show, enrich() fetches the product pages
+through one shared async HTTP client (a bounded number of connections
+overall and per store) and reads the structured price the store publishes
+for shopping engines: schema.org Product offers in JSON-LD, then
+product:price / og:price meta tags, then itemprop="price".
+
+Found prices are cached by product id (product_identity), so a product is
+fetched at most once per ENRICH_CACHE_TTL no matter how many searches show
+it; pages without a price are remembered for ENRICH_MISS_TTL. Whatever is
+not done by ENRICH_DEADLINE stays "Check site".
+"""
+
+import json
+import time
+import asyncio
+import logging
+import threading
+import httpx
+from bs4 import BeautifulSoup
+import snapshot
+import price_history
+from product_identity import product_id
+from product_index import link_domain
+from search_script import extract_price_value
+from config import (
+    ENRICH_MAX_CONNECTIONS, ENRICH_PER_DOMAIN, ENRICH_TIMEOUT, ENRICH_DEADLINE,
+    ENRICH_MAX_BYTES, ENRICH_CACHE_TTL, ENRICH_MISS_TTL, ENRICH_USER_AGENT
+)
+
+NO_PRICE = 999999
+
+# Currencies results are shown in (search_script._parse_search_items)
+_CURRENCY_FORMATS = {"USD": "${:.2f}", "AZN": "{:.2f} ₼"}
+
+# ============================================================================
+# EXTRACTION
+# ============================================================================
+
+def _to_float(value):
+    try:
+        number = float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+def _json_ld_nodes(data):
+    """Every dict in a JSON-LD document (lists and @graph flattened)"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            yield node
+            if "@graph" in node:
+                stack.append(node["@graph"])
+
+def _is_type(node: dict, name: str) -> bool:
+    types = node.get("@type")
+    return name in (types if isinstance(types, list) else [types])
+
+def _offer_price(offers):
+    """(price, currency) from a Product's offers (Offer, AggregateOffer or a list)"""
+    for offer in offers if isinstance(offers, list) else [offers]:
+        if not isinstance(offer, dict):
+            continue
+        spec = offer.get("priceSpecification")
+        if isinstance(spec, list):
+            spec = spec[0] if spec else None
+        price = _to_float(offer.get("price", offer.get("lowPrice")))
+        if price is None and isinstance(spec, dict):
+            price = _to_float(spec.get("price"))
+        if price is not None:
+            currency = offer.get("priceCurrency") or (spec or {}).get("priceCurrency")
+            return price, currency
+    return None
+
+def _from_json_ld(soup):
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        for node in _json_ld_nodes(data):
+            if _is_type(node, "Product") and "offers" in node:
+                found = _offer_price(node["offers"])
+                if found:
+                    return found
+    return None
+
+def _from_meta(soup):
+    for amount, currency in (("product:price:amount", "product:price:currency"),
+                             ("og:price:amount", "og:price:currency")):
+        tag = soup.find("meta", attrs={"property": amount})
+        price = _to_float(tag.get("content")) if tag else None
+        if price is not None:
+            tag = soup.find("meta", attrs={"property": currency})
+            return price, tag.get("content") if tag else None
+
+    tag = soup.find(attrs={"itemprop": "price"})
+    if tag:
+        price = _to_float(tag.get("content") or tag.get_text())
+        if price is not None:
+            tag = soup.find(attrs={"itemprop": "priceCurrency"})
+            return price, tag.get("content") if tag else None
+    return None
+
+def extract_price(html) -> tuple:
+    """
+    Structured price of a product page as (price text, price value), e.g.
+    ("$19.99", 19.99), or None. Prices without a currency are taken as USD;
+    currencies we don't show are ignored.
+    """
+    soup = BeautifulSoup(html, "lxml")
+    found = _from_json_ld(soup) or _from_meta(soup)
+    if not found:
+        return None
+    price, currency = found
+    template = _CURRENCY_FORMATS.get((currency or "USD").upper())
+    if template is None:
+        return None
+    text = template.format(price)
+    # Same value as search results (manat is compared in USD)
+    return text, extract_price_value(text)
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+# product id -> (checked_at, (price text, price value) or None)
+_cache = {}
+_cache_lock = threading.Lock()
+
+def cached_price(link: str, now: float = None):
+    """(hit, price) - hit is False when the page has to be fetched"""
+    with _cache_lock:
+        entry = _cache.get(product_id(link))
+    if entry is None:
+        return False, None
+    checked_at, price = entry
+    ttl = ENRICH_CACHE_TTL if price else ENRICH_MISS_TTL
+    return (now or time.time()) - checked_at < ttl, price
+
+def _store(link: str, price):
+    now = time.time()
+    with _cache_lock:
+        _cache[product_id(link)] = (now, price)
+        if len(_cache) > 20000:
+            for key in [k for k, (t, p) in _cache.items() if now - t > ENRICH_CACHE_TTL]:
+                del _cache[key]
+
+def _dump():
+    with _cache_lock:
+        return dict(_cache)
+
+def _load(saved):
+    with _cache_lock:
+        _cache.update(saved)
+
+snapshot.register("price_enrichment", _dump, _load)
+
+# ============================================================================
+# FETCHING
+# ============================================================================
+
+class PageFetcher:
+    """Shared async HTTP client with overall and per-domain concurrency limits"""
+
+    def __init__(self, max_connections: int = ENRICH_MAX_CONNECTIONS, per_domain: int = ENRICH_PER_DOMAIN,
+                 timeout: float = ENRICH_TIMEOUT, max_bytes: int = ENRICH_MAX_BYTES):
+        self.max_connections = max_connections
+        self.per_domain = per_domain
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._client = None
+        self._domains = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily inside the bot's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+                follow_redirects=True,
+                headers={"User-Agent": ENRICH_USER_AGENT, "Accept": "text/html", "Accept-Language": "en-US,en"}
+            )
+        return self._client
+
+    async def fetch(self, url: str) -> str:
+        """Page HTML (at most max_bytes of it), or None"""
+        domain = link_domain(url)
+        semaphore = self._domains.get(domain)
+        if semaphore is None:
+            semaphore = self._domains[domain] = asyncio.Semaphore(self.per_domain)
+
+        async with semaphore:
+            try:
+                async with self._get_client().stream("GET", url) as response:
+                    if response.status_code != 200:
+                        logging.info(f"[Enrich] {domain}: HTTP {response.status_code}")
+                        return None
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body += chunk
+                        if len(body) >= self.max_bytes:
+                            break
+                    return body.decode(response.encoding or "utf-8", errors="replace")
+            except httpx.HTTPError as e:
+                logging.info(f"[Enrich] {domain}: {e!r}")
+                return None
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+fetcher = PageFetcher()
+
+async def _enrich_one(product: dict):
+    html = await fetcher.fetch(product["link"])
+    price = None
+    if html:
+        price = await asyncio.get_running_loop().run_in_executor(None, extract_price, html)
+    _store(product["link"], price)
+    return price
+
+async def enrich(products, deadline: float = ENRICH_DEADLINE) -> int:
+    """
+    Fill in "Check site" prices of products in place, from the cache or
+    the product pages. Returns how many got a price.
+    """
+    found = []
+    missing = {}  # product id -> products showing it (one page fetch each)
+    for product in products:
+        if product["price_value"] < NO_PRICE:
+            continue
+        hit, price = cached_price(product["link"])
+        if hit:
+            if price:
+                product["price"], product["price_value"] = price
+                found.append(product)
+        else:
+            missing.setdefault(product_id(product["link"]), []).append(product)
+
+    if missing:
+        pending = {asyncio.ensure_future(_enrich_one(same[0])): same for same in missing.values()}
+        done, late = await asyncio.wait(pending, timeout=deadline)
+        for task in late:
+            task.cancel()
+        for task in done:
+            price = None if task.cancelled() or task.exception() else task.result()
+            if price:
+                for product in pending[task]:
+                    product["price"], product["price_value"] = price
+                    found.append(product)
+        logging.info(f"[Enrich] {len(done)}/{len(pending)} pages read in time, {len(found)} prices")
+
+    if found:
+        await asyncio.get_running_loop().run_in_executor(None, price_history.record, found)
+    return len(found)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+PRICE HISTORY
+
+Append-only log of the USD prices we have seen for each product, kept in
+a flat file of fixed-size records (8-byte product key, 4-byte unix time,
+4-byte float price - 16 bytes per price point). The file is memory-mapped
+for reads and an in-memory map from product key to record numbers is
+built once at startup and extended as records are appended, so looking up
+a product's history never scans the file.
+
+A price is only written when it changed or the product's last record is
+older than PRICE_HISTORY_MIN_INTERVAL, which keeps repeat searches from
+growing the file. Prices in other currencies (Umico's manat) are skipped.
+"""
+
+import os
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import threading
+from product_identity import product_id
+from config import PRICE_HISTORY_PATH, PRICE_HISTORY_MIN_INTERVAL, PRICE_HISTORY_LOW_DAYS
+
+# product key, seen at (unix seconds), USD price
+RECORD = struct.Struct("<QIf")
+
+def product_key(link: str) -> int:
+    """64-bit key of a product link (of its product_id, so variants share one history)"""
+    digest = hashlib.blake2b(product_id(link).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+def usd_price(product: dict):
+    """Price in USD, or None when unknown or in another currency"""
+    if not str(product.get("price", "")).startswith("$") or product["price_value"] >= 999999:
+        return None
+    return product["price_value"]
+
+class PriceHistory:
+    """Fixed-record price log with a per-product index over a memory map"""
+
+    def __init__(self, path: str = PRICE_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mm = None
+        self._indexed = 0      # bytes of the file covered by _records
+        self._records = {}     # product key -> [record number, ...] oldest first
+        self._last = {}        # product key -> (seen_at, price) of its newest record
+        self._disabled = False
+
+    def _sync(self):
+        """Map the file again if it grew and index the new records (lock held)"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        size -= size % RECORD.size  # ignore a torn last record
+        if size <= self._indexed:
+            return
+
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mm
+
+        number = self._indexed // RECORD.size
+        for key, seen_at, price in RECORD.iter_unpack(mm[self._indexed:size]):
+            self._records.setdefault(key, []).append(number)
+            self._last[key] = (seen_at, price)
+            number += 1
+        self._indexed = size
+
+    def record(self, results, now: float = None) -> int:
+        """Append the USD prices of results. Returns records written."""
+        if self._disabled or not results:
+            return 0
+        now = int(now or time.time())
+
+        with self._lock:
+            self._sync()
+            records = []
+            for r in results:
+                price = usd_price(r)
+                if price is None:
+                    continue
+                key = product_key(r["link"])
+                last = self._last.get(key)
+                if last and abs(last[1] - price) < 0.005 and now - last[0] < PRICE_HISTORY_MIN_INTERVAL:
+                    continue
+                self._last[key] = (now, price)
+                records.append(RECORD.pack(key, now, price))
+            if not records:
+                return 0
+
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "ab") as f:
+                    f.write(b"".join(records))
+            except OSError as e:
+                logging.error(f"[History] Price history disabled: {e}")
+                self._disabled = True
+                return 0
+            self._sync()
+        return len(records)
+
+    def series(self, link: str, since: float = 0) -> list:
+        """[(seen_at, price), ...] of a product, oldest first"""
+        key = product_key(link)
+        with self._lock:
+            self._sync()
+            numbers = self._records.get(key)
+            if not numbers:
+                return []
+            points = []
+            for number in reversed(numbers):
+                _, seen_at, price = RECORD.unpack_from(self._mm, number * RECORD.size)
+                if seen_at < since:
+                    break
+                points.append((seen_at, round(price, 2)))
+        points.reverse()
+        return points
+
+    def lowest(self, link: str, days: int = PRICE_HISTORY_LOW_DAYS):
+        """Lowest price seen in the last days, or None"""
+        points = self.series(link, time.time() - days * 86400)
+        return min(p for _, p in points) if points else None
+
+    def annotate(self, results, days: int = PRICE_HISTORY_LOW_DAYS, now: float = None):
+        """
+        Add history fields to results in place (see rendering.format_trend):
+        "trend" is -1/0/1 against the previous different price and
+        "lowest_days" is set when the current price is the lowest in that
+        many days of history.
+        """
+        since = (now or time.time()) - days * 86400
+        for r in results:
+            price = usd_price(r)
+            if price is None:
+                continue
+            points = self.series(r["link"], since)
+            earlier = [p for _, p in points if abs(p - price) >= 0.005]
+            if earlier:
+                r["trend"] = -1 if price < earlier[-1] else 1
+                if price < min(earlier):
+                    r["lowest_days"] = days
+
+# ============================================================================
+# SHARED HISTORY
+# ============================================================================
+
+_history = PriceHistory()
+
+def record(results) -> int:
+    return _history.record(results)
+
+def series(link: str, since: float = 0) -> list:
+    return _history.series(link, since)
+
+def lowest(link: str, days: int = PRICE_HISTORY_LOW_DAYS):
+    return _history.lowest(link, days)
+
+def annotate(results):
+    _history.annotate(results)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+PRICE WATCH ALERTS
+
+Users can watch a search and get a message when its price reaches their
+target. The price is that of ranking.reference_offer - the product
+itself, not the cheapest accessory that matches the query. Every PRICE_WATCH_INTERVAL the active watches are read in
+pages and grouped by normalized query and site, so one fetch serves every
+watcher of the same search - most watched first. Searches of browser
+storefronts (Trendyol, AliExpress, Target) are re-read from the store
+page, like the search that created the watch, and counted apart from the
+CSE fetches. CSE fetches stop as soon as the daily quota budget
+(quota_budget) is no longer on pace.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+import quota_budget
+import ranking
+import storefronts
+from functions import get_active_watches, update_watches
+from search_script import refresh_results
+from query_normalizer import query_key
+from providers import ProviderError, QuotaExceeded, CircuitOpen
+from outbound import PRIORITY_LOW
+from rendering import escape_markdown, escape_url
+from config import PRICE_WATCH_INTERVAL, PRICE_WATCH_MAX_FETCHES, PRICE_WATCH_MAX_RENDERS, BROWSER_ENABLED
+
+# ============================================================================
+# CHECKING
+# ============================================================================
+
+def group_watches() -> list:
+    """Active watches grouped by (normalized query, site), most watched first"""
+    groups = defaultdict(list)
+    after_id = 0
+    while True:
+        page = get_active_watches(after_id)
+        if not page:
+            break
+        for watch in page:
+            groups[(query_key(watch["query"]), watch["site"])].append(watch)
+        after_id = page[-1]["id"]
+    return sorted(groups.values(), key=len, reverse=True)
+
+def check_watches() -> list:
+    """
+    One fetch per watched search. Returns [(watch, product), ...] for
+    watches whose target was reached (they are closed).
+    """
+    reached = []
+    fetches = 0
+    renders = 0
+    cse_stopped = False
+    for watchers in group_watches():
+        query, site = watchers[0]["query"], watchers[0]["site"]
+        store = storefronts.store_for(site) if BROWSER_ENABLED else None
+
+        if store:
+            # Same source as the search that created the watch, and no quota
+            if renders >= PRICE_WATCH_MAX_RENDERS:
+                continue
+            results = storefronts.search(store, query, max_age=PRICE_WATCH_INTERVAL)
+            renders += 1
+        else:
+            if cse_stopped:
+                continue
+            if fetches >= PRICE_WATCH_MAX_FETCHES or quota_budget.level() >= quota_budget.CACHE_FIRST:
+                logging.info("[Watch] Budget for this round used - the rest waits for the next one")
+                cse_stopped = True
+                continue
+            try:
+                results = refresh_results(query, site, max_age=PRICE_WATCH_INTERVAL)
+            except (QuotaExceeded, CircuitOpen) as e:
+                logging.warning(f"[Watch] Stopped: {e}")
+                cse_stopped = True
+                continue
+            except ProviderError as e:
+                logging.warning(f"[Watch] '{query}' [{site}]: {e}")
+                continue
+            fetches += 1
+
+        product = ranking.reference_offer(results, query)
+        if product is None:
+            continue
+        price = round(product["price_value"], 2)
+
+        hits = [w for w in watchers if price <= float(w["target_price"])]
+        waiting = [w["id"] for w in watchers if price > float(w["target_price"])]
+        if waiting:
+            update_watches(waiting, price)
+        if hits:
+            update_watches([w["id"] for w in hits], price, active=False)
+            reached.extend((w, product) for w in hits)
+
+        logging.info(f"[Watch] '{query}' [{site}]: ${price:.2f} for {len(watchers)} watchers, {len(hits)} reached")
+
+    return reached
+
+async def notify_target_reached(bot, watch: dict, product: dict):
+    try:
+        await bot.send_message(
+            watch["telegram_id"],
+            f"🔔 *Price drop!*\n\n"
+            f"🔍 {escape_markdown(watch['query'])}\n"
+            f"🎯 Your target: ${float(watch['target_price']):.2f}\n\n"
+            f"🌐 *{escape_markdown(product['site'])}*\n"
+            f"📦 {escape_markdown(product['title'][:80])}\n"
+            f"💰 *Price:* {escape_markdown(product['price'])}\n"
+            f"[🔗 View Product]({escape_url(product['link'])})",
+            parse_mode="Markdown",
+            disable_web_page_preview=True,
+            rate_limit_args=PRIORITY_LOW
+        )
+    except Exception as e:
+        logging.error(f"Failed to send price alert to {watch['telegram_id']}: {e}")
+
+async def run_price_watcher(bot):
+    """Background loop: re-check watched searches and alert users"""
+    loop = asyncio.get_running_loop()
+    logging.info("🔔 Price watcher started")
+
+    while True:
+        await asyncio.sleep(PRICE_WATCH_INTERVAL)
+        try:
+            reached = await loop.run_in_executor(None, check_watches)
+            for watch, product in reached:
+                await notify_target_reached(bot, watch, product)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Price watch round failed: {e}")
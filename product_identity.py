@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+PRODUCT IDENTITY
+
+Store links come with tracking parameters, slugs and other variants of
+the same page (amazon.com/Some-Title/dp/B0C8.../ref=sr_1_3?tag=...,
+ebay.com/itm/1234?hash=...). product_id() reduces a link to a stable key
+built from the store's own product id where we know how to find it (ASIN,
+eBay item number, Walmart /ip/ id, ...) and to a cleaned-up URL
+otherwise. The local index, the price history and result de-duplication
+all use this one key.
+"""
+
+import re
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# Tracking parameters, dropped from keys and links. Everything else is kept
+# on pages we have no rule for - a custom shop's "product.php?prod=77" is
+# only that product with its parameter.
+_TRACKING_PARAMS = {
+    "ref", "ref_", "tag", "hash", "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "srsltid", "spm", "scm", "clickid", "affid", "aff_id",
+    "campid", "mkcid", "mkrid", "mkevt", "toolid", "customid", "linkcode", "linkid"
+}
+_TRACKING_PREFIXES = ("utm_", "pd_rd_", "pf_rd_", "_trk", "trk")
+
+# Store -> path pattern whose group is the store's product id
+_STORE_RULES = [
+    ("amazon", re.compile(r"/(?:dp|gp/product|gp/aw/d|exec/obidos/asin)/([A-Z0-9]{10})(?:[/?]|$)", re.I)),
+    ("ebay", re.compile(r"/itm/(?:[^/]+/)?(\d{9,15})(?:[/?]|$)")),
+    ("walmart", re.compile(r"/ip/(?:[^/]+/)?(\d{5,15})(?:[/?]|$)")),
+    ("etsy", re.compile(r"/listing/(\d+)(?:[/?]|$)")),
+    ("bestbuy", re.compile(r"/(\d{6,9})\.p(?:[/?]|$)")),
+    ("newegg", re.compile(r"/p/([A-Z0-9]{10,20})(?:[/?]|$)", re.I)),
+    ("umico", re.compile(r"/product/(\d+)(?:[-/?]|$)")),
+    ("trendyol", re.compile(r"-p-(\d+)(?:[/?]|$)")),
+    ("aliexpress", re.compile(r"/item/(\d+)\.html")),
+    ("target", re.compile(r"/A-(\d+)(?:[/?#]|$)")),
+]
+
+# Store -> query parameter (lowercase) carrying the id on some pages
+_QUERY_IDS = {"bestbuy": "skuid", "newegg": "item"}
+
+# Store -> product key, also the short URL (after the host) for _SHORT_LINKS
+_ID_PATHS = {
+    "amazon": "{host}/dp/{id}",
+    "ebay": "{host}/itm/{id}",
+    "walmart": "{host}/ip/{id}",
+    "etsy": "{host}/listing/{id}",
+    "bestbuy": "{host}/site/{id}.p",
+    "newegg": "{host}/p/{id}",
+    "umico": "{host}/product/{id}",
+    "trendyol": "{host}/p/-p-{id}",
+    "aliexpress": "{host}/item/{id}.html",
+    "target": "{host}/p/-/A-{id}",
+}
+
+# Stores whose pages open from the short id URL alone
+_SHORT_LINKS = {"amazon", "ebay", "walmart", "etsy", "newegg", "aliexpress", "target"}
+
+def _split(url: str):
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().split(":")[0]
+    if host.startswith("www."):
+        host = host[4:]
+    return parts, host
+
+def _store(host: str):
+    """Store name of a host ("amazon.co.uk" -> "amazon"), or None"""
+    for store, _ in _STORE_RULES:
+        if host == f"{store}.com" or host.startswith(f"{store}.") or f".{store}." in f".{host}":
+            return store
+    return None
+
+def _store_id(parts, store: str):
+    """The store's own product id from a link, or None"""
+    for name, pattern in _STORE_RULES:
+        if name == store:
+            m = pattern.search(parts.path)
+            if m:
+                return m.group(1)
+    if store in _QUERY_IDS:
+        for k, v in parse_qsl(parts.query):
+            if k.lower() == _QUERY_IDS[store] and v:
+                return v
+    return None
+
+def _is_tracking(param: str) -> bool:
+    param = param.lower()
+    return param in _TRACKING_PARAMS or param.startswith(_TRACKING_PREFIXES)
+
+def _kept_params(query: str, key: bool = False) -> str:
+    """
+    Query string without tracking parameters; for a product key also sorted
+    with lowercase names so parameter order doesn't matter
+    """
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if not _is_tracking(k)]
+    if key:
+        params = sorted((k.lower(), v) for k, v in params)
+    return f"?{urlencode(params)}" if params else ""
+
+def product_id(url: str) -> str:
+    """Stable key of the product a link points to"""
+    parts, host = _split(url)
+    store = _store(host)
+    found = store and _store_id(parts, store)
+    if found:
+        return _ID_PATHS[store].format(host=host, id=found.upper() if store in ("amazon", "newegg") else found)
+    # Unknown store or page layout: path plus every non-tracking parameter
+    return f"{host}{parts.path.rstrip('/')}{_kept_params(parts.query, key=True)}"
+
+def clean_link(url: str) -> str:
+    """Link to show and store: the product page without tracking parameters"""
+    parts, host = _split(url)
+    # Keep the host as the store sent it (www. or not) - some redirect badly without
+    base = f"{parts.scheme or 'https'}://{parts.netloc.lower()}"
+    store = _store(host)
+    if store in _SHORT_LINKS and _store_id(parts, store):
+        return f"{base}{product_id(url)[len(host):]}"
+    return f"{base}{parts.path}{_kept_params(parts.query)}"
+
+def dedupe(results) -> list:
+    """
+    Results with one entry per product, in first-seen order; of several
+    rows for one product the first with a known price is kept
+    """
+    kept = {}
+    for r in results:
+        key = product_id(r["link"])
+        seen = kept.get(key)
+        if seen is None or (seen["price_value"] >= 999999 and r["price_value"] < 999999):
+            kept[key] = r
+    return list(kept.values())
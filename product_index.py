@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+LOCAL PRODUCT INDEX
+
+Every product we get from upstream is stored in a local SQLite database
+with an FTS5 full-text index over titles, keyed by product id
+(product_identity) and stamped with when it was last seen. Searches
+consult the index first and only spend CSE quota when it cannot answer
+with enough fresh products.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlsplit
+from query_normalizer import normalize_query, query_key, tokenize
+from product_identity import product_id
+from config import PRODUCT_INDEX_PATH, PRODUCT_INDEX_MAX_AGE, PRODUCT_INDEX_RETENTION
+
+# Bump when SCHEMA changes - the index is a cache, so old files are rebuilt
+SCHEMA_VERSION = 7
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    link TEXT UNIQUE NOT NULL,
+    url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    site TEXT NOT NULL,
+    title TEXT NOT NULL,
+    search_text TEXT NOT NULL,
+    price TEXT NOT NULL,
+    price_value REAL NOT NULL,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_domain ON products(domain);
+CREATE INDEX IF NOT EXISTS idx_products_seen_at ON products(seen_at);
+
+-- Full-text index over titles normalized like queries (query_normalizer)
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    search_text, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, search_text) VALUES (new.id, new.search_text);
+END;
+CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+END;
+CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE OF search_text ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    INSERT INTO products_fts(rowid, search_text) VALUES (new.id, new.search_text);
+END;
+
+-- Upstream searches (also those that found nothing), so a small or empty
+-- but fresh local answer is not mistaken for missing data
+CREATE TABLE IF NOT EXISTS searches (
+    query_key TEXT NOT NULL,
+    sites TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    found INTEGER NOT NULL,
+    PRIMARY KEY (query_key, sites)
+);
+"""
+
+_local = threading.local()
+_disabled = False
+_last_prune = 0.0
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def link_domain(url: str) -> str:
+    host = urlsplit(url.strip()).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+def _fts_query(query: str, prefix: bool = False) -> str:
+    """
+    All normalized query words must appear in the title (each quoted for FTS5);
+    with prefix, the last word may be incomplete (as typed so far)
+    """
+    words = [f'"{w}"' for w in tokenize(query)]
+    if prefix and words:
+        words[-1] += "*"
+    return " ".join(words)
+
+def _sites_key(sites) -> str:
+    return ",".join(sorted(sites))
+
+def _domain_filter(sites):
+    clause = " OR ".join("(p.domain = ? OR p.domain LIKE ?)" for _ in sites)
+    params = []
+    for site in sites:
+        params.extend([site, f"%.{site}"])
+    return f"({clause})", params
+
+def _connect():
+    """One connection per thread (searches run in executor threads)"""
+    global _disabled
+    conn = getattr(_local, "conn", None)
+    if conn is not None or _disabled:
+        return conn
+
+    try:
+        directory = os.path.dirname(PRODUCT_INDEX_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(PRODUCT_INDEX_PATH, timeout=5)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.executescript("""
+                DROP TABLE IF EXISTS products_fts;
+                DROP TABLE IF EXISTS products;
+                DROP TABLE IF EXISTS searches;
+            """)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(SCHEMA)
+    except sqlite3.Error as e:
+        logging.error(f"[Index] Local product index disabled: {e}")
+        _disabled = True
+        return None
+
+    _local.conn = conn
+    return conn
+
+# ============================================================================
+# INDEX API
+# ============================================================================
+
+def add_results(results, query: str = None, sites=None):
+    """Store products from an upstream search (and remember the search itself)"""
+    conn = _connect()
+    if conn is None or not results:
+        return
+
+    now = time.time()
+    rows = []
+    for r in results:
+        rows.append((
+            product_id(r["link"]), r["link"], link_domain(r["link"]),
+            r["site"], r["title"], normalize_query(r["title"]), r["price"], r["price_value"], now
+        ))
+
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO products (link, url, domain, site, title, search_text, price, price_value, seen_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(link) DO UPDATE SET
+                    url = excluded.url, site = excluded.site, title = excluded.title,
+                    search_text = excluded.search_text, price = excluded.price, price_value = excluded.price_value,
+                    seen_at = excluded.seen_at
+            """, rows)
+            if query and sites:
+                conn.execute(
+                    "INSERT OR REPLACE INTO searches (query_key, sites, fetched_at, found) VALUES (?, ?, ?, ?)",
+                    (query_key(query), _sites_key(sites), now, len(rows))
+                )
+    except sqlite3.Error as e:
+        logging.error(f"[Index] Failed to store results: {e}")
+        return
+
+    _maybe_prune(conn, now)
+
+def mark_fetched(query: str, sites):
+    """Remember an upstream search that found nothing, so it isn't repeated until it's stale"""
+    conn = _connect()
+    if conn is None:
+        return
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO searches (query_key, sites, fetched_at, found) VALUES (?, ?, ?, 0)",
+                (query_key(query), _sites_key(sites), time.time())
+            )
+    except sqlite3.Error as e:
+        logging.error(f"[Index] Failed to store search: {e}")
+
+def search(query: str, sites, limit: int = 10, max_age: float = PRODUCT_INDEX_MAX_AGE,
+           prefix: bool = False) -> list:
+    """
+    Products from the local index whose titles contain every normalized query word
+
+    Args:
+        query: Search query
+        sites: Domains to search in (e.g. ["amazon.com", "ebay.com"])
+        limit: Max products to return (best text match first)
+        max_age: Only products seen within this many seconds
+        prefix: Treat the last word as a prefix (inline queries while typing)
+    """
+    conn = _connect()
+    match = _fts_query(query, prefix)
+    if conn is None or not match or not sites:
+        return []
+
+    domain_sql, domain_params = _domain_filter(sites)
+    try:
+        rows = conn.execute(f"""
+            SELECT p.url, p.site, p.title, p.price, p.price_value, p.seen_at
+              FROM products_fts
+              JOIN products p ON p.id = products_fts.rowid
+             WHERE products_fts MATCH ?
+               AND p.seen_at >= ?
+               AND {domain_sql}
+             ORDER BY bm25(products_fts)
+             LIMIT ?
+        """, [match, time.time() - max_age, *domain_params, limit]).fetchall()
+    except sqlite3.Error as e:
+        logging.error(f"[Index] Search failed: {e}")
+        return []
+
+    return [{
+        "site": row["site"],
+        "title": row["title"],
+        "link": row["url"],
+        "price": row["price"],
+        "price_value": row["price_value"],
+        "seen_at": row["seen_at"]
+    } for row in rows]
+
+def _last_search(query: str, sites, max_age: float):
+    """The searches row of this query and sites if it is younger than max_age"""
+    conn = _connect()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute(
+            "SELECT fetched_at, found FROM searches WHERE query_key = ? AND sites = ?",
+            (query_key(query), _sites_key(sites))
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return row if row and row["fetched_at"] >= time.time() - max_age else None
+
+def recently_fetched(query: str, sites, max_age: float = PRODUCT_INDEX_MAX_AGE) -> bool:
+    """True if upstream was searched for this query and sites within max_age"""
+    return _last_search(query, sites, max_age) is not None
+
+def recently_empty(query: str, sites, max_age: float = PRODUCT_INDEX_MAX_AGE) -> bool:
+    """True if upstream found nothing for this query and sites within max_age"""
+    row = _last_search(query, sites, max_age)
+    return row is not None and row["found"] == 0
+
+def _maybe_prune(conn, now: float):
+    """Drop products not seen for PRODUCT_INDEX_RETENTION, at most once an hour"""
+    global _last_prune
+    if now - _last_prune < 3600:
+        return
+    _last_prune = now
+    cutoff = now - PRODUCT_INDEX_RETENTION
+    try:
+        with conn:
+            conn.execute("DELETE FROM products WHERE seen_at < ?", (cutoff,))
+            conn.execute("DELETE FROM searches WHERE fetched_at < ?", (cutoff,))
+    except sqlite3.Error as e:
+        logging.error(f"[Index] Prune failed: {e}")
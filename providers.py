@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+SEARCH PROVIDERS
+
+Common interface for upstream product search backends and a hedged
+search engine: the primary provider gets a head start equal to its own
+p90 latency; if it hasn't answered by then (or fails, e.g. 429 on every
+key) the secondary is asked too and the first useful answer wins.
+"""
+
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from circuit_breaker import CircuitBreaker
+from config import HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_DEFAULT_DELAY, HEDGE_MIN_SAMPLES
+
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="provider")
+
+# ============================================================================
+# ERRORS
+# ============================================================================
+
+class ProviderError(Exception):
+    """The provider could not answer (network error, bad response, ...)"""
+
+class QuotaExceeded(ProviderError):
+    """The provider rejected the request for quota/rate reasons (HTTP 429)"""
+
+class Cancelled(ProviderError):
+    """The search was abandoned because another provider answered first"""
+
+class CircuitOpen(ProviderError):
+    """Refused without calling upstream because the circuit breaker is open"""
+
+class QueryRejected(ProviderError):
+    """The provider is up but refused this request (HTTP 400 and the like)"""
+
+# ============================================================================
+# LATENCY TRACKING
+# ============================================================================
+
+class LatencyTracker:
+    """Sliding window of recent successful request latencies (seconds)"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float):
+        """p-th percentile (0-100) of the window, or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+# ============================================================================
+# PROVIDERS
+# ============================================================================
+
+class SearchProvider:
+    """
+    Base class for search backends.
+
+    Subclasses implement search(query, sites, max_results, cancelled) and
+    return parsed product dicts (site, title, link, price, price_value).
+    They raise ProviderError when they can't answer and should check the
+    cancelled event between upstream calls.
+
+    timed_search() wraps search() with the provider's circuit breaker
+    (fails fast while open) and latency tracking.
+    """
+
+    name = "provider"
+
+    def __init__(self):
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(self.name)
+
+    def search(self, query, sites, max_results, cancelled=None) -> list:
+        raise NotImplementedError
+
+    def timed_search(self, query, sites, max_results, cancelled=None) -> list:
+        if not self.breaker.allow_request():
+            raise CircuitOpen(f"{self.name}: circuit open")
+
+        start = time.monotonic()
+        try:
+            results = self.search(query, sites, max_results, cancelled)
+        except (Cancelled, QueryRejected):
+            self.breaker.release()
+            raise
+        except QuotaExceeded:
+            self.breaker.trip()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        self.latency.record(time.monotonic() - start)
+        self.breaker.record_success()
+        return results
+
+    def hedge_delay(self) -> float:
+        """How long to wait for this provider before asking another one"""
+        if len(self.latency) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return self.latency.percentile(HEDGE_PERCENTILE)
+
+class DuckDuckGoProvider(SearchProvider):
+    """
+    DuckDuckGo text search used as the secondary backend
+
+    Args:
+        parse_items: turns CSE-style items (title, link, snippet) into
+            product dicts - search_script._parse_search_items
+    """
+
+    name = "duckduckgo"
+
+    def __init__(self, parse_items, timeout: int = 10):
+        super().__init__()
+        self.parse_items = parse_items
+        self.timeout = timeout
+
+    def search(self, query, sites, max_results, cancelled=None) -> list:
+        from duckduckgo_search import DDGS
+        from duckduckgo_search.exceptions import DuckDuckGoSearchException, RatelimitException
+
+        site_filter = " OR ".join(f"site:{s}" for s in sites)
+        try:
+            # Ask for extra hits: many are category pages that parse_items drops
+            hits = DDGS(timeout=self.timeout).text(f"{query} ({site_filter})", max_results=max_results * 2)
+        except RatelimitException as e:
+            raise QuotaExceeded(f"duckduckgo: {e}")
+        except DuckDuckGoSearchException as e:
+            raise ProviderError(f"duckduckgo: {e}")
+
+        items = [{
+            "title": hit.get("title", ""),
+            "link": hit.get("href", ""),
+            "snippet": hit.get("body", "")
+        } for hit in hits or []]
+        results = self.parse_items(items)[:max_results]
+        logging.info(f"[DuckDuckGo] {len(results)} products")
+        return results
+
+# ============================================================================
+# HEDGED SEARCH
+# ============================================================================
+
+def _run(provider, query, sites, max_results, cancelled):
+    if cancelled.is_set():
+        raise Cancelled(provider.name)
+    return provider.timed_search(query, sites, max_results, cancelled)
+
+def hedged_search(primary, secondary, query, sites, max_results) -> list:
+    """
+    Search with primary; hedge to secondary after primary's p90 latency or
+    on primary failure. Returns the first non-empty answer and cancels the
+    other search - [] if a provider answered but found nothing, None if
+    none answered at all.
+    """
+    if secondary is None or not HEDGE_ENABLED:
+        try:
+            return primary.timed_search(query, sites, max_results)
+        except Exception as e:
+            logging.warning(f"[{primary.name}] {e}")
+            return None
+
+    cancelled = threading.Event()
+    # Copied context: CSE requests stay charged to the searching user (quota_budget.charged_to)
+    futures = {_pool.submit(contextvars.copy_context().run, _run, primary, query, sites, max_results, cancelled): primary}
+
+    answered = False
+    done, _ = wait(futures, timeout=primary.hedge_delay())
+    if done:
+        future = next(iter(done))
+        try:
+            results = future.result()
+            if results:
+                return results
+            answered = True
+        except Exception as e:
+            logging.warning(f"[{primary.name}] {e} - asking {secondary.name}")
+        futures.clear()
+    else:
+        logging.info(f"[{primary.name}] slower than p{HEDGE_PERCENTILE:g} - hedging to {secondary.name}")
+
+    futures[_pool.submit(contextvars.copy_context().run, _run, secondary, query, sites, max_results, cancelled)] = secondary
+
+    try:
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = futures.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logging.warning(f"[{provider.name}] {e}")
+                    continue
+                if results:
+                    logging.info(f"[Hedge] {provider.name} answered first")
+                    return results
+                answered = True
+        return [] if answered else None
+    finally:
+        # Stop whichever search is still running from spending more quota
+        cancelled.set()
+        for future in futures:
+            future.cancel()
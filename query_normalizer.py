@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+QUERY NORMALIZATION
+
+Turns the many ways users type the same product ("iPhone 15",
+"iphone15 ", "IPHONE 15!", "айфон 15") into one stable form, so caches,
+the local index and dedup layers all agree on what a query is.
+
+    normalize_query("IPHONE15 Pro Max!")  -> "iphone 15 pro max"
+    query_key("Pro Max iPhone 15")        -> "15 iphone max pro"
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# Azerbaijani / Turkish letters that don't decompose into ASCII + accent
+_LATIN_MAP = str.maketrans({
+    "ə": "e", "ı": "i", "ş": "s", "ç": "c", "ğ": "g", "ö": "o", "ü": "u",
+    "ß": "ss", "æ": "ae", "ø": "o", "đ": "d", "ł": "l"
+})
+
+# Russian and Azerbaijani Cyrillic
+_CYRILLIC_MAP = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    "ә": "e", "ғ": "g", "ҹ": "c", "ҝ": "g", "ө": "o", "ү": "u", "һ": "h", "ј": "y"
+})
+
+# Common spellings of brand names after transliteration
+SYNONYMS = {
+    "ayfon": "iphone", "aifon": "iphone", "aypon": "iphone",
+    "samsunq": "samsung", "samsuns": "samsung",
+    "ksiaomi": "xiaomi", "syaomi": "xiaomi", "ksiomi": "xiaomi",
+    "noutbuk": "laptop", "notbuk": "laptop",
+    "airpod": "airpods", "eyrpods": "airpods",
+    "pleystesin": "playstation", "pleystation": "playstation",
+    "promax": "pro max",
+}
+
+# Words that don't change which product is meant. Only whole words are
+# dropped - the "a" of "A8" is part of a model name, and so is a lone
+# letter before a number ("Galaxy A 8"). ("best" and "buy" are not here:
+# Best Buy is a store.)
+STOP_WORDS = frozenset({
+    # English
+    "a", "an", "the", "for", "with", "and", "of", "in", "on", "to", "by",
+    "cheap", "cheapest", "price", "prices", "sale", "online", "shop", "deal", "deals",
+    # Azerbaijani / Turkish
+    "ve", "ile", "ucun", "ucuz", "qiymet", "qiymeti", "almaq", "al", "satilir", "satis",
+    "en", "fiyat", "fiyati", "satin",
+    # Russian (transliterated)
+    "dlya", "kupit", "tsena", "deshevo", "nedorogo",
+})
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_LETTER_DIGIT_RE = re.compile(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z])")
+
+def _fold(text: str) -> str:
+    """Lowercase, transliterate and strip accents"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = text.translate(_LATIN_MAP).translate(_CYRILLIC_MAP)
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+def _split_word(word: str) -> list:
+    """
+    Split letters from numbers, keeping models (a single letter and a
+    number, "a8", "s23", "a546b") whole:
+    "iphone15" -> iphone 15, "s23ultra" -> s23 ultra, "256gb" -> 256 gb
+    """
+    runs = _LETTER_DIGIT_RE.sub(" ", word).split()
+    parts = []
+    i = 0
+    while i < len(runs):
+        run = runs[i]
+        if len(run) == 1 and run.isalpha() and i + 1 < len(runs):
+            run += runs[i + 1]
+            i += 1
+            # A trailing variant letter ends the word ("a546b")
+            if i + 2 == len(runs) and len(runs[i + 1]) == 1:
+                run += runs[i + 1]
+                i += 1
+        parts.append(run)
+        i += 1
+    return parts
+
+@lru_cache(maxsize=4096)
+def tokenize(text: str) -> tuple:
+    """Normalized query words, in order, stop-words removed"""
+    text = _fold(text).replace("+", " plus ").replace("_", " ")
+    text = _PUNCT_RE.sub(" ", text).split()
+
+    words = []
+    kept = []
+    for i, word in enumerate(text):
+        parts = [w for part in _split_word(word) for w in SYNONYMS.get(part, part).split()]
+        words.extend(parts)
+        # A lone letter before a number is part of the model ("Galaxy A 8")
+        model_letter = len(word) == 1 and i + 1 < len(text) and text[i + 1][0].isdigit()
+        if word not in STOP_WORDS or model_letter:
+            kept.extend(parts)
+
+    # A query made only of stop-words ("the deal") is still a query
+    return tuple(kept or words)
+
+def normalize_query(text: str) -> str:
+    """Readable canonical form, word order preserved: "iPhone15 Pro!" -> "iphone 15 pro" """
+    return " ".join(tokenize(text))
+
+def query_key(text: str) -> str:
+    """Order-independent key shared by every cache and dedup layer"""
+    return " ".join(sorted(set(tokenize(text))))
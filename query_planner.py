@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+ADAPTIVE QUERY PLANNER
+
+Decides how the "all sites" search is split into CSE calls. Every planned
+call records, per site, how many result slots it was given and how many
+usable products came back. From that yield the planner works out how many
+slots each site needs for PLANNER_TARGET_PER_SITE products and packs sites
+into as few calls (max 10 results each) as possible. Sites that keep
+returning nothing usable only ride along with one slot.
+
+The plan is recomputed every PLANNER_REFRESH_SECONDS.
+"""
+
+import math
+import time
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+import snapshot
+from product_index import link_domain
+from config import (
+    PLANNER_TARGET_PER_SITE, PLANNER_MIN_SAMPLES, PLANNER_MIN_YIELD,
+    PLANNER_REFRESH_SECONDS, PLANNER_MAX_RESULTS
+)
+
+# Used until every site has PLANNER_MIN_SAMPLES calls of history
+DEFAULT_ALL_PLAN = [
+    (["amazon.com", "ebay.com"], 4),
+    (["walmart.com", "bestbuy.com"], 3),
+    (["etsy.com", "newegg.com"], 3),
+    (["umico.az"], 4),
+]
+ALL_SITES = [site for group, _ in DEFAULT_ALL_PLAN for site in group]
+
+# site -> {"calls": n, "slots": result slots given, "usable": usable products}
+_stats = {}
+_plans = {}
+_lock = threading.Lock()
+# Result slots per site of the planned call running in this context (see planned())
+_call_slots = contextvars.ContextVar("planned_slots", default=None)
+
+# ============================================================================
+# STATS
+# ============================================================================
+
+def _site_of(link: str, sites) -> str:
+    domain = link_domain(link)
+    for site in sites:
+        if domain == site or domain.endswith(f".{site}"):
+            return site
+    return None
+
+@contextmanager
+def planned(slots):
+    """
+    Upstream calls inside the block run a group of the plan, with these
+    result slots per site ({site: slots}); None for calls outside a plan
+    """
+    token = _call_slots.set(slots)
+    try:
+        yield
+    finally:
+        _call_slots.reset(token)
+
+def current_slots():
+    """Slots per site of the planned call in this context, or None"""
+    return _call_slots.get()
+
+def record(slots: dict, results):
+    """
+    Record the outcome of one planned upstream call
+
+    Args:
+        slots: result slots the plan gave each site of the call - only
+            planned calls are recorded, other searches (single-site,
+            custom-site, collapsed, refreshes) ask for other amounts and
+            would skew the yield
+    """
+    usable = dict.fromkeys(slots, 0)
+    for r in results:
+        site = _site_of(r["link"], slots)
+        if site:
+            usable[site] += 1
+
+    with _lock:
+        for site in slots:
+            s = _stats.setdefault(site, {"calls": 0, "slots": 0.0, "usable": 0})
+            s["calls"] += 1
+            s["slots"] += slots[site]
+            s["usable"] += usable[site]
+
+def site_yield(site: str):
+    """Usable products per result slot, or None without enough history"""
+    with _lock:
+        s = _stats.get(site)
+    if not s or s["calls"] < PLANNER_MIN_SAMPLES or s["slots"] <= 0:
+        return None
+    return s["usable"] / s["slots"]
+
+# ============================================================================
+# PLANNING
+# ============================================================================
+
+def _slots_needed(site: str) -> int:
+    y = site_yield(site)
+    if y is None:
+        return PLANNER_MAX_RESULTS
+    if y < PLANNER_MIN_YIELD:
+        return 1
+    return max(1, min(PLANNER_MAX_RESULTS, math.ceil(PLANNER_TARGET_PER_SITE / y)))
+
+def _pack(sites) -> list:
+    """compute_plan() with the slots meant for each site: [(sites, num, {site: slots}), ...]"""
+    if any(site_yield(site) is None for site in sites):
+        if sorted(sites) == sorted(ALL_SITES):
+            groups = DEFAULT_ALL_PLAN
+        else:
+            groups = [(sites, PLANNER_MAX_RESULTS)]
+        # Without a packing the slots are shared evenly
+        return [(list(group), num, dict.fromkeys(group, num / len(group))) for group, num in groups]
+
+    needs = sorted(((_slots_needed(site), site) for site in sites), reverse=True)
+    groups = []  # [slots used, [sites], {site: slots}]
+    for need, site in needs:
+        for group in groups:
+            if group[0] + need <= PLANNER_MAX_RESULTS:
+                group[0] += need
+                group[1].append(site)
+                group[2][site] = need
+                break
+        else:
+            groups.append([need, [site], {site: need}])
+
+    return [(group_sites, used, slots) for used, group_sites, slots in groups]
+
+def compute_plan(sites) -> list:
+    """
+    Pack sites into CSE calls: [(sites, num), ...]
+
+    First-fit decreasing on the slots each site needs, so high-yield sites
+    share a call and the total number of calls (quota units) is minimal.
+    """
+    return [(group, num) for group, num, _ in _pack(sites)]
+
+def plan_groups(sites) -> list:
+    """
+    Current plan for these sites (cached, recomputed periodically):
+    [(sites, num, {site: slots}), ...] - run each call inside planned(slots)
+    """
+    key = tuple(sorted(sites))
+    now = time.monotonic()
+    with _lock:
+        cached = _plans.get(key)
+    if cached and now - cached[0] < PLANNER_REFRESH_SECONDS:
+        return cached[1]
+
+    plan = _pack(list(sites))
+    with _lock:
+        _plans[key] = (now, plan)
+    logging.info(f"[Planner] {len(plan)} calls: " + "; ".join(f"{'+'.join(g)}:{n}" for g, n, _ in plan))
+    return plan
+
+def _dump():
+    with _lock:
+        return {site: dict(s) for site, s in _stats.items()}
+
+def _load(saved):
+    with _lock:
+        _stats.update(saved)
+        _plans.clear()
+
+snapshot.register("query_planner", _dump, _load)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+DAILY QUOTA BUDGET
+
+Google CSE gives each API key 100 requests a day, reset at midnight
+Pacific time. Instead of letting the morning rush drain all of them, spend
+is paced across the day: by any moment we may have used the share of the
+budget for the time elapsed plus a small burst allowance. Spend is tracked
+per hour and per user: a search runs inside charged_to(user_id), and every
+CSE request sent while it runs (in any thread it hands work to with the
+context copied) is counted for that user - requests answered by the free
+secondary provider cost the user nothing.
+
+When spend runs ahead of pace, searches degrade step by step:
+
+    NORMAL       planned site groups, upstream when the index can't answer
+    COLLAPSE     "all sites" is searched with a single CSE call
+    CACHE_FIRST  older index results are good enough, upstream only on a miss
+    STALE        no CSE calls at all - index results of any age (with a notice)
+"""
+
+import math
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import snapshot
+from config import (
+    GOOGLE_API_KEYS, QUOTA_PER_KEY, QUOTA_BURST, QUOTA_COLLAPSE_MARGIN,
+    QUOTA_RESERVE, QUOTA_PER_USER_DAILY
+)
+
+NORMAL, COLLAPSE, CACHE_FIRST, STALE = range(4)
+LEVEL_NAMES = ["normal", "collapse", "cache_first", "stale"]
+
+DAILY_BUDGET = QUOTA_PER_KEY * len(GOOGLE_API_KEYS)
+
+# Google resets CSE quota at midnight Pacific time
+_QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+
+_day = None
+_spent = 0
+_hourly = [0] * 24
+_per_user = {}
+_exhausted = False
+_lock = threading.Lock()
+# User whose search is sending the current CSE requests
+_charged_user = contextvars.ContextVar("quota_user", default=None)
+
+# ============================================================================
+# ACCOUNTING
+# ============================================================================
+
+def _now():
+    return datetime.now(_QUOTA_TZ)
+
+def _roll(now):
+    """Start a new quota day after Pacific midnight (call with _lock held)"""
+    global _day, _spent, _hourly, _per_user, _exhausted
+    today = now.date().isoformat()
+    if _day == today:
+        return
+    if _day is not None:
+        logging.info(f"[Quota] New quota day - spent {_spent}/{DAILY_BUDGET} on {_day}")
+    _day = today
+    _spent = 0
+    _hourly = [0] * 24
+    _per_user = {}
+    _exhausted = False
+
+def spend(units: int = 1):
+    """Count CSE requests sent upstream (and for the user in charged_to)"""
+    global _spent
+    now = _now()
+    user_id = _charged_user.get()
+    with _lock:
+        _roll(now)
+        _spent += units
+        _hourly[now.hour] += units
+        if user_id is not None:
+            _per_user[user_id] = _per_user.get(user_id, 0) + units
+
+@contextmanager
+def charged_to(user_id):
+    """CSE requests sent inside the block count against user_id's daily share"""
+    token = _charged_user.set(user_id)
+    try:
+        yield
+    finally:
+        _charged_user.reset(token)
+
+def mark_exhausted():
+    """Every key answered 429 - stop calling upstream until the reset"""
+    global _exhausted
+    with _lock:
+        _roll(_now())
+        if not _exhausted:
+            logging.warning(f"[Quota] All API keys exhausted after {_spent} requests today")
+        _exhausted = True
+
+# ============================================================================
+# PACING
+# ============================================================================
+
+def allowance(now=None) -> int:
+    """Requests we may have spent by now to stay on pace for the day"""
+    now = now or _now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = (now - midnight).total_seconds() / 86400
+    return min(DAILY_BUDGET, math.ceil(DAILY_BUDGET * elapsed) + QUOTA_BURST)
+
+def level(user_id=None) -> int:
+    """Degradation level for the next search (NORMAL ... STALE)"""
+    now = _now()
+    with _lock:
+        _roll(now)
+        spent, exhausted = _spent, _exhausted
+        user_spent = _per_user.get(user_id, 0)
+
+    if exhausted or DAILY_BUDGET - spent <= QUOTA_RESERVE:
+        return STALE
+
+    behind = spent - allowance(now)
+    if behind <= 0:
+        current = NORMAL
+    elif behind <= QUOTA_COLLAPSE_MARGIN:
+        current = COLLAPSE
+    else:
+        current = CACHE_FIRST
+
+    # Heavy users are served from the index first so others keep fresh results
+    if user_id is not None and user_spent >= QUOTA_PER_USER_DAILY:
+        current = max(current, CACHE_FIRST)
+    return current
+
+def remaining() -> int:
+    """CSE requests left today (0 once every key answered 429)"""
+    with _lock:
+        _roll(_now())
+        return 0 if _exhausted else max(0, DAILY_BUDGET - _spent)
+
+def today() -> str:
+    """Current quota day (Pacific date)"""
+    return _now().date().isoformat()
+
+def seconds_until_reset() -> float:
+    """Seconds until the next Pacific midnight, when Google resets the keys"""
+    now = _now()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+def summary() -> dict:
+    """Today's spend for logs and the /quota admin command"""
+    current = LEVEL_NAMES[level()]
+    with _lock:
+        top_users = sorted(_per_user.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        return {
+            "day": _day,
+            "spent": _spent,
+            "budget": DAILY_BUDGET,
+            "allowance": allowance(),
+            "exhausted": _exhausted,
+            "level": current,
+            "hourly": list(_hourly),
+            "top_users": top_users
+        }
+
+def _dump():
+    with _lock:
+        return {"day": _day, "spent": _spent, "hourly": list(_hourly),
+                "per_user": dict(_per_user), "exhausted": _exhausted}
+
+def _load(saved):
+    global _day, _spent, _hourly, _per_user, _exhausted
+    with _lock:
+        # Only today's spend matters after a restart
+        if saved.get("day") != _now().date().isoformat():
+            return
+        _day = saved["day"]
+        _spent = saved["spent"]
+        _hourly = saved["hourly"]
+        _per_user = saved["per_user"]
+        _exhausted = saved["exhausted"]
+
+snapshot.register("quota_budget", _dump, _load)
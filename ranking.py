@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+RESULT RANKING
+
+Sorting by price alone puts a $9 phone case above the phone. rank()
+scores a whole result set in one NumPy pass from:
+
+- relevance: share of the query's words in the title, minus accessory
+  words ("case", "charger", ...) the query didn't ask for
+- price: USD price_value, log-scaled between the cheapest and dearest
+  offer of the best-matching titles (cheaper is better)
+- outliers: prices outside the IQR fences of those same offers
+  (RANK_OUTLIER_IQR, on log prices) - accessories, parts and bundles
+  priced nothing like the product itself
+- store: trust weight per store (RANK_STORE_WEIGHTS)
+
+and returns the order of the results, priced ones first. The filters in
+search_script.filter_results slice that one order; it stays well under a
+millisecond for a few hundred results (benchmarks/bench_ranking.py).
+"""
+
+import numpy as np
+from query_normalizer import tokenize
+from config import (
+    RANK_WEIGHT_PRICE, RANK_WEIGHT_RELEVANCE, RANK_WEIGHT_STORE, RANK_OUTLIER_PENALTY,
+    RANK_OUTLIER_IQR, RANK_STORE_WEIGHTS, RANK_DEFAULT_STORE_WEIGHT
+)
+
+NO_PRICE = 999999
+
+# Title words that mark an accessory unless the query has them too
+_ACCESSORY_WORDS = frozenset({
+    "case", "cover", "charger", "cable", "adapter", "protector", "strap", "band", "skin",
+    "sticker", "holder", "stand", "mount", "sleeve", "pouch", "remote", "replacement", "compatible"
+})
+
+# Quartiles need a few prices; fewer use the median as both
+_MIN_PRICES_FOR_QUARTILES = 4
+# Fences are at least 3x the price away (log scale), so a tight cluster of
+# offers doesn't turn ordinary price differences into outliers
+_MIN_FENCE = np.log(3)
+# Titles this close to the best relevance set the price scale
+_MATCH_MARGIN = 0.25
+
+def _relevance(results: list, query: str) -> np.ndarray:
+    words = frozenset(tokenize(query))
+    extra = _ACCESSORY_WORDS - words
+    if not words:
+        return np.zeros(len(results))
+    # tokenize is cached, so a re-rank of the same results costs set lookups only
+    titles = [frozenset(tokenize(r["title"])) for r in results]
+    overlap = np.fromiter((len(words & t) for t in titles), float, len(titles))
+    accessory = np.fromiter((not extra.isdisjoint(t) for t in titles), float, len(titles))
+    return overlap / len(words) - 0.5 * accessory
+
+def score(results: list, query: str) -> tuple:
+    """
+    Scores of the results (higher is better), which ones have a price and
+    which are the product itself (priced, among the best title matches and
+    not a price outlier)
+
+    Returns:
+        (scores, priced, product) - float and bool arrays, one entry per result
+    """
+    n = len(results)
+    prices = np.fromiter((r["price_value"] for r in results), float, n)
+    trust = np.fromiter(
+        (RANK_STORE_WEIGHTS.get(r["site"].lower(), RANK_DEFAULT_STORE_WEIGHT) for r in results), float, n
+    )
+    priced = prices < NO_PRICE
+    relevance = _relevance(results, query)
+
+    cheapness = np.zeros(n)
+    outlier = np.zeros(n, dtype=bool)
+    matches = np.zeros(n, dtype=bool)
+    if priced.any():
+        log_prices = np.log1p(np.where(priced, prices, 0))
+        # Price statistics come from the product itself, not from the
+        # accessories that may outnumber it
+        matches = priced & (relevance >= relevance[priced].max() - _MATCH_MARGIN)
+        reference = np.sort(log_prices[matches])
+        # Quantiles by interpolation (np.percentile costs more than the rest of the pass)
+        quantiles = [0.25, 0.75] if len(reference) >= _MIN_PRICES_FOR_QUARTILES else [0.5, 0.5]
+        q1, q3 = np.interp(quantiles, np.linspace(0, 1, len(reference)), reference)
+        spread = max(RANK_OUTLIER_IQR * (q3 - q1), _MIN_FENCE)
+        outlier = priced & ((log_prices < q1 - spread) | (log_prices > q3 + spread))
+        inliers = reference[(reference >= q1 - spread) & (reference <= q3 + spread)]
+        low, high = inliers[0], inliers[-1]
+        if high > low:
+            cheapness = np.where(priced, np.clip((high - log_prices) / (high - low), 0, 1), 0)
+        else:
+            cheapness = priced.astype(float)
+
+    scores = (
+        RANK_WEIGHT_PRICE * cheapness
+        + RANK_WEIGHT_RELEVANCE * relevance
+        + RANK_WEIGHT_STORE * trust
+        - RANK_OUTLIER_PENALTY * outlier
+    )
+    return scores, priced, matches & ~outlier
+
+def rank(results: list, query: str) -> np.ndarray:
+    """Indices of results from best to worst - priced results first, then by score"""
+    if not results:
+        return np.empty(0, dtype=np.intp)
+    scores, priced, _ = score(results, query)
+    # lexsort sorts by the last key first; both keys ascending
+    return np.lexsort((-scores, ~priced))
+
+def reference_offer(results: list, query: str):
+    """
+    The offer that stands for the product - the best-ranked priced result
+    that matches the query and isn't a price outlier (not the cheapest
+    case or cable among the results). None without prices.
+    """
+    if not results:
+        return None
+    scores, priced, product = score(results, query)
+    if not product.any():
+        return None
+    order = np.lexsort((-scores, ~product))
+    return results[order[0]]
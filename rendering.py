@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+MESSAGE RENDERING
+
+Result pages are built from precompiled templates in a single join, with
+Markdown escaping of user/store supplied text and Telegram's message
+length limit enforced (products that do not fit are counted in the
+"...and N more" line instead of breaking the send).
+"""
+
+import time
+
+# Telegram rejects messages longer than this (telegram.constants.MessageLimit.MAX_TEXT_LENGTH)
+MAX_MESSAGE_LENGTH = 4096
+
+# Characters with special meaning in Telegram's legacy Markdown
+_MARKDOWN_ESCAPES = str.maketrans({"_": "\\_", "*": "\\*", "`": "\\`", "[": "\\["})
+_URL_ESCAPES = str.maketrans({")": "%29", " ": "%20"})
+
+def escape_markdown(text) -> str:
+    """Escape text for parse_mode="Markdown" """
+    return str(text).translate(_MARKDOWN_ESCAPES)
+
+def escape_url(url: str) -> str:
+    """Make a URL safe inside a Markdown [label](url) link"""
+    return str(url).translate(_URL_ESCAPES)
+
+def format_age(seconds: float) -> str:
+    """Short age for result marks: 45m, 5h, 3d"""
+    if seconds < 3600:
+        return f"{max(1, int(seconds // 60))}m"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)}h"
+    return f"{int(seconds // 86400)}d"
+
+def format_trend(product: dict) -> str:
+    """Price history mark (fields set by price_history.annotate)"""
+    if product.get('lowest_days'):
+        return f" 📉 _lowest in {product['lowest_days']} days_"
+    trend = product.get('trend')
+    if trend:
+        return " 🔻" if trend < 0 else " 🔺"
+    return ""
+
+class ResultTemplate:
+    """
+    Precompiled layout of a search results page
+
+    Args:
+        item: format string for one product, with {i}, {site}, {title},
+            {price}, {trend}, {link} and {age} fields
+        more: format string for the overflow line, with a {count} field
+        footer: text appended after the products
+        title_width: product titles are cut to this many characters
+        stale_after: products last seen longer ago than this many seconds
+            get age_mark in {age} (empty otherwise)
+        age_mark: format string for {age}, with an {age} field
+    """
+
+    def __init__(self, item: str, more: str, footer: str, title_width: int = 55,
+                 stale_after: float = None, age_mark: str = " 🕒 _{age} ago_"):
+        self.item = item
+        self.more = more
+        self.footer = footer
+        self.title_width = title_width
+        self.stale_after = stale_after
+        self.age_mark = age_mark
+        # Room for the overflow line with a 4-digit count
+        self._more_reserve = len(more.format(count=9999))
+
+    def render_item(self, i: int, product: dict, now: float = None) -> str:
+        age = ""
+        seen_at = product.get('seen_at')
+        if self.stale_after is not None and seen_at:
+            elapsed = (now or time.time()) - seen_at
+            if elapsed > self.stale_after:
+                age = self.age_mark.format(age=format_age(elapsed))
+        return self.item.format(
+            i=i,
+            site=escape_markdown(product['site']),
+            title=escape_markdown(product['title'][:self.title_width]),
+            price=escape_markdown(product['price']),
+            trend=format_trend(product),
+            link=escape_url(product['link']),
+            age=age
+        )
+
+    def render(self, header: str, products: list, limit: int = 10, footer: str = None) -> str:
+        """
+        Build the page: header, up to limit products, overflow line, footer.
+
+        header is used as is - escape any user text in it with escape_markdown().
+        """
+        footer = self.footer if footer is None else footer
+        budget = MAX_MESSAGE_LENGTH - len(header) - len(footer) - self._more_reserve
+
+        now = time.time()
+        parts = [header]
+        shown = 0
+        for i, product in enumerate(products[:limit], 1):
+            piece = self.render_item(i, product, now)
+            if len(piece) > budget:
+                break
+            parts.append(piece)
+            budget -= len(piece)
+            shown += 1
+
+        hidden = len(products) - shown
+        if hidden > 0:
+            parts.append(self.more.format(count=hidden))
+        parts.append(footer)
+        return "".join(parts)
@@ -2,11 +2,53 @@
 # -*- coding: utf-8 -*-
 import requests
 import logging
+import time
 import re
-from config import GOOGLE_API_KEYS
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import snapshot
+import product_index
+import query_planner
+import quota_budget
+import price_history
+import storefronts
+import ranking
+from providers import (
+    SearchProvider, DuckDuckGoProvider, LatencyTracker, ProviderError, QuotaExceeded,
+    Cancelled, CircuitOpen, QueryRejected, hedged_search
+)
+from circuit_breaker import CircuitBreaker, CLOSED, adaptive_timeout
+from query_normalizer import query_key
+from product_identity import clean_link, dedupe
+from config import (
+    GOOGLE_API_KEYS, CSE_FIELDS, CSE_USER_AGENT, PRODUCT_INDEX_MIN_RESULTS, PRODUCT_INDEX_MAX_AGE,
+    PRODUCT_INDEX_RETENTION, QUOTA_CACHE_MAX_AGE, PLANNER_MAX_RESULTS, SWR_REFRESH_ATTEMPTS, SWR_REFRESH_DELAY,
+    BROWSER_ENABLED
+)
+
+CSE_URL = "https://www.googleapis.com/customsearch/v1"
 
-logging.basicConfig(level=logging.INFO)
 current_api_index = 0
+# Searches run on many threads at once (executor, hedging, refreshes)
+_api_index_lock = threading.Lock()
+
+# One breaker per API key, and the latency of single CSE requests for timeouts
+_key_breakers = {api['name']: CircuitBreaker(f"google:{api['name']}") for api in GOOGLE_API_KEYS}
+_request_latency = LatencyTracker()
+
+def _restore_state(state):
+    global current_api_index
+    with _api_index_lock:
+        current_api_index = state.get("current_api_index", 0) % len(GOOGLE_API_KEYS)
+
+def _rotate_api_key(failed_index):
+    """Move on from a failing key - once, even if several searches saw it fail"""
+    global current_api_index
+    with _api_index_lock:
+        if current_api_index == failed_index:
+            current_api_index = (failed_index + 1) % len(GOOGLE_API_KEYS)
+
+snapshot.register("search_script", lambda: {"current_api_index": current_api_index}, _restore_state)
 
 def extract_site_name(url):
     try:
@@ -34,19 +76,33 @@ def extract_price_value(price_str):
             return 999999
     return 999999
 
-def _make_search_request(query, sites, max_results, api_config):
+_http = threading.local()
+
+def _cse_session():
+    """One keep-alive session per thread, asking Google for gzip responses"""
+    session = getattr(_http, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Google APIs only compress when the User-Agent also mentions gzip
+        session.headers.update({"Accept-Encoding": "gzip", "User-Agent": CSE_USER_AGENT})
+        _http.session = session
+    return session
+
+def _make_search_request(query, sites, max_results, api_config, timeout=15):
     try:
-        url = "https://www.googleapis.com/customsearch/v1"
         site_filter = " OR ".join([f"site:{s}" for s in sites])
         params = {
             'key': api_config['api_key'],
             'cx': api_config['search_engine_id'],
             'q': f"{query} ({site_filter})",
-            'num': max_results
+            'num': max_results,
+            # Only what _parse_search_items reads - no pagemap, metatags or images
+            'fields': CSE_FIELDS
         }
-        response = requests.get(url, params=params, timeout=15)
+        response = _cse_session().get(CSE_URL, params=params, timeout=timeout)
         return response
-    except:
+    except requests.RequestException as e:
+        logging.warning(f"[{api_config['name']}] request failed: {e}")
         return None
 
 def _parse_search_items(items):
@@ -90,78 +146,334 @@ def _parse_search_items(items):
             results.append({
                 "site": site_name,
                 "title": title[:150],
-                "link": link,
+                "link": clean_link(link),
                 "price": price,
                 "price_value": extract_price_value(price)
             })
         except:
             continue
-    return results
+    return dedupe(results)
 
-def _search_with_failover(query, sites, max_results):
-    global current_api_index
+def _google_search(query, sites, max_results, cancelled=None):
+    """
+    Google CSE search with API key failover
+    
+    Keys whose circuit breaker is open are skipped without a request.
+    Raises QuotaExceeded when every key answered 429, QueryRejected when
+    Google refused the request itself (e.g. 400), ProviderError when no
+    key answered at all.
+    """
+    quota_errors = 0
+    skipped = 0
+    with _api_index_lock:
+        first = current_api_index
     
     for attempt in range(len(GOOGLE_API_KEYS)):
-        api = GOOGLE_API_KEYS[current_api_index]
-        response = _make_search_request(query, sites, max_results, api)
+        if cancelled is not None and cancelled.is_set():
+            raise Cancelled("google")
         
-        if response and response.status_code == 200:
+        index = (first + attempt) % len(GOOGLE_API_KEYS)
+        api = GOOGLE_API_KEYS[index]
+        breaker = _key_breakers[api['name']]
+        
+        if not breaker.allow_request():
+            skipped += 1
+            _rotate_api_key(index)
+            continue
+        
+        quota_budget.spend()
+        start = time.monotonic()
+        response = _make_search_request(query, sites, max_results, api, timeout=adaptive_timeout(_request_latency))
+        
+        if response is not None and response.status_code == 200:
             try:
                 data = response.json()
-                if 'items' in data:
-                    results = _parse_search_items(data['items'])
-                    logging.info(f"[{api['name']}] {len(results)} products")
-                    return results
-            except:
-                pass
-        
-        if response and response.status_code == 429:
+                results = _parse_search_items(data.get('items', []))
+                _request_latency.record(time.monotonic() - start)
+                breaker.record_success()
+                logging.info(f"[{api['name']}] {len(results)} products")
+                return results
+            except ValueError:
+                breaker.record_failure()
+        elif response is not None and response.status_code == 429:
             logging.warning(f"[{api['name']}] quota exceeded")
+            breaker.trip()
+            quota_errors += 1
+        elif response is None or response.status_code >= 500 or response.status_code in (401, 403):
+            # Timeouts, Google's own errors and a bad key count against the key
+            breaker.record_failure()
+        else:
+            # Any other 4xx is about the request, which every key would reject too
+            breaker.release()
+            raise QueryRejected(f"google: request rejected ({response.status_code})")
         
-        current_api_index = (current_api_index + 1) % len(GOOGLE_API_KEYS)
+        _rotate_api_key(index)
     
-    return []
+    if skipped == len(GOOGLE_API_KEYS):
+        raise CircuitOpen("google: all API keys open")
+    if quota_errors == len(GOOGLE_API_KEYS) - skipped:
+        if skipped == 0:
+            quota_budget.mark_exhausted()
+        raise QuotaExceeded("google: all API keys exhausted")
+    raise ProviderError("google: no API key answered")
+
+class GoogleCSEProvider(SearchProvider):
+    """Primary backend: Google Custom Search over our API keys"""
+    
+    name = "google"
+    
+    def search(self, query, sites, max_results, cancelled=None):
+        results = _google_search(query, sites, max_results, cancelled)
+        slots = query_planner.current_slots()
+        if slots is not None:
+            query_planner.record(slots, results)
+        return results
+
+PRIMARY_PROVIDER = GoogleCSEProvider()
+SECONDARY_PROVIDER = DuckDuckGoProvider(_parse_search_items)
+
+def _search_upstream(query, sites, max_results, slots=None):
+    """hedged_search over both providers; slots: the plan's per-site slots when this call is from a plan"""
+    # hedged_search copies the context into its threads, planned() included
+    with query_planner.planned(slots):
+        return hedged_search(PRIMARY_PROVIDER, SECONDARY_PROVIDER, query, sites, max_results)
+
+# ============================================================================
+# STALE-WHILE-REVALIDATE
+# ============================================================================
+
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refresh")
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+def _last_known(query, sites, max_results):
+    """Index results of any age still kept (they carry seen_at for the age mark)"""
+    return product_index.search(query, sites, max_results, max_age=PRODUCT_INDEX_RETENTION)
+
+def _schedule_refresh(query, sites, max_results):
+    """Refresh a query in the background after serving stale results (once at a time)"""
+    key = (query_key(query), tuple(sorted(sites)))
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresh_pool.submit(_refresh, key, query, sites, max_results)
 
-def fetch_google_shopping(query, selected_site="all"):
+def _refresh(key, query, sites, max_results):
+    try:
+        for attempt in range(SWR_REFRESH_ATTEMPTS):
+            if attempt:
+                time.sleep(SWR_REFRESH_DELAY)
+            # Background refreshes only spend quota that is on pace
+            if quota_budget.level() >= quota_budget.CACHE_FIRST:
+                logging.info(f"[Refresh] Skipped '{query}' - quota ahead of pace")
+                return
+            try:
+                # timed_search raises CircuitOpen while the breaker is open
+                results = PRIMARY_PROVIDER.timed_search(query, sites, max_results)
+            except ProviderError as e:
+                logging.info(f"[Refresh] '{query}' attempt {attempt + 1}: {e}")
+                continue
+            _index_results(results, query, sites)
+            logging.info(f"[Refresh] '{query}' on {', '.join(sites)}: {len(results)} products")
+            return
+    except Exception as e:
+        logging.error(f"[Refresh] '{query}' failed: {e}")
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(key)
+
+def _index_results(results, query, sites):
+    """Keep upstream products in the local index and their prices in the history"""
+    if not results:
+        product_index.mark_fetched(query, sites)
+        return
+    product_index.add_results(results, query, sites)
+    price_history.record(results)
+
+# Why saved products were served instead of fresh ones (the served dict of fetch_google_shopping)
+SERVED_REFRESHING = "refreshing"     # upstream unhealthy or failing - a refresh was scheduled
+SERVED_QUOTA = "quota"               # the quota level let the index answer with older products
+
+def _search_sites(query, sites, max_results, level=quota_budget.NORMAL, served=None, slots=None):
+    """
+    Answer a site group from the local index when it has enough fresh
+    products, otherwise search upstream and index what comes back
+
+    When upstream is failing (primary breaker not closed or no provider
+    answered), the last known products are served instead and refreshed in
+    the background. An upstream answer without products is remembered like
+    one with products, so the query isn't searched again until it is stale.
+
+    The quota level (quota_budget) widens what the index may answer with:
+    week-old products in CACHE_FIRST, anything still stored in STALE, where
+    only the free secondary provider is asked on an index miss.
+
+    Args:
+        served: dict that gets "reason" (SERVED_REFRESHING or SERVED_QUOTA)
+            when saved products were served for one of those reasons
+        slots: result slots per site when this group is a call of the plan
+            (query_planner records its yield), None otherwise
+    """
+    if served is None:
+        served = {}
+    if level >= quota_budget.CACHE_FIRST:
+        max_age = PRODUCT_INDEX_RETENTION if level >= quota_budget.STALE else QUOTA_CACHE_MAX_AGE
+        local = product_index.search(query, sites, max_results, max_age=max_age)
+        if local:
+            logging.info(f"[Index] {len(local)} products for {', '.join(sites)} ({quota_budget.LEVEL_NAMES[level]})")
+            served.setdefault("reason", SERVED_QUOTA)
+            return local
+        if level >= quota_budget.STALE:
+            try:
+                results = SECONDARY_PROVIDER.timed_search(query, sites, max_results)
+            except ProviderError as e:
+                logging.warning(f"[{SECONDARY_PROVIDER.name}] {e}")
+                return []
+            _index_results(results, query, sites)
+            return results
+    else:
+        local = product_index.search(query, sites, max_results)
+        if len(local) >= min(max_results, PRODUCT_INDEX_MIN_RESULTS) or (
+                product_index.recently_fetched(query, sites) if local else product_index.recently_empty(query, sites)):
+            logging.info(f"[Index] {len(local)} products for {', '.join(sites)}")
+            return local
+        
+        # Don't make the user wait on an upstream we know is failing
+        if PRIMARY_PROVIDER.breaker.state != CLOSED:
+            stale = _last_known(query, sites, max_results)
+            if stale:
+                logging.info(f"[Index] {len(stale)} last known products for {', '.join(sites)} (upstream unhealthy)")
+                _schedule_refresh(query, sites, max_results)
+                served["reason"] = SERVED_REFRESHING
+                return stale
+    
+    results = _search_upstream(query, sites, max_results, slots)
+    if results is None:
+        stale = _last_known(query, sites, max_results)
+        if stale:
+            logging.info(f"[Index] {len(stale)} last known products for {', '.join(sites)} (upstream failed)")
+            _schedule_refresh(query, sites, max_results)
+            served["reason"] = SERVED_REFRESHING
+        return stale
+    _index_results(results, query, sites)
+    return results
+
+SITE_MAP = {
+    "amazon": ["amazon.com"],
+    "ebay": ["ebay.com"],
+    "walmart": ["walmart.com"],
+    "bestbuy": ["bestbuy.com"],
+    "etsy": ["etsy.com"],
+    "newegg": ["newegg.com"],
+    "umico": ["umico.az"]
+}
+
+def _site_groups(selected_site, level=quota_budget.NORMAL):
+    """
+    CSE calls for a site selection: [(sites, num, slots), ...] - slots are
+    the plan's result slots per site, None for calls outside the plan
+    """
+    if selected_site == "all":
+        # Search all sites, grouped by observed yield (query_planner) - or
+        # with a single call while the daily budget is running ahead of pace
+        if level >= quota_budget.COLLAPSE:
+            return [(query_planner.ALL_SITES, PLANNER_MAX_RESULTS, None)]
+        return query_planner.plan_groups(query_planner.ALL_SITES)
+    if selected_site in SITE_MAP:
+        # Search only selected site with more results
+        return [(SITE_MAP[selected_site], 10, None)]
+    # Custom site - treat as custom URL
+    return [([selected_site], 10, None)]
+
+def fetch_google_shopping(query, selected_site="all", user_id=None, served=None):
     """
     Search products from selected site(s)
     
     Args:
         query: Search query
         selected_site: Site to search from (all, amazon, ebay, walmart, bestbuy, etsy, newegg, umico, or custom URL)
+        user_id: Telegram user the quota is spent for (per-user budget)
+        served: dict filled with the quota "level" the search ran at and,
+            when saved products were served, the "reason" (SERVED_*)
+    
+    Products answered from the local index carry seen_at (see
+    served_from_index); fresh upstream ones don't.
     """
     all_results = []
+    level = quota_budget.level(user_id)
+    if served is None:
+        served = {}
+    served["level"] = level
     
-    site_map = {
-        "amazon": ["amazon.com"],
-        "ebay": ["ebay.com"],
-        "walmart": ["walmart.com"],
-        "bestbuy": ["bestbuy.com"],
-        "etsy": ["etsy.com"],
-        "newegg": ["newegg.com"],
-        "umico": ["umico.az"]
-    }
-    
-    if selected_site == "all":
-        # Search all sites
-        all_results.extend(_search_with_failover(query, ["amazon.com", "ebay.com"], 4))
-        all_results.extend(_search_with_failover(query, ["walmart.com", "bestbuy.com"], 3))
-        all_results.extend(_search_with_failover(query, ["etsy.com", "newegg.com"], 3))
-        all_results.extend(_search_with_failover(query, ["umico.az"], 4))
-    elif selected_site in site_map:
-        # Search only selected site with more results
-        all_results.extend(_search_with_failover(query, site_map[selected_site], 10))
-    else:
-        # Custom site - treat as custom URL
+    if selected_site != "all" and selected_site not in SITE_MAP:
         logging.info(f"[Google] Custom site search: {selected_site}")
-        all_results.extend(_search_with_failover(query, [selected_site], 10))
+        # Stores that render products with JavaScript are read in a browser
+        store = storefronts.store_for(selected_site) if BROWSER_ENABLED else None
+        if store:
+            all_results = storefronts.search(store, query)
+    
+    if not all_results:
+        # Only CSE requests count against the user's share, not index or DuckDuckGo answers
+        with quota_budget.charged_to(user_id):
+            for sites, num, slots in _site_groups(selected_site, level):
+                all_results.extend(_search_sites(query, sites, num, level, served, slots))
+    # Groups can overlap (custom sites, collapsed "all" searches, index answers)
+    all_results = dedupe(all_results)
+    price_history.annotate(all_results)
     
     logging.info(f"[Google] Site: {selected_site}, Total: {len(all_results)} products")
     return all_results
 
-def filter_results(results, filter_type="all"):
+def served_from_index(results, older_than=PRODUCT_INDEX_MAX_AGE) -> bool:
+    """Whether any of the results are saved products older than older_than seconds"""
+    now = time.time()
+    return any(now - r["seen_at"] > older_than for r in results if "seen_at" in r)
+
+def prewarm_query(query, selected_site="all", skip_age=0) -> int:
+    """
+    Refresh a query in the local index straight from the primary provider
+    
+    Site groups searched upstream within skip_age seconds are left alone.
+    Returns the number of upstream searches made. Raises QuotaExceeded or
+    CircuitOpen when the primary provider can't be used.
+    """
+    calls = 0
+    for sites, num, _ in _site_groups(selected_site):
+        if skip_age and product_index.recently_fetched(query, sites, max_age=skip_age):
+            continue
+        results = PRIMARY_PROVIDER.timed_search(query, sites, num)
+        _index_results(results, query, sites)
+        calls += 1
+    return calls
+
+def refresh_results(query, selected_site="all", max_age=PRODUCT_INDEX_MAX_AGE) -> list:
+    """
+    Products for a query no older than max_age - from the index when the
+    query was fetched within max_age, otherwise refreshed upstream first
+    (primary provider only; raises like prewarm_query)
+    """
+    prewarm_query(query, selected_site, skip_age=max_age)
+    results = []
+    for sites, num, _ in _site_groups(selected_site):
+        results.extend(product_index.search(query, sites, num, max_age=max_age))
+    return results
+
+def filter_results(results, filter_type="all", query=None):
+    """
+    Results for a filter button. With the search query the "cheapest"
+    filters use ranking.rank (price, relevance, store, outliers) instead
+    of the bare price order.
+    """
     if not results:
         return []
+    if query and filter_type in ("cheapest", "top3_cheap", "top5_cheap"):
+        order = ranking.rank(results, query)
+        if filter_type == "top3_cheap":
+            order = order[:3]
+        elif filter_type == "top5_cheap":
+            order = order[:5]
+        return [results[i] for i in order]
     if filter_type == "cheapest":
         return sorted(results, key=lambda x: x['price_value'])
     elif filter_type == "expensive":
@@ -172,8 +484,8 @@ def filter_results(results, filter_type="all"):
         return sorted(results, key=lambda x: x['price_value'])[:5]
     return results
 
-def fetch_amazon(query, selected_site="all"):
-    return fetch_google_shopping(query, selected_site)
+def fetch_amazon(query, selected_site="all", user_id=None, served=None):
+    return fetch_google_shopping(query, selected_site, user_id, served)
 
 def fetch_ebay(query):
     return []
@@ -185,10 +497,10 @@ def fetch_etsy(query):
     return []
 
 def fetch_trendyol(query):
-    return []
+    return storefronts.search("trendyol", query) if BROWSER_ENABLED else []
 
 def fetch_aliexpress(query):
-    return []
+    return storefronts.search("aliexpress", query) if BROWSER_ENABLED else []
 
 def fetch_target(query):
-    return []
+    return storefronts.search("target", query) if BROWSER_ENABLED else []
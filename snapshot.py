@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+WARM-START SNAPSHOTS
+
+Modules register their hot in-memory state (API key position, caches,
+users' last results, ...) with register(). save_snapshot() writes all of
+it to one compressed local file, restore_snapshot() loads it on boot so a
+restart or deploy comes back with warm caches.
+
+Periodic saves run in an executor thread. State that only the event loop
+changes (registered with on_loop=True, like the bot's user_data) has no
+lock, so it is copied on the loop first and only the copy goes to the
+thread.
+"""
+
+import os
+import time
+import zlib
+import pickle
+import asyncio
+import logging
+import threading
+from config import SNAPSHOT_PATH, SNAPSHOT_INTERVAL, SNAPSHOT_MAX_AGE
+
+SNAPSHOT_VERSION = 1
+
+# name -> (dump, load, on_loop). dump() returns picklable state, load(state) applies it.
+_providers = {}
+_save_lock = threading.Lock()
+
+def register(name: str, dump, load, on_loop: bool = False):
+    """
+    Register a piece of state to be included in snapshots. With on_loop
+    dump() is only called on the event loop.
+    """
+    _providers[name] = (dump, load, on_loop)
+
+def _dump(on_loop: bool) -> dict:
+    state = {}
+    for name, (dump, _, loop_only) in list(_providers.items()):
+        if loop_only != on_loop:
+            continue
+        try:
+            state[name] = dump()
+        except Exception as e:
+            logging.error(f"[Snapshot] Failed to dump '{name}': {e}")
+    return state
+
+def dump_loop_state() -> dict:
+    """Copies of the on_loop state - call on the event loop, pass to save_snapshot()"""
+    return _dump(on_loop=True)
+
+def save_snapshot(path: str = SNAPSHOT_PATH, loop_state: dict = None) -> int:
+    """
+    Write all registered state to path atomically. Returns the file size in bytes.
+
+    Args:
+        loop_state: dump_loop_state() taken on the event loop; without it
+            (called on the loop itself) the on_loop state is dumped here
+    """
+    state = _dump(on_loop=False)
+    state.update(dump_loop_state() if loop_state is None else loop_state)
+
+    payload = zlib.compress(pickle.dumps({
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "state": state
+    }, protocol=pickle.HIGHEST_PROTOCOL), 6)
+
+    with _save_lock:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    return len(payload)
+
+def restore_snapshot(path: str = SNAPSHOT_PATH, max_age: float = SNAPSHOT_MAX_AGE) -> bool:
+    """Load state saved by save_snapshot() into the registered modules"""
+    try:
+        with open(path, "rb") as f:
+            data = pickle.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logging.error(f"[Snapshot] Could not read {path}: {e}")
+        return False
+
+    if data.get("version") != SNAPSHOT_VERSION:
+        logging.info(f"[Snapshot] Ignoring snapshot version {data.get('version')}")
+        return False
+
+    age = time.time() - data.get("saved_at", 0)
+    if age > max_age:
+        logging.info(f"[Snapshot] Ignoring snapshot from {age / 60:.0f} minutes ago")
+        return False
+
+    for name, value in data.get("state", {}).items():
+        if name not in _providers:
+            continue
+        try:
+            _providers[name][1](value)
+        except Exception as e:
+            logging.error(f"[Snapshot] Failed to restore '{name}': {e}")
+
+    logging.info(f"♻️ Restored snapshot from {age:.0f}s ago ({len(data.get('state', {}))} sections)")
+    return True
+
+async def run_snapshot_saver(interval: float = SNAPSHOT_INTERVAL):
+    """Background loop: save a snapshot every interval seconds"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, save_snapshot, SNAPSHOT_PATH, dump_loop_state())
+        except Exception as e:
+            logging.error(f"[Snapshot] Periodic save failed: {e}")
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+JAVASCRIPT STOREFRONTS
+
+Search pages of stores that only render products in the browser
+(Trendyol, AliExpress, Target), read through the warm headless browsers
+in browser_pool. Results go into the local product index like upstream
+search results, so a repeated query is answered without a browser.
+
+Store layouts change - each store is a handful of CSS selectors in
+STOREFRONTS, checked against fixtures/storefronts by
+benchmarks/bench_browser_pool.py.
+"""
+
+import re
+import logging
+from urllib.parse import quote, quote_plus, urljoin
+from bs4 import BeautifulSoup
+import product_index
+import price_history
+import browser_pool
+from browser_pool import BrowserUnavailable
+from product_identity import clean_link, dedupe
+from config import PRODUCT_INDEX_MAX_AGE
+
+STOREFRONTS = {
+    "trendyol": {
+        "domain": "trendyol.com",
+        "name": "Trendyol",
+        "search_url": "https://www.trendyol.com/sr?q={query}",
+        "ready": "div.p-card-wrppr",
+        "card": "div.p-card-wrppr",
+        "link": "a[href]",
+        "title": ".prdct-desc-cntnr",   # brand + name
+        "price": ".prc-box-dscntd, .price-item",
+        "currency": "TL",
+        "usd_rate": 0.024,   # 1 TL ≈ 0.024 USD, for sorting against other stores
+        "decimal_comma": True
+    },
+    "aliexpress": {
+        "domain": "aliexpress.com",
+        "name": "AliExpress",
+        "search_url": "https://www.aliexpress.com/w/wholesale-{slug}.html",
+        "ready": "a[href*='/item/']",
+        "card": "a[href*='/item/']",
+        "link": None,        # the card is the link
+        "title": "h3, [class*='titleText']",
+        "price": "[class*='price-sale'], [class*='price--current']",
+        "currency": "$",
+        "usd_rate": 1,
+        "decimal_comma": False
+    },
+    "target": {
+        "domain": "target.com",
+        "name": "Target",
+        "search_url": "https://www.target.com/s?searchTerm={query}",
+        "ready": "[data-test='product-title']",
+        "card": "[data-test='@web/site-top-of-funnel/ProductCardWrapper']",
+        "link": "a[data-test='product-title']",
+        "title": "a[data-test='product-title']",
+        "price": "[data-test='current-price']",
+        "currency": "$",
+        "usd_rate": 1,
+        "decimal_comma": False
+    }
+}
+
+_NUMBER_RE = re.compile(r"\d[\d.,]*")
+
+def store_for(site: str):
+    """Store key of a custom site ("trendyol.com" -> "trendyol"), or None"""
+    for key, store in STOREFRONTS.items():
+        if site == store["domain"] or site.endswith(f".{store['domain']}"):
+            return key
+    return None
+
+def _parse_number(text: str, decimal_comma: bool):
+    """First number in a price text: "1.299,99 TL" / "US $1,299.99" -> 1299.99"""
+    m = _NUMBER_RE.search(text)
+    if not m:
+        return None
+    number = m.group(0).rstrip(".,")
+    if decimal_comma:
+        number = number.replace(".", "").replace(",", ".")
+    else:
+        number = number.replace(",", "")
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+def _format_price(value: float, store: dict) -> str:
+    if store["currency"] == "$":
+        return f"${value:.2f}"
+    return f"{value:.2f} {store['currency']}"
+
+def parse_results(key: str, html, base_url: str = None) -> list:
+    """Products on a rendered search page of a store"""
+    store = STOREFRONTS[key]
+    base_url = base_url or f"https://www.{store['domain']}/"
+    soup = BeautifulSoup(html, "lxml")
+    results = []
+    for card in soup.select(store["card"]):
+        anchor = card.select_one(store["link"]) if store["link"] else card
+        title_tag = card.select_one(store["title"])
+        if anchor is None or title_tag is None or not anchor.get("href"):
+            continue
+        title = " ".join(title_tag.get_text(" ").split())
+        if len(title) < 5:
+            continue
+
+        price, price_value = "Check site", 999999
+        price_tag = card.select_one(store["price"])
+        value = _parse_number(price_tag.get_text(""), store["decimal_comma"]) if price_tag else None
+        if value:
+            price, price_value = _format_price(value, store), value * store["usd_rate"]
+
+        results.append({
+            "site": store["name"],
+            "title": title[:150],
+            "link": clean_link(urljoin(base_url, anchor["href"])),
+            "price": price,
+            "price_value": price_value
+        })
+    return dedupe(results)
+
+def search(key: str, query: str, max_results: int = 10, search_url: str = None,
+           max_age: float = PRODUCT_INDEX_MAX_AGE) -> list:
+    """
+    Products for a query from a store's own search page
+
+    Args:
+        key: store in STOREFRONTS
+        query: Search query
+        max_results: Max products to return
+        search_url: override of the store's search URL template (local test pages)
+        max_age: index products of a search rendered within this many seconds are reused
+    """
+    store = STOREFRONTS[key]
+    sites = [store["domain"]]
+    if search_url is None and product_index.recently_fetched(query, sites, max_age):
+        local = product_index.search(query, sites, max_results, max_age=max_age)
+        if local:
+            logging.info(f"[Index] {len(local)} products for {store['domain']}")
+            return local
+
+    url = (search_url or store["search_url"]).format(
+        query=quote_plus(query), slug=quote("-".join(query.split()))
+    )
+    try:
+        html = browser_pool.pool.render(url, store["ready"])
+    except BrowserUnavailable as e:
+        logging.warning(f"[{store['name']}] No browser: {e}")
+        return []
+    except Exception as e:
+        logging.warning(f"[{store['name']}] Page failed: {e!r}")
+        return []
+
+    results = parse_results(key, html, url)[:max_results]
+    logging.info(f"[{store['name']}] {len(results)} products for '{query}'")
+    if results and search_url is None:
+        product_index.add_results(results, query, sites)
+        price_history.record(results)
+    return results